@@ -95,7 +95,7 @@ project = Bunch(
             "mktor = pyrocore.scripts.mktor:run",
             "pyroadmin = pyrocore.scripts.pyroadmin:run",
             "rtcontrol = pyrocore.scripts.rtcontrol:run",
-            "rtevent = pyrocore.scripts.rtevent:run",
+            "rtevent = pyrocore.daemon.events:run",
             "rtmv = pyrocore.scripts.rtmv:run",
             "rtsweep = pyrocore.scripts.rtsweep:run",
             "rtxmlrpc = pyrocore.scripts.rtxmlrpc:run",
@@ -126,6 +126,7 @@ project = Bunch(
         "http": ['requests'],
         "https": ['requests[security]'],
         "repl": ['prompt-toolkit'],
+        "scandir": ['scandir>=1.5'],
     },
 
     # tests
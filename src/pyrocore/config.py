@@ -61,6 +61,9 @@ def map_announce2alias(url):
 # Remember predefined names
 _PREDEFINED = tuple(_ for _ in globals() if not _.startswith('_'))
 
+# Cached configuration data of the current config loader
+_snapshot = None
+
 # Set some defaults to shut up pydev / pylint;
 # these later get overwritten by loading the config
 debug = False
@@ -78,6 +81,7 @@ xmlrpc = {}
 output_header_ecma48 = ""
 output_header_frequency = 1
 waif_pattern_list = []
+hashing_rate_limit = 0
 traits_by_alias = {}
 torque = {}
 magnet_watch = None
@@ -0,0 +1,342 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Resident rTorrent event dispatcher.
+
+    rTorrent event hooks call ``rtevent``, which just sends the event
+    to a resident dispatcher over a Unix datagram socket, if one is running.
+    The dispatcher (a ``pyrotorque`` job, or ``rtevent --serve``) runs
+    the configured handlers in-process, using a warm engine connection.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+"""
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import time
+import errno
+import socket
+import logging
+import asyncore
+import threading
+from collections import OrderedDict
+
+
+# Environment variable with the socket path; set to an empty value to disable forwarding
+SOCKET_ENV = "PYRO_RTEVENT_SOCKET"
+
+# Prefix of the configuration keys mapping event names to handlers
+HANDLER_PREFIX = "on."
+
+
+def socket_path(path=None):
+    """ Return path of the dispatcher socket, as given, in the environment,
+        or else in the configuration directory.
+    """
+    if path:
+        return os.path.expanduser(path)
+    if os.environ.get(SOCKET_ENV, None):
+        return os.path.expanduser(os.environ[SOCKET_ENV])
+
+    config_dir = os.environ.get("PYRO_CONFIG_DIR", None) or "~/.pyroscope"
+    return os.path.join(os.path.expanduser(config_dir), "run", "rtevent.sock")
+
+
+def forward(argv):
+    """ Send an event given on the command line to the resident dispatcher.
+
+        @return: C{True} if the event was accepted, C{False} when it has to be handled directly.
+    """
+    if not os.environ.get(SOCKET_ENV, True):
+        return False  # explicitly disabled
+    if len(argv) < 2 or any(arg.startswith('-') for arg in argv):
+        return False  # usage errors and options are handled by the full command
+
+    message = json.dumps(dict(event=argv[0], infohash=argv[1], args=argv[2:]))
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.sendto(message, socket_path())
+    except socket.error:
+        return False
+    finally:
+        sock.close()
+
+    return True
+
+
+def log_event(engine, event):
+    """ Event handler that just logs the event.
+    """
+    logging.getLogger(__name__).info("%s event for %s (%d times) %r" % (
+        event.name, event.infohash, event.count, event.args))
+
+
+def resolve_handlers(params):
+    """ Return a mapping of event names to lists of handler callables,
+        from the C{on.EVENT} keys in the given parameter dict.
+    """
+    from pyrocore import error
+    from pyrocore.util import pymagic
+
+    handlers = {}
+    for key, val in params.items():
+        if not key.startswith(HANDLER_PREFIX):
+            continue
+        name = key[len(HANDLER_PREFIX):]
+        for spec in str(val).replace(',', ' ').split():
+            try:
+                handlers.setdefault(name, []).append(pymagic.import_name(spec))
+            except (ImportError, AttributeError) as exc:
+                raise error.UserError("Bad handler name '%s' for event '%s':\n    %s" % (spec, name, exc))
+
+    return handlers
+
+
+class Event(object):
+    """ A (possibly coalesced) rTorrent event.
+    """
+
+    def __init__(self, name, infohash, args=()):
+        "Initialize event"
+        self.name = name
+        self.infohash = infohash
+        self.args = list(args)
+        self.count = 1
+        self.received = time.time()
+
+
+    def __repr__(self):
+        return "Event(%r, %r, %r, count=%d)" % (self.name, self.infohash, self.args, self.count)
+
+
+class EventQueue(object):
+    """ Thread-safe work queue that coalesces repeated events for the same item.
+    """
+
+    def __init__(self):
+        "Initialize empty queue"
+        self.pending = OrderedDict()
+        self.cond = threading.Condition()
+        self.received = 0
+        self.coalesced = 0
+
+
+    def __len__(self):
+        return len(self.pending)
+
+
+    def put(self, name, infohash, args=()):
+        """ Add an event, merging it with a pending one for the same event and item.
+
+            @return: C{True} for a new entry, C{False} if it was coalesced.
+        """
+        key = (name, infohash.upper())
+        with self.cond:
+            self.received += 1
+            event = self.pending.get(key, None)
+            if event is None:
+                self.pending[key] = Event(name, key[1], args)
+            else:
+                event.count += 1
+                event.args = list(args)
+                self.coalesced += 1
+            self.cond.notify()
+
+        return event is None
+
+
+    def take(self, timeout=None, settle=0):
+        """ Wait up to C{timeout} seconds for events, then give a burst
+            C{settle} seconds to arrive, and return all pending events.
+        """
+        with self.cond:
+            if not self.pending:
+                self.cond.wait(timeout)
+            if self.pending and settle:
+                deadline = time.time() + settle
+                while time.time() < deadline:
+                    self.cond.wait(deadline - time.time())
+            events, self.pending = self.pending.values(), OrderedDict()
+
+        return events
+
+
+class EventReceiver(asyncore.dispatcher):
+    """ Receive events sent by L{forward} on a Unix datagram socket.
+    """
+
+    def __init__(self, path, queue, sock_map=None):
+        """ Bind to the given socket path, replacing a stale one.
+        """
+        asyncore.dispatcher.__init__(self, map=sock_map)
+        self.LOG = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.path = path
+        self.queue = queue
+
+        if os.path.exists(path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            try:
+                probe.connect(path)
+            except socket.error:
+                self.LOG.debug("Removing stale socket %r" % (path,))
+                os.remove(path)
+            else:
+                raise socket.error(errno.EADDRINUSE, "Event dispatcher already running on %s" % (path,))
+            finally:
+                probe.close()
+
+        self.create_socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        old_umask = os.umask(0o077)
+        try:
+            self.bind(path)
+        finally:
+            os.umask(old_umask)
+
+        # Handler commands must not send events back to this process
+        os.environ[SOCKET_ENV] = ''
+
+
+    def writable(self):
+        "We never write"
+        return False
+
+
+    def handle_read(self):
+        "Queue a received event"
+        data = self.recv(65536)
+        try:
+            message = json.loads(data)
+            self.queue.put(message["event"], message["infohash"], message.get("args", ()))
+        except (ValueError, KeyError, TypeError, AttributeError) as exc:
+            self.LOG.warn("Ignoring malformed event %r (%s)" % (data[:200], exc))
+
+
+    def handle_close(self):
+        "Remove the socket"
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class EventDispatcher(object):
+    """ Run handlers for queued events in a worker thread.
+    """
+
+    def __init__(self, handlers, engine=None, settle=0.5, dry_run=False):
+        """ Set up dispatcher for the given C{{name: [callable, ...]}} mapping.
+        """
+        self.LOG = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.handlers = handlers
+        self.engine = engine
+        self.settle = settle
+        self.dry_run = dry_run
+        self.queue = EventQueue()
+        self.handled = 0
+        self.failed = 0
+        self.thread = None
+        self.stopping = False
+
+
+    def dispatch(self, event):
+        """ Run all handlers for a single event.
+        """
+        handlers = self.handlers.get(event.name, ())
+        if not handlers:
+            self.LOG.debug("No handlers for %r" % (event,))
+        for handler in handlers:
+            if self.dry_run:
+                self.LOG.info("WOULD call %s for %r" % (handler.__name__, event))
+                continue
+            try:
+                handler(self.engine, event)
+            except Exception as exc:  # pylint: disable=broad-except
+                self.failed += 1
+                self.LOG.exception("Handler %s failed for %r (%s)" % (handler.__name__, event, exc))
+            else:
+                self.handled += 1
+
+
+    def work(self):
+        """ Worker thread loop.
+        """
+        while not self.stopping:
+            for event in self.queue.take(timeout=1.0, settle=self.settle):
+                self.dispatch(event)
+
+
+    def start(self):
+        """ Start the worker thread.
+        """
+        self.thread = threading.Thread(target=self.work, name="rtevent-dispatcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+
+    def stop(self):
+        """ Let the worker thread finish pending events, and wait for it.
+        """
+        self.stopping = True
+        if self.thread:
+            self.thread.join()
+            self.thread = None
+        for event in self.queue.take():
+            self.dispatch(event)
+
+
+class EventDaemon(object):
+    """ ``pyrotorque`` job hosting the resident event dispatcher.
+    """
+
+    def __init__(self, config=None):
+        """ Set up receiver and dispatcher.
+        """
+        from pyrobase.parts import Bunch
+        from pyrocore import config as config_ini
+        from pyrocore.util import pymagic
+
+        self.config = config or Bunch()
+        self.LOG = pymagic.get_class_logger(self)
+        if 'log_level' in self.config:
+            self.LOG.setLevel(self.config.log_level)
+        self.LOG.debug("Event dispatcher created with config %r" % self.config)
+
+        self.dispatcher = EventDispatcher(resolve_handlers(self.config), engine=config_ini.engine,
+            settle=float(self.config.get("settle", "0.5")), dry_run=self.config.get("dry_run", False))
+        self.receiver = None
+
+        if self.config.get("active", False):
+            config_ini.engine.open()
+            self.receiver = EventReceiver(socket_path(self.config.get("socket")), self.dispatcher.queue)
+            self.dispatcher.start()
+            self.LOG.info("Receiving events on %s" % (self.receiver.path,))
+
+
+    def run(self):
+        """ Regular statistics logging.
+        """
+        queue = self.dispatcher.queue
+        self.LOG.debug("%d events received, %d coalesced, %d pending, %d handled, %d failed" % (
+            queue.received, queue.coalesced, len(queue), self.dispatcher.handled, self.dispatcher.failed))
+
+
+def run(): #pragma: no cover
+    """ The ``rtevent`` entry point: forward to a resident dispatcher,
+        or else start the full command.
+    """
+    if not forward(sys.argv[1:]):
+        from pyrocore.scripts import rtevent
+        rtevent.run()
@@ -0,0 +1,256 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Resident query server for rtcontrol.
+
+    A long-running ``rtcontrol --serve`` process keeps the configuration,
+    the connection and an item cache warm, and runs queries sent by
+    thin clients over a Unix domain socket.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+"""
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+from __future__ import absolute_import
+
+import os
+import sys
+import json
+import errno
+import signal
+import socket
+import logging
+
+from pyrocore import error
+
+
+# Environment variable with the socket path; set to an empty value to disable forwarding
+SOCKET_ENV = "PYRO_RTCONTROL_SOCKET"
+
+# Options that only work in direct mode (prompts, own configuration, process control,
+# or OS commands, which need the environment of the caller)
+DIRECT_OPTIONS = set((
+    "-h", "--help", "--version", "--help-fields", "-i", "--interactive", "--detach",
+    "--serve", "--direct", "--watch", "--from-snapshot", "--config-dir", "--config-file", "-D", "--define",
+    "--call", "--spawn",
+))
+
+# Options that suppress any prompts
+NO_PROMPT_OPTIONS = set(("--yes", "-n", "--dry-run"))
+
+
+def socket_path(argv=()):
+    """ Return path of the server socket, as given in C{argv} or the environment,
+        or else in the configuration directory.
+    """
+    for idx, arg in enumerate(argv):
+        if arg == "--socket" and idx + 1 < len(argv):
+            return os.path.expanduser(argv[idx + 1])
+        elif arg.startswith("--socket="):
+            return os.path.expanduser(arg.split('=', 1)[1])
+
+    if SOCKET_ENV in os.environ:
+        return os.path.expanduser(os.environ[SOCKET_ENV])
+
+    config_dir = os.environ.get("PYRO_CONFIG_DIR", None) or "~/.pyroscope"
+    return os.path.join(os.path.expanduser(config_dir), "run", "rtcontrol.sock")
+
+
+def send_frame(sock, kind, data):
+    """ Send a frame of the given kind ('O'=stdout, 'E'=stderr, 'X'=exit code).
+    """
+    if isinstance(data, unicode):
+        data = data.encode("utf-8")
+    sock.sendall("%s%d\n%s" % (kind, len(data), data))
+
+
+class FrameWriter(object):
+    """ File-like object sending everything written to it as frames.
+    """
+
+    def __init__(self, sock, kind, tty=False):
+        "Initialize writer for the given connection"
+        self.sock = sock
+        self.kind = kind
+        self.tty = tty
+
+
+    def write(self, data):
+        "Send data"
+        if data:
+            send_frame(self.sock, self.kind, data)
+
+
+    def writelines(self, lines):
+        "Send several lines"
+        for line in lines:
+            self.write(line)
+
+
+    def flush(self):
+        "Nothing to flush"
+
+
+    def isatty(self):
+        "Terminal status of the client"
+        return self.tty
+
+
+def is_direct(argv, prompting=()):
+    """ Return whether the given command line has to run directly.
+
+        @param prompting: Options that prompt for confirmation on the terminal,
+            unless "--yes" or "--dry-run" is given.
+    """
+    names = set(arg.split('=', 1)[0] for arg in argv)
+    if names & DIRECT_OPTIONS or any(arg.startswith('@') for arg in argv):
+        return True  # needs direct mode, or another connection
+    return bool(names & set(prompting) and not names & NO_PROMPT_OPTIONS)
+
+
+def forward(argv, prompting=()):
+    """ Run a query via the resident server, if there is one.
+
+        @param prompting: See L{is_direct}.
+        @return: Exit code of the query, or C{None} when it has to be run directly.
+    """
+    if not os.environ.get(SOCKET_ENV, True):
+        return None  # explicitly disabled
+    if is_direct(argv, prompting):
+        return None
+
+    path = socket_path(argv)
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        sock.connect(path)
+    except socket.error:
+        sock.close()
+        return None
+
+    try:
+        sock.sendall(json.dumps(dict(argv=argv, cwd=os.getcwd(), tty=sys.stdout.isatty())) + '\n')
+        sock.shutdown(socket.SHUT_WR)
+        reader = sock.makefile("rb")
+        streams = dict(O=sys.stdout, E=sys.stderr)
+        while True:
+            header = reader.readline()
+            if not header:
+                sys.stderr.write("ERROR: Connection to the query server at %s was lost!\n" % path)
+                return error.EX_IOERR
+            kind, size = header[0], int(header[1:], 10)
+            data = reader.read(size)
+            if kind == 'X':
+                return int(data, 10)
+            streams[kind].write(data)
+            streams[kind].flush()
+    finally:
+        sock.close()
+
+
+class QueryServer(object):
+    """ Accept queries on a Unix domain socket, and run them one after the other.
+    """
+
+    def __init__(self, path, handler):
+        """ Set up server for the given socket path.
+
+            C{handler} is called with the argument list of a query,
+            and returns the exit code; the query's output goes to
+            C{sys.stdout} and the logging system.
+        """
+        self.LOG = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.path = path
+        self.handler = handler
+        self.sock = None
+
+
+    def bind(self):
+        """ Create listening socket, replacing a stale one.
+        """
+        if os.path.exists(self.path):
+            probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                probe.connect(self.path)
+            except socket.error:
+                self.LOG.debug("Removing stale socket %r" % (self.path,))
+                os.remove(self.path)
+            else:
+                raise socket.error(errno.EADDRINUSE, "Query server already running on %s" % (self.path,))
+            finally:
+                probe.close()
+
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        old_umask = os.umask(0o077)
+        try:
+            self.sock.bind(self.path)
+        finally:
+            os.umask(old_umask)
+        self.sock.listen(16)
+
+        # Queries running commands must not call back into this server
+        os.environ[SOCKET_ENV] = ''
+
+
+    def serve_forever(self):
+        """ Handle queries until interrupted.
+        """
+        if self.sock is None:
+            self.bind()
+        self.LOG.info("Waiting for queries on %s" % (self.path,))
+
+        # Make sure the socket gets removed on termination
+        signal.signal(signal.SIGTERM, lambda *_: sys.exit(error.EX_OK))
+
+        try:
+            while True:
+                conn, _ = self.sock.accept()
+                try:
+                    self.handle(conn)
+                except socket.error as exc:
+                    self.LOG.warn("Client went away (%s)" % (exc,))
+                finally:
+                    conn.close()
+        finally:
+            self.sock.close()
+            self.sock = None
+            os.remove(self.path)
+
+
+    def handle(self, conn):
+        """ Run a single query from the given connection.
+        """
+        request = json.loads(conn.makefile("rb").readline())
+        stdout = FrameWriter(conn, 'O', tty=request.get("tty", False))
+        log_handler = logging.StreamHandler(FrameWriter(conn, 'E'))
+        log_handler.setFormatter(logging.Formatter(logging.BASIC_FORMAT))
+
+        root_logger = logging.getLogger()
+        old_level, old_stdout, old_cwd = root_logger.level, sys.stdout, os.getcwd()
+        root_logger.addHandler(log_handler)
+        sys.stdout = stdout
+        try:
+            os.chdir(request.get("cwd", old_cwd))
+            argv = [i.encode("utf-8") if isinstance(i, unicode) else i for i in request["argv"]]
+            self.LOG.debug("Query %r" % (argv,))
+            try:
+                exit_code = self.handler(argv)
+            except Exception:  # pylint: disable=broad-except
+                self.LOG.exception("Internal error while handling query %r" % (argv,))
+                exit_code = error.EX_SOFTWARE
+        finally:
+            sys.stdout = old_stdout
+            root_logger.removeHandler(log_handler)
+            root_logger.setLevel(old_level)
+            os.chdir(old_cwd)
+
+        send_frame(conn, 'X', str(exit_code or 0))
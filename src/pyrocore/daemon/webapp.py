@@ -26,8 +26,6 @@ import time
 import socket
 #import mimetypes
 
-import psutil
-
 from webob import exc, static, Request, Response
 from webob.dec import wsgify
 #from webob.response import Response
@@ -36,6 +34,8 @@ from pyrobase.parts import Bunch
 from pyrocore import config, error
 from pyrocore.util import pymagic, xmlrpc, stats
 
+psutil = pymagic.lazy_import("psutil")  # pylint: disable=invalid-name
+
 
 class StaticFolders(object):
     """ An application that serves up the files in a list of given directories.
@@ -30,8 +30,6 @@ import textwrap
 import logging.config
 from optparse import OptionParser
 
-import pkg_resources
-
 from pyrocore import error, config
 from pyrocore.util import os, fmt, pymagic, load_config
 
@@ -77,8 +75,10 @@ class ScriptBase(object):
         logging.getLogger().debug("Logging config read from '%s'" % logging_cfg)
 
 
-    def _get_pkg_meta(self):
+    def _get_pkg_meta(self, warn=True):
         """ Try to find package metadata.
+
+            @param warn: If false, return C{None} instead of a dummy version when nothing is found.
         """
         logger = logging.getLogger('pyrocore.scripts.base.version_info')
         pkg_info = None
@@ -117,6 +117,8 @@ class ScriptBase(object):
                 continue
 
         if not pkg_info:
+            if not warn:
+                return None
             logger.warn("Software version cannot be determined! ({})".format(', '.join(warnings)))
 
         return pkg_info or "Version: 0.0.0\n"
@@ -131,11 +133,16 @@ class ScriptBase(object):
         # Get version number
         self.version = self.VERSION
         if not self.version:
-            # Take version from package
-            provider = pkg_resources.get_provider(__name__)
-            pkg_meta = (provider.get_metadata("PKG-INFO")
-                        or provider.get_metadata("METADATA")
-                        or self._get_pkg_meta())
+            # Take version from package, looking for the metadata file ourselves first,
+            # since importing "pkg_resources" dominates the startup time
+            pkg_meta = self._get_pkg_meta(warn=False)
+            if not pkg_meta:
+                import pkg_resources
+
+                provider = pkg_resources.get_provider(__name__)
+                pkg_meta = (provider.get_metadata("PKG-INFO")
+                            or provider.get_metadata("METADATA")
+                            or self._get_pkg_meta())
             pkg_dict = dict(line.split(": ", 1)
                 for line in pkg_meta.splitlines()
                 if ": " in line
@@ -186,8 +193,8 @@ class ScriptBase(object):
         self.parser.add_option(*args[:-1], **kwargs)
 
 
-    def get_options(self):
-        """ Get program options.
+    def get_options(self, args=None):
+        """ Get program options (from C{sys.argv}, unless C{args} are given).
         """
         self.add_bool_option("-q", "--quiet",
             help="omit informational logging")
@@ -202,7 +209,7 @@ class ScriptBase(object):
         self.add_options()
 
         self.handle_completion()
-        self.options, self.args = self.parser.parse_args()
+        self.options, self.args = self.parser.parse_args(args)
 
         # Override logging options in debug mode
         if self.options.debug:
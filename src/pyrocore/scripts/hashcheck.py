@@ -19,9 +19,24 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 from __future__ import absolute_import
 
+import sys
+import json
+import time
+import fnmatch
+
 from pyrobase import bencode
+from pyrocore import config
 from pyrocore.scripts.base import ScriptBase, ScriptBaseWithConfig
-from pyrocore.util import metafile, os
+from pyrocore.torrent import formatting
+from pyrocore.util import bencoding, metafile, os
+
+
+def bitfield(states):
+    """ Return the hex-encoded bitfield of good pieces, for the given piece states.
+    """
+    bits = ''.join('1' if i else '0' for i in states)
+    bits += '0' * (-len(bits) % 8)
+    return '%0*x' % (len(bits) // 4, int(bits, 2)) if bits else ''
 
 
 class MetafileChecker(ScriptBaseWithConfig):
@@ -31,12 +46,64 @@ class MetafileChecker(ScriptBaseWithConfig):
     # argument description for the usage information
     ARGS_HELP = "<metafile> [<data-dir-or-file>]"
 
+    # seconds between checkpoint updates
+    CHECKPOINT_INTERVAL = 10
 
-    def add_options(self):  # pylint: disable=useless-super-delegation
+
+    def add_options(self):
         """ Add program options.
         """
         super(MetafileChecker, self).add_options()
 
+        self.add_value_option("--jobs", "N", type="int", default=1,
+            help="hash pieces in up to N threads in parallel (uses N cores)")
+        self.add_value_option("-f", "--file", "PATTERN [-f ...]",
+            action="append", default=[],
+            help="only check the pieces of files matching a glob pattern (path within the metafile)")
+        self.add_bool_option("--fail-fast",
+            help="stop at the first bad piece")
+        self.add_value_option("--checkpoint", "FILE",
+            help="record progress in FILE, and resume an interrupted check from it")
+        self.add_bool_option("--json",
+            help="write a bitfield of good pieces and the status of each file as JSON")
+        self.add_value_option("--rate-limit", "SIZE",
+            help="limit the rate of reading data to SIZE per second [hashing_rate_limit]")
+        self.add_bool_option("--drop-cache",
+            help="evict hashed data from the OS page cache (keeps the cache of a running client warm)")
+
+
+    def load_checkpoint(self, info_hash, piece_count):
+        """ Return the piece states recorded in the checkpoint file, if it belongs to this metafile.
+
+            Only good pieces are taken over, bad ones are checked again.
+        """
+        try:
+            with open(self.options.checkpoint, "rb") as handle:
+                checkpoint = json.load(handle)
+        except EnvironmentError:
+            return None
+        except ValueError as exc:
+            self.LOG.warning("Ignoring bad checkpoint file %r (%s)" % (self.options.checkpoint, exc))
+            return None
+
+        if checkpoint.get("info_hash") != info_hash or len(checkpoint.get("states", "")) != piece_count:
+            self.LOG.warning("Ignoring checkpoint file %r of another metafile" % (self.options.checkpoint,))
+            return None
+
+        states = [True if i == '1' else None for i in checkpoint["states"]]
+        self.LOG.info("Resuming check with %d of %d pieces already verified" % (states.count(True), piece_count))
+        return states
+
+
+    def save_checkpoint(self, info_hash, states):
+        """ Atomically write the piece states to the checkpoint file.
+        """
+        tmp_path = self.options.checkpoint + ".tmp"
+        with open(tmp_path, "wb") as handle:
+            json.dump(dict(info_hash=info_hash, states=''.join(
+                '.' if i is None else '1' if i else '0' for i in states)), handle)
+        os.rename(tmp_path, self.options.checkpoint)
+
 
     def mainloop(self):
         """ The main loop.
@@ -50,7 +117,9 @@ class MetafileChecker(ScriptBaseWithConfig):
         # Read metafile
         metapath = self.args[0]
         try:
-            metainfo = bencode.bread(metapath)
+            with open(metapath, "rb") as handle:
+                decoder = bencoding.Decoder(handle.read())
+            metainfo = decoder.decode()
         except (KeyError, bencode.BencodeError) as exc:
             self.fatal("Bad metafile %r (%s)" % (metapath, type(exc).__name__), exc)
             raise
@@ -67,17 +136,85 @@ class MetafileChecker(ScriptBaseWithConfig):
                 else:
                     datapath = metainfo["info"]["name"]
 
-                # Check the hashes
-                torrent = metafile.Metafile(metapath)
-                try:
-                    ok = torrent.check(metainfo, datapath,
-                        progress=None if self.options.quiet else metafile.console_progress())
-                    if not ok:
-                        self.fatal("Metafile %r has checksum errors" % (metapath,))
-                        sys.exit(1)
-                except OSError as exc:
-                    self.fatal("Torrent data file missing", exc)
-                    raise
+        info = metainfo["info"]
+        info_hash = decoder.info_hash()
+        piece_size = info["piece length"]
+        if "length" in info:
+            files = [dict(path=info["name"], size=info["length"])]
+        else:
+            files = [dict(path='/'.join(i["path"]), size=i["length"]) for i in info["files"]]
+
+        # Select files
+        selected = None
+        if self.options.file:
+            selected = set(idx for idx, i in enumerate(files)
+                           if any(fnmatch.fnmatch(i["path"], pattern) for pattern in self.options.file))
+            if not selected:
+                self.fatal("No files in %r match %s" % (metapath, ', '.join(self.options.file)))
+                sys.exit(1)
+
+        states = None
+        if self.options.checkpoint:
+            states = self.load_checkpoint(info_hash, len(info["pieces"]) // 20)
+
+        def save_progress(states):
+            "Write checkpoint from time to time"
+            save_progress.states = states
+            if self.options.checkpoint and time.time() >= save_progress.due:
+                self.save_checkpoint(info_hash, states)
+                save_progress.due = time.time() + self.CHECKPOINT_INTERVAL
+        save_progress.states = states
+        save_progress.due = time.time() + self.CHECKPOINT_INTERVAL
+
+        # Check the hashes
+        torrent = metafile.Metafile(metapath)
+        torrent.jobs = max(1, self.options.jobs)
+        torrent.drop_cache = self.options.drop_cache
+        torrent.rate_limit = formatting.parse_sz(self.options.rate_limit or config.hashing_rate_limit)
+        try:
+            states, missing = torrent.verify(metainfo, datapath, selected=selected, states=states,
+                fail_fast=self.options.fail_fast, callback=save_progress,
+                progress=None if self.options.quiet or self.options.json else metafile.console_progress())
+        except (KeyboardInterrupt, EnvironmentError):
+            if self.options.checkpoint and save_progress.states:
+                self.save_checkpoint(info_hash, save_progress.states)
+            raise
+
+        # Determine status of each file
+        offset = 0
+        for idx, entry in enumerate(files):
+            pieces = states[offset // piece_size:(offset + entry["size"] - 1) // piece_size + 1] \
+                     if entry["size"] else [True]
+            offset += entry["size"]
+            if idx in missing:
+                entry["status"] = "missing"
+            elif False in pieces:
+                entry["status"] = "bad"
+            elif None in pieces:
+                entry["status"] = "unchecked"
+            else:
+                entry["status"] = "ok"
+
+            if entry["status"] in ("missing", "bad"):
+                self.LOG.warning("%s file %r" % (entry["status"].capitalize(), entry["path"]))
+
+        failed = any(i["status"] in ("missing", "bad") for i in files)
+        if self.options.checkpoint:
+            if failed or (self.options.fail_fast and None in states):
+                self.save_checkpoint(info_hash, states)
+            elif os.path.exists(self.options.checkpoint):
+                os.remove(self.options.checkpoint)
+
+        if self.options.json:
+            json.dump(dict(metafile=metapath, info_hash=info_hash, piece_count=len(states),
+                           bitfield=bitfield(states), files=files),
+                      sys.stdout, indent=4, sort_keys=True)
+            sys.stdout.write('\n')
+            sys.stdout.flush()
+
+        if failed:
+            self.fatal("Metafile %r has checksum errors" % (metapath,))
+            sys.exit(1)
 
 
 def run(): #pragma: no cover
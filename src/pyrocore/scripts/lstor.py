@@ -22,12 +22,133 @@ from __future__ import with_statement
 import json
 import pprint
 import hashlib
+from collections import OrderedDict
 
 from pyrobase import bencode
 from pyrocore.scripts.base import ScriptBase
 from pyrocore.util import fmt, metafile
 
 
+class MessageLog(list):
+    """ Collect log messages as C{(level, msg)} tuples,
+        to pass them on from worker processes.
+    """
+
+    def warning(self, msg):
+        "Add a warning"
+        self.append(("warning", msg))
+
+    warn = warning
+
+
+    def error(self, msg):
+        "Add an error"
+        self.append(("error", msg))
+
+
+def lazy_keys(options):
+    """ Return the dict keys of metafiles that need not be decoded for the given options.
+    """
+    if options.output and not (options.raw or options.json):
+        fields = [i.strip() for i in ','.join(options.output).split(',')]
+        if not any(i in ("info", "__size__") or i.startswith(("info.pieces", "info.files")) for i in fields):
+            # Selected fields don't need piece hashes and file lists
+            return ("pieces", "files")
+
+    return ()
+
+
+def list_metafile(job):
+    """ Return the listing of a single metafile (or C{None}), and a L{MessageLog}.
+
+        C{job} is a tuple of the path to the metafile, the command line options,
+        and the dict keys to decode lazily. With C{--jobs}, this runs in a
+        worker process, so it doesn't log or print anything by itself.
+    """
+    filename, options, lazy = job
+    messages = MessageLog()
+    listing = None
+    try:
+        # Read and check metafile
+        data, info_hash = metafile.checked_open(filename, lazy=lazy, with_hash=True,
+            log=messages if options.skip_validation else None,
+            quiet=(options.quiet and (options.output or options.raw or options.ndjson)))
+
+        if options.raw or options.json or (options.ndjson and not options.output):
+            if not options.reveal and "info" in data:
+                # Shorten useless binary piece hashes
+                data["info"]["pieces"] = "<%d piece hashes>" % (
+                    len(data["info"]["pieces"]) / len(hashlib.sha1().digest()) # bogus pylint: disable=E1101
+                )
+
+        if options.ndjson or options.output:
+            def splitter(fields):
+                "Yield single names for a list of comma-separated strings."
+                for flist in fields:
+                    for field in flist.split(','):
+                        yield field.strip()
+
+            data["__file__"] = filename
+            if 'info' in data:
+                data["__hash__"] = info_hash
+                if not lazy:
+                    data["__size__"] = metafile.data_size(data)
+
+        if options.ndjson:
+            if options.output:
+                record = OrderedDict()
+                for field in splitter(options.output):
+                    val = data
+                    for key in field.split('.'):
+                        val = val.get(key) if isinstance(val, dict) else None
+                    record[field] = val
+            else:
+                record = data
+            listing = json.dumps(record, default=repr, sort_keys=not options.output)
+        elif options.raw or options.json:
+            if options.json:
+                listing = json.dumps(data, default=repr, indent=4, sort_keys=True)
+            else:
+                pprinter = (pprint.PrettyPrinter if options.reveal else metafile.MaskingPrettyPrinter)()
+                listing = pprinter.pformat(data)
+        elif options.output:
+            values = []
+            for field in splitter(options.output):
+                try:
+                    val = data
+                    for key in field.split('.'):
+                        val = val[key]
+                except KeyError as exc:
+                    messages.error("%s: Field %r not found (%s)" % (filename, field, exc))
+                    break
+                else:
+                    values.append("%s" % val)
+            else:
+                listing = '\t'.join(fmt.to_utf8(x) for x in values)
+        else:
+            listing = '\n'.join(metafile.Metafile(filename).listing(masked=not options.reveal))
+    except (ValueError, KeyError, bencode.BencodeError) as exc:
+        if options.debug:
+            raise
+        messages.warning("Bad metafile %r (%s: %s)" % (filename, type(exc).__name__, exc))
+
+    return listing, messages
+
+
+def list_metafiles(jobs):
+    """ Return the results of L{list_metafile} for several jobs,
+        with read errors returned instead of raised.
+    """
+    results = []
+    for job in jobs:
+        try:
+            results.append(list_metafile(job))
+        except EnvironmentError as exc:
+            results.append(exc)
+
+    return results
+
+
 class MetafileLister(ScriptBase):
     """ List contents of a bittorrent metafile.
     """
@@ -35,6 +156,9 @@ class MetafileLister(ScriptBase):
     # argument description for the usage information
     ARGS_HELP = "<metafile>..."
 
+    # metafiles handed to a worker process at once
+    CHUNK_SIZE = 64
+
 
     def add_options(self):
         """ Add program options.
@@ -45,6 +169,8 @@ class MetafileLister(ScriptBase):
             help="print the metafile's raw content in all detail")
         self.add_bool_option("--json",
             help="print the unmasked metafile, serialized to JSON")
+        self.add_bool_option("--ndjson",
+            help="print one JSON object per metafile and line (with the fields selected by -o, if any)")
         self.add_bool_option("-V", "--skip-validation",
             help="show broken metafiles with an invalid structure")
         self.add_value_option("-o", "--output", "KEY,KEY1.KEY2,...",
@@ -54,6 +180,8 @@ class MetafileLister(ScriptBase):
                  " __hash__ is the info hash,"
                  " and __size__ is the data size in bytes"
          )
+        self.add_value_option("--jobs", "N", type="int", default=1,
+            help="read metafiles in up to N processes in parallel (uses N cores)")
         # TODO: implement this
         #self.add_value_option("-c", "--check-data", "PATH",
         #    help="check the hash against the data in the given path")
@@ -65,70 +193,48 @@ class MetafileLister(ScriptBase):
             self.parser.print_help()
             self.parser.exit()
 
-        for idx, filename in enumerate(self.args):
-            torrent = metafile.Metafile(filename)
-            if idx and not self.options.output:
-                print('')
-                print("~" * 79)
-
-            try:
-                # Read and check metafile
-                try:
-                    data = metafile.checked_open(filename, log=self.LOG if self.options.skip_validation else None,
-                        quiet=(self.options.quiet and (self.options.output or self.options.raw)))
-                except EnvironmentError as exc:
+        pool = None
+        lazy = lazy_keys(self.options)
+        jobs = [(filename, self.options, lazy) for filename in self.args]
+        if self.options.jobs > 1 and len(jobs) > 1:
+            import signal
+            import multiprocessing
+
+            # Workers ignore SIGINT, the main process handles it and terminates them
+            pool = multiprocessing.Pool(min(self.options.jobs, len(jobs)),
+                                        signal.signal, (signal.SIGINT, signal.SIG_IGN))
+            size = max(1, min(self.CHUNK_SIZE, len(jobs) // self.options.jobs // 4))
+            chunks = [jobs[i:i + size] for i in range(0, len(jobs), size)]
+
+            # Results come back in order, so the output is the same as in a serial run;
+            # and a timeout keeps the wait interruptible
+            pending = pool.imap(list_metafiles, chunks)
+            results = (i for _ in chunks for i in pending.next(2**31))
+        else:
+            results = (list_metafiles([job])[0] for job in jobs)
+
+        try:
+            for idx, filename in enumerate(self.args):
+                if idx and not (self.options.output or self.options.ndjson):
+                    print('')
+                    print("~" * 79)
+
+                result = next(results)
+                if isinstance(result, EnvironmentError):
                     self.fatal("Can't read '%s' (%s)" % (
-                        filename, str(exc).replace(": '%s'" % filename, ""),
+                        filename, str(result).replace(": '%s'" % filename, ""),
                     ))
-                    raise
-
-                listing = None
-
-                if self.options.raw or self.options.json:
-                    if not self.options.reveal and "info" in data:
-                        # Shorten useless binary piece hashes
-                        data["info"]["pieces"] = "<%d piece hashes>" % (
-                            len(data["info"]["pieces"]) / len(hashlib.sha1().digest()) # bogus pylint: disable=E1101
-                        )
-
-                    if self.options.json:
-                        listing = json.dumps(data, default=repr, indent=4, sort_keys=True)
-                    else:
-                        pprinter = (pprint.PrettyPrinter if self.options.reveal else metafile.MaskingPrettyPrinter)()
-                        listing = pprinter.pformat(data)
-                elif self.options.output:
-                    def splitter(fields):
-                        "Yield single names for a list of comma-separated strings."
-                        for flist in fields:
-                            for field in flist.split(','):
-                                yield field.strip()
-
-                    data["__file__"] = filename
-                    if 'info' in data:
-                        data["__hash__"] = metafile.info_hash(data)
-                        data["__size__"] = metafile.data_size(data)
-                    values = []
-                    for field in splitter(self.options.output):
-                        try:
-                            val = data
-                            for key in field.split('.'):
-                                val = val[key]
-                        except KeyError as exc:
-                            self.LOG.error("%s: Field %r not found (%s)" % (filename, field, exc))
-                            break
-                        else:
-                            values.append("%s" % val)
-                    else:
-                        listing = '\t'.join(fmt.to_utf8(x) for x in values)
-                else:
-                    listing = '\n'.join(torrent.listing(masked=not self.options.reveal))
-            except (ValueError, KeyError, bencode.BencodeError) as exc:
-                if self.options.debug:
-                    raise
-                self.LOG.warning("Bad metafile %r (%s: %s)" % (filename, type(exc).__name__, exc))
-            else:
+                    raise result
+
+                listing, messages = result
+                for level, msg in messages:
+                    getattr(self.LOG, level)(msg)
                 if listing is not None:
                     print(fmt.to_utf8(listing))
+        finally:
+            if pool:
+                pool.terminate()
+                pool.join()
 
 
 def run(): #pragma: no cover
@@ -76,6 +76,14 @@ class MetafileCreator(ScriptBaseWithConfig):
             help="set minimum piece size [%s]" % (human(metafile.Metafile.CHUNK_MIN)))
         self.add_value_option("--chunk-max", "SIZE",
             help="set maximum piece size [%s]" % (human(metafile.Metafile.CHUNK_MAX)))
+        self.add_value_option("--jobs", "N", type="int", default=1,
+            help="hash pieces in up to N threads in parallel (uses N cores)")
+        self.add_value_option("--hash-cache", "FILE",
+            help="keep piece hashes in FILE, and only re-hash files changed since the last run")
+        self.add_value_option("--rate-limit", "SIZE",
+            help="limit the rate of reading data to SIZE per second [hashing_rate_limit]")
+        self.add_bool_option("--drop-cache",
+            help="evict hashed data from the OS page cache (keeps the cache of a running client warm)")
         self.add_bool_option("--no-cross-seed",
             help="do not automatically add a field to the info dict ensuring unique info hashes")
         self.add_value_option("-X", "--cross-seed", "LABEL",
@@ -87,7 +95,6 @@ class MetafileCreator(ScriptBaseWithConfig):
             help="load newly created item directly into client")
         self.add_bool_option("--start",
             help="start newly created item directly in the client")
-# TODO: Optionally limit disk I/O bandwidth used (incl. a config default!)
 # TODO: Set "encoding" correctly
 # TODO: Support multi-tracker extension ("announce-list" field)
 # TODO: DHT "nodes" field?! [[str IP, int port], ...]
@@ -148,6 +155,10 @@ class MetafileCreator(ScriptBaseWithConfig):
             metapath += ".torrent"
         torrent = metafile.Metafile(metapath)
         torrent.ignore.extend(self.options.exclude)
+        torrent.jobs = max(1, self.options.jobs)
+        torrent.hash_cache = self.options.hash_cache and os.path.expanduser(self.options.hash_cache)
+        torrent.drop_cache = self.options.drop_cache
+        torrent.rate_limit = formatting.parse_sz(self.options.rate_limit or config.hashing_rate_limit)
 
         def callback(meta):
             "Callback to set label and resume data."
@@ -164,7 +175,7 @@ class MetafileCreator(ScriptBaseWithConfig):
             metafile.assign_fields(meta, self.options.set, self.options.debug)
 
         # Create and write the metafile(s)
-        # TODO: make it work better with multiple trackers (hash only once), also create fast-resume file for each tracker
+        # TODO: also create fast-resume file for each tracker
         meta = torrent.create(datapath, self.args[1:],
             progress=None if self.options.quiet else metafile.console_progress(),
             root_name=self.options.root_name, private=self.options.private, no_date=self.options.no_date,
@@ -23,13 +23,15 @@ import json
 import time
 import shlex
 import logging
+import itertools
 import subprocess
 
 from pyrobase.parts import Bunch, DefaultBunch
 from pyrocore import config, error
-from pyrocore.util import os, fmt, osmagic, pymagic, matching, xmlrpc
+from pyrocore.util import os, fmt, osmagic, pymagic, matching, stats, xmlrpc
 from pyrocore.scripts.base import ScriptBase, ScriptBaseWithConfig, PromptDecorator
 from pyrocore.torrent import engine, formatting
+from pyrocore.daemon import resident
 
 
 def print_help_fields():
@@ -65,16 +67,34 @@ def print_help_fields():
 
 
 class FieldStatistics(object):
-    """ Collect statistical values for the fields of a search result.
+    """ Collect statistical values for the fields of a search result,
+        in a single pass and with constant memory per field.
     """
 
-    def __init__(self, size):
-        "Initialize accumulator"
-        self.size = size
+    # Labels and fractions of reported quantiles
+    QUANTILES = (("MED", 0.5), ("P90", 0.9), ("P99", 0.99))
+
+
+    def __init__(self, fields=(), group_by=None, histogram=None):
+        """ Initialize accumulator.
+
+            For compatibility with older templates, C{fields} can also be the
+            item count, with the samples then passed to L{add} one by one.
+        """
+        self.size = 0
+        if isinstance(fields, (int, long)):
+            self.size, fields = fields, ()
+        self.fields = list(fields)
+        self.numeric = None
         self.errors = DefaultBunch(int)
         self.total = DefaultBunch(int)
         self.min = DefaultBunch(int)
         self.max = DefaultBunch(int)
+        self.sketches = {}
+        self.group_by = group_by
+        self.groups = {}
+        self.histogram_field = histogram
+        self.histogram = stats.Histogram() if histogram else None
         self._basetime = time.time()
 
 
@@ -83,10 +103,16 @@ class FieldStatistics(object):
         return bool(self.total)
 
 
-    def add(self, field, val):
-        "Add a sample"
+    def _sample(self, field, val):
+        "Convert a field value to a sample value"
         if engine.FieldDefinition.FIELDS[field]._matcher is matching.TimeFilter:
             val = self._basetime - val
+        return val
+
+
+    def add(self, field, val):
+        "Add a sample"
+        val = self._sample(field, val)
 
         try:
             self.total[field] += val
@@ -94,6 +120,44 @@ class FieldStatistics(object):
             self.max[field] = max(self.max[field], val)
         except (ValueError, TypeError):
             self.errors[field] += 1
+        else:
+            if field not in self.sketches:
+                self.sketches[field] = stats.QuantileSketch()
+            self.sketches[field].add(val)
+
+
+    def feed(self, item):
+        "Add the values of all fields of an item"
+        # Check for numerical fields on the first item
+        if self.numeric is None:
+            self.numeric = []
+            for field in self.fields:
+                if field in self.numeric or field in self.total:
+                    continue
+                try:
+                    0 + getattr(item, field)
+                except (TypeError, ValueError):
+                    self.total[field] = ''
+                else:
+                    self.numeric.append(field)
+
+        self.size += 1
+        for field in self.numeric:
+            self.add(field, getattr(item, field))
+
+        if self.histogram is not None:
+            try:
+                self.histogram.add(self._sample(self.histogram_field, getattr(item, self.histogram_field)))
+            except TypeError:
+                pass  # no value
+
+        if self.group_by:
+            key = getattr(item, self.group_by)
+            if isinstance(key, (list, tuple, set, frozenset)):
+                key = ' '.join(sorted(key))
+            if key not in self.groups:
+                self.groups[key] = FieldStatistics(self.fields)
+            self.groups[key].feed(item)
 
 
     @property
@@ -108,18 +172,92 @@ class FieldStatistics(object):
                 for key, val in self.total.items()
             )
 
-        # Handle time fields
-        #for key, fielddef in  engine.FieldDefinition.FIELDS.items():
-        #    if key in result and fielddef._matcher is matching.TimeFilter:
-        #       result[key] = ''
-        #for key, fielddef in  engine.FieldDefinition.FIELDS.items():
-        #    if key in result and fielddef._matcher is matching.TimeFilter:
-        #        result[key] = engine._fmt_duration(result[key])
-        #print self.total
-        #print result
         return result
 
 
+    def quantile(self, fraction):
+        "Estimate the value at the given quantile (0..1)"
+        result = DefaultBunch(str)
+        result.update((key, '') for key, val in self.total.items() if isinstance(val, basestring))
+        result.update((key, sketch.quantile(fraction)) for key, sketch in self.sketches.items())
+        return result
+
+
+    @property
+    def median(self):
+        "Estimate median"
+        return self.quantile(0.5)
+
+
+class OutputSink(object):
+    """ Buffered writer for console output, line-buffered on a terminal,
+        and block-buffered when writing to a pipe or file.
+    """
+
+    # Flush threshold for block-buffered output
+    BUFFER_SIZE = 64 * 1024
+
+
+    def __init__(self, stream=None, line_buffered=None):
+        "Initialize buffer for given stream"
+        self.stream = stream or sys.stdout
+        try:
+            self.is_tty = self.stream.isatty()
+        except (AttributeError, EnvironmentError, ValueError):
+            self.is_tty = False
+        self.line_buffered = self.is_tty if line_buffered is None else line_buffered
+        self._buffer = []
+        self._buffered = 0
+
+
+    def write(self, text):
+        "Add text to the buffer, and write it when the buffering policy says so"
+        self._buffer.append(text)
+        self._buffered += len(text)
+        if self.line_buffered or self._buffered >= self.BUFFER_SIZE:
+            self.flush()
+
+
+    def flush(self):
+        "Write any buffered text to the stream"
+        if self._buffer:
+            text, self._buffer, self._buffered = ''.join(self._buffer), [], 0
+            self.stream.write(text)
+        self.stream.flush()
+
+
+class JsonStreamWriter(object):
+    """ Write JSON records one by one, either as elements of a single array,
+        or as newline-delimited JSON objects (one per line).
+    """
+
+    def __init__(self, output, lines=False):
+        "Initialize writer for given output sink"
+        self.output = output
+        self.lines = lines
+        self.count = 0
+
+
+    def write(self, record):
+        "Write a single record"
+        if self.lines:
+            self.output.write(json.dumps(record, sort_keys=True, separators=(',', ':'),
+                                         cls=pymagic.JSONEncoder) + '\n')
+        else:
+            # Same layout as dumping the whole array in one go, with "indent=2"
+            text = json.dumps(record, indent=2, separators=(',', ': '), sort_keys=True, cls=pymagic.JSONEncoder)
+            self.output.write(('[\n' if not self.count else ',\n')
+                              + '\n'.join('  ' + i for i in text.split('\n')))
+        self.count += 1
+
+
+    def close(self):
+        "Finish the output"
+        if not self.lines:
+            self.output.write('\n]\n' if self.count else '[]\n')
+        self.output.flush()
+
+
 class RtorrentControl(ScriptBaseWithConfig):
     ### Keep things wrapped to fit under this comment... ##############################
     """
@@ -157,7 +295,7 @@ class RtorrentControl(ScriptBaseWithConfig):
         "Use --help-fields to list all fields and their description.",
     ]
 
-    # additional values for output formatting
+    # additional values for output formatting ("now" is set for each query)
     FORMATTER_DEFAULTS = dict(
         now=time.time(),
     )
@@ -183,9 +321,9 @@ class RtorrentControl(ScriptBaseWithConfig):
         #    help="remove partially downloaded 'off'ed files (also stops downloads)")
         Bunch(name="delete", options=("--delete",), help="remove torrent from client", interactive=True),
         Bunch(name="purge", options=("--purge", "--delete-partial"),
-              help="delete PARTIAL data files and remove torrent from client", interactive=True),
+              help="delete PARTIAL data files and remove torrent from client", interactive=True, batched=False),
         Bunch(name="cull", options=("--cull", "--exterminate", "--delete-all"),
-            help="delete ALL data files and remove torrent from client", interactive=True),
+            help="delete ALL data files and remove torrent from client", interactive=True, batched=False),
         Bunch(name="throttle", options=("-T", "--throttle",), argshelp="NAME", method="set_throttle",
             help="assign to named throttle group (NULL=unlimited, NONE=global)", interactive=True),
         Bunch(name="tag", options=("--tag",), argshelp='"TAG +TAG -TAG..."',
@@ -214,6 +352,9 @@ class RtorrentControl(ScriptBaseWithConfig):
         self.prompt = PromptDecorator(self)
         self.plain_output_format = False
         self.raw_output_format = None
+        self.output = None
+        self.resident = False
+        self.items_changed = False
 
 
     def add_options(self):
@@ -230,6 +371,16 @@ class RtorrentControl(ScriptBaseWithConfig):
             help="run the process in the background")
         self.prompt.add_options()
 
+        # resident query server
+        self.add_bool_option("--serve",
+            help="run as a resident query server, which other rtcontrol calls use automatically")
+        self.add_value_option("--socket", "PATH",
+            help="Unix socket of the query server [$%s or ~/.pyroscope/run/rtcontrol.sock]" % resident.SOCKET_ENV)
+        self.add_value_option("--cache-ttl", "SECS", type="float", default=5.0,
+            help="with --serve, max. age of cached items")
+        self.add_bool_option("--direct",
+            help="don't use a running query server")
+
         # output control
         self.add_bool_option("-S", "--shell",
             help="escape output following shell rules")
@@ -238,20 +389,27 @@ class RtorrentControl(ScriptBaseWithConfig):
         self.add_bool_option("-c", "--column-headers",
             help="print column headers")
         self.add_bool_option("-+", "--stats",
-            help="add sum / avg / median of numerical fields")
+            help="add sum / min / avg / median / percentiles / max of numerical fields")
         self.add_bool_option("--summary",
             help="print only statistical summary, without the items")
+        self.add_value_option("--group-by", "FIELD",
+            help="add statistical subtotals for each value of FIELD, e.g. 'alias' (implies --stats)")
+        self.add_value_option("--histogram", "FIELD",
+            help="add a histogram of the values of the numerical FIELD")
         #self.add_bool_option("-f", "--full",
         #    help="print full torrent details")
         self.add_bool_option("--json",
             help="dump default fields of all items as JSON (use '-o f1,f2,...' to specify fields)")
+        self.add_bool_option("--json-lines",
+            help="like --json, but dump one JSON object per line (NDJSON), as items are processed")
         self.add_value_option("-o", "--output-format", "FORMAT",
             help="specify display format (use '-o-' to disable item display)")
         self.add_value_option("-O", "--output-template", "FILE",
             help="pass control of output formatting to the specified template")
         self.add_value_option("-s", "--sort-fields", "[-]FIELD[,...] [-s...]",
             action='append', default=[],
-            help="fields used for sorting, descending if prefixed with a '-'; '-s*' uses output field list")
+            help="fields used for sorting, descending if prefixed with a '-';"
+                 " '-s*' uses output field list, '-s-' streams unsorted output")
         self.add_bool_option("-r", "--reverse-sort",
             help="reverse the sort order")
         self.add_value_option("-A", "--anneal", "MODE [-A...]",
@@ -260,6 +418,8 @@ class RtorrentControl(ScriptBaseWithConfig):
             help="modify result set using some pre-defined methods")
         self.add_value_option("-/", "--select", "[N-]M",
             help="select result subset by item position (counting from 1)")
+        self.add_value_option("--watch", "SECS", type="float",
+            help="keep running, and show changes of the result every SECS seconds")
         self.add_bool_option("-V", "--view-only",
             help="show search result only in default ncurses view")
         self.add_value_option("--to-view", "--to", "NAME",
@@ -274,6 +434,14 @@ class RtorrentControl(ScriptBaseWithConfig):
             help="ADDITIONALLY show search results in ncurses view (modifies -V and --to behaviour)")
         self.add_value_option("--from-view", "--from", "NAME",
             help="select only items that are on view NAME (NAME can be an info hash to quickly select a single item)")
+        self.add_value_option("--from-snapshot", "FILE",
+            help="query the items in a snapshot file, instead of the client")
+        self.add_value_option("--snapshot-out", "FILE",
+            help="write all matches to a snapshot file")
+        self.add_value_option("--snapshot-with", "files,trackers",
+            help="also store file lists and/or announce URLs in the snapshot")
+        self.add_value_option("--snapshot-fields", "NAME,...",
+            help="fields to store in the snapshot, in addition to those fetched by the query [all]")
         self.add_value_option("-M", "--modify-view", "NAME",
             help="get items from given view and write result back to it (short-cut to combine --from-view and --to-view)")
         self.add_value_option("-Q", "--fast-query", "LEVEL",
@@ -284,6 +452,14 @@ class RtorrentControl(ScriptBaseWithConfig):
         self.add_value_option("--spawn", "CMD [--spawn ...]",
             action="append", default=[],
             help="execute OS command pattern(s) directly")
+        self.add_value_option("--jobs", "N", type="int", default=1,
+            help="run commands of --call / --spawn for up to N items in parallel")
+        self.add_bool_option("--ordered",
+            help="with --jobs, write command output in item order, not when done")
+        self.add_bool_option("--keep-going",
+            help="continue with other items after a failed --call / --spawn command")
+        self.add_value_option("--timeout", "SECS", type="float",
+            help="overall time limit for --call / --spawn commands")
 # TODO: implement -S
 #        self.add_bool_option("-S", "--summary",
 #            help="print statistics")
@@ -293,6 +469,7 @@ class RtorrentControl(ScriptBaseWithConfig):
             action.setdefault("label", action.name.upper())
             action.setdefault("method", action.name)
             action.setdefault("interactive", False)
+            action.setdefault("batched", True)
             action.setdefault("argshelp", "")
             action.setdefault("args", ())
             if action.argshelp:
@@ -369,7 +546,7 @@ class RtorrentControl(ScriptBaseWithConfig):
             item_text = item_formatter(item_text)
 
         # For a header, use configured escape codes on a terminal
-        if item is None and os.isatty(sys.stdout.fileno()):
+        if item is None and self.output.is_tty:
             item_text = ''.join((config.output_header_ecma48, item_text, "\x1B[0m"))
 
         # Dump to selected target
@@ -378,15 +555,72 @@ class RtorrentControl(ScriptBaseWithConfig):
                 to_log(item_text)
             else:
                 self.LOG.info(item_text)
-        elif self.options.nul:
-            sys.stdout.write(item_text + '\0')
-            sys.stdout.flush()
         else:
-            print(item_text)
+            self.output.write(item_text + ('\0' if self.options.nul else '\n'))
 
         return item_text.count('\n') + 1
 
 
+    def emit_items(self, items, stencil=None, summary=None):
+        """ Print items on the console, with header lines if requested,
+            followed by the statistical summary; return the number of items.
+        """
+        item_count = line_count = 0
+        for item in items:
+            if stencil is None and self.options.column_headers and self.plain_output_format:
+                stencil = fmt.to_console(formatting.format_item(
+                    self.options.output_format, item, self.FORMATTER_DEFAULTS)).split('\t')
+            if summary is not None:
+                summary.feed(item)
+            item_count += 1
+            if self.options.summary:
+                continue
+
+            # Emit a header line every 'output_header_frequency' lines
+            if self.options.column_headers and line_count % config.output_header_frequency == 0:
+                self.emit(None, stencil=stencil)
+
+            # Print matching item
+            line_count += self.emit(item, self.FORMATTER_DEFAULTS)
+
+        if item_count and summary is not None:
+            self.emit_summary(summary, stencil)
+
+        return item_count
+
+
+    def emit_summary(self, summary, stencil=None):
+        """ Print statistical summary, group subtotals, and histogram.
+        """
+        def labelled(label, count, suffix=''):
+            "Helper to append a label to a summary line"
+            return lambda i: i.rstrip() + " [%s of %d item(s)%s]" % (label, count, suffix)
+
+        if summary:
+            self.emit(None, stencil=stencil)
+            self.emit(summary.total, item_formatter=labelled("SUM", summary.size))
+            self.emit(summary.min, item_formatter=labelled("MIN", summary.size))
+            self.emit(summary.average, item_formatter=labelled("AVG", summary.size))
+            for label, fraction in summary.QUANTILES:
+                self.emit(summary.quantile(fraction), item_formatter=labelled(label, summary.size))
+            self.emit(summary.max, item_formatter=labelled("MAX", summary.size))
+
+            for key, group in sorted(summary.groups.items()):
+                self.emit(group.total, item_formatter=labelled("SUM", group.size,
+                    " with %s=%s" % (summary.group_by, fmt.to_console(key))))
+
+        if summary.histogram is not None:
+            buckets = summary.histogram.buckets()
+            labels = ["< 0" if lower is None else "0" if not upper else
+                      "%s .. %s" % (lower, upper) if isinstance(lower, (int, long)) else "%g .. %g" % (lower, upper)
+                      for lower, upper, _ in buckets]
+            width = max([0] + [len(i) for i in labels])
+            scale = 40.0 / max([1] + [i[2] for i in buckets])
+            self.output.write("Histogram of %s:\n" % summary.histogram_field)
+            for label, (_, _, count) in zip(labels, buckets):
+                self.output.write("%*s %8d %s\n" % (width, label, count, '#' * int(round(scale * count))))
+
+
     # TODO: refactor to formatting.OutputMapping as a class method
     def validate_output_format(self, default_format):
         """ Prepare output format for later use.
@@ -420,6 +654,10 @@ class RtorrentControl(ScriptBaseWithConfig):
 
         self.options.output_format = formatting.preparse(output_format)
 
+        # Resolve field references of interpolation formats once, instead of per item
+        if getattr(self.options.output_format, "__engine__", None) == "interpolation":
+            formatting.CompiledInterpolation.cached(self.options.output_format)
+
 
     # TODO: refactor to engine.FieldDefinition as a class method
     def get_output_fields(self):
@@ -440,19 +678,37 @@ class RtorrentControl(ScriptBaseWithConfig):
         return result
 
 
+    def validate_statistics(self):
+        """ Prepare statistics accumulator, or return C{None} if none are requested.
+        """
+        if self.options.group_by:
+            self.options.stats = True
+        if not (self.options.stats or self.options.summary or self.options.histogram):
+            return None
+
+        return FieldStatistics(self.get_output_fields() if self.options.stats or self.options.summary else (),
+            group_by=self.options.group_by and formatting.validate_field_list(self.options.group_by)[0],
+            histogram=self.options.histogram and formatting.validate_field_list(self.options.histogram)[0])
+
+
     def validate_sort_fields(self):
         """ Take care of sorting.
         """
         sort_fields = ','.join(self.options.sort_fields)
         if sort_fields == '*':
             sort_fields = self.get_output_fields()
+        sort_fields = sort_fields or config.sort_fields
+
+        if not sort_fields or sort_fields == '-':
+            return None  # unsorted
 
-        return formatting.validate_sort_fields(sort_fields or config.sort_fields)
+        return formatting.validate_sort_fields(sort_fields)
 
 
     def show_in_view(self, sourceview, matches, targetname=None):
         """ Show search result in ncurses view.
         """
+        self.items_changed = True
         append = self.options.append_view or self.options.alter_view == 'append'
         remove = self.options.alter_view == 'remove'
         action_name = ', appending to' if append else ', removing from' if remove else ' into'
@@ -465,17 +721,27 @@ class RtorrentControl(ScriptBaseWithConfig):
         config.engine.log(msg)
 
 
-    def json_dump(self, data):
-        """ Dump result as JSON.
+    def json_writer(self):
+        """ Return a JSON writer according to the output options.
         """
-        if self.raw_output_format and self.raw_output_format != '-':
+        return JsonStreamWriter(self.output, lines=self.options.json_lines)
+
+
+    def json_dump(self, data, projection=True):
+        """ Dump result as JSON, and return the number of records.
+        """
+        json_fields = None
+        if projection and self.raw_output_format and self.raw_output_format != '-':
             json_fields = self.raw_output_format.split(',')
-            data = [dict([(name, getattr(i, name)) for name in json_fields])
-                    for i in data]
-        json.dump(data, sys.stdout, indent=2, separators=(',', ': '),
-                  sort_keys=True, cls=pymagic.JSONEncoder)
-        sys.stdout.write('\n')
-        sys.stdout.flush()
+
+        writer = self.json_writer()
+        for item in data:
+            if json_fields:
+                item = dict([(name, getattr(item, name)) for name in json_fields])
+            writer.write(item)
+        writer.close()
+
+        return writer.count
 
 
     def anneal(self, mode, matches, orig_matches):
@@ -539,9 +805,193 @@ class RtorrentControl(ScriptBaseWithConfig):
         return changed
 
 
+    def is_streamable(self, sort_key, selection, actions):
+        """ Check whether items can be dumped as they come in,
+            i.e. nothing needs the complete list of matches.
+        """
+        return (sort_key is None and not selection and not actions
+            and not any((self.options.anneal, self.options.tee_view, self.options.to_view,
+                         self.options.view_only, self.options.call, self.options.spawn,
+                         self.options.output_template, self.options.snapshot_out))
+            and (self.options.json or self.is_console_output(actions)))
+
+
+    def is_console_output(self, actions):
+        """ Check whether matches are printed to the console using the output format.
+        """
+        return (not actions and not (self.options.to_view or self.options.view_only) or self.options.tee_view) \
+            and not any((self.options.call, self.options.spawn, self.options.json, self.options.output_template,
+                         self.options.snapshot_out)) \
+            and bool(self.options.output_format and str(self.options.output_format) != "-")
+
+
+    def watch(self, view, sort_key, selection, actions):
+        """ Keep polling the view, and show added, removed, and changed items.
+
+            Items are only matched and formatted again when any of their
+            fetched fields changed. Besides the usual prefetched fields,
+            those include all fields that the filter, output format, and
+            sort order accessed in earlier rounds, which are fetched for all
+            items in one call. On a terminal, the whole table is redrawn
+            on changes; otherwise, changed rows are written prefixed by
+            '+', '-', or '~', or as JSON change events with "--json".
+        """
+        if self.options.watch < 0.1:
+            self.parser.error("The --watch interval must be at least 0.1 seconds")
+        if actions or any((self.options.stats, self.options.summary, self.options.histogram, self.options.anneal,
+                self.options.tee_view, self.options.to_view, self.options.view_only, self.options.call,
+                self.options.spawn, self.options.output_template, self.resident)):
+            self.parser.error("--watch can only be combined with output, sorting, and selection options")
+
+        json_fields = None
+        if self.raw_output_format and self.raw_output_format != '-':
+            json_fields = self.raw_output_format.split(',')
+        writer = JsonStreamWriter(self.output, lines=True) if self.options.json else None
+        redraw = not writer and self.output.is_tty
+
+        def make_row(item):
+            "Helper to format an item, as a JSON record or a line of text"
+            if writer:
+                return dict((name, getattr(item, name)) for name in json_fields) if json_fields else item.as_dict()
+            return self.format_item(item, self.FORMATTER_DEFAULTS)
+
+        known = {}  # hash -> (fetched fields, row or None if not matching, item) from the last round
+        shown = {}  # hash -> row of the items in the current result
+        watched = set()  # names of fields accessed while matching, formatting, or sorting
+        try:
+            while True:
+                started = time.time()
+                current, matches, fresh = {}, [], []
+                items = list(config.engine.items(view, cache=False))
+                if watched:
+                    config.engine.fetch_fields(items, watched, view.viewname)
+                for item in items:
+                    fields = item.fetched_fields()
+                    entry = known.get(item.hash)
+                    if entry is None or entry[0] != fields:
+                        matched = view.matcher is None or view.matcher.match(item)
+                        entry = (fields, make_row(item) if matched else None, item)
+                        fresh.append(item)
+                    current[item.hash] = entry
+                    if entry[1] is not None:
+                        matches.append(entry[2])
+                known = current
+
+                if sort_key:
+                    matches = sort_key.sort(matches, reverse=self.options.reverse_sort)
+                for item in fresh:
+                    watched.update(i for i in item.fetched_fields() if isinstance(i, basestring))
+                if selection:
+                    matches = matches[selection[0]-1:selection[1]]
+                rows = [(i.hash, known[i.hash][1]) for i in matches]
+                result = dict(rows)
+
+                changes = [('+', key, row) for key, row in rows if key not in shown]
+                changes += [('-', key, row) for key, row in shown.items() if key not in result]
+                changes += [('~', key, row) for key, row in rows if key in shown and shown[key] != row]
+                shown = result
+
+                if changes and writer:
+                    events = dict(zip("+-~", ("added", "removed", "changed")))
+                    for kind, key, row in changes:
+                        writer.write(dict(event=events[kind], hash=key, item=row))
+                elif changes and redraw:
+                    self.output.write("\x1B[H\x1B[2J")
+                    if self.options.column_headers:
+                        self.emit(None)
+                    for _, row in rows:
+                        self.output.write(row + '\n')
+                    self.output.write("\n%s: %d item(s), %s\n" % (fmt.iso_datetime(), len(rows), ", ".join(
+                        "%d %s" % (sum(1 for i in changes if i[0] == kind), label)
+                        for kind, label in zip("+-~", ("added", "removed", "changed")))))
+                else:
+                    for kind, _, row in changes:
+                        self.output.write("%s %s\n" % (kind, row))
+                self.output.flush()
+
+                time.sleep(max(0, self.options.watch - (time.time() - started)))
+        except KeyboardInterrupt:
+            self.LOG.debug("Watch interrupted")
+
+
+    def serve(self):
+        """ Run as a resident query server.
+        """
+        if self.args:
+            self.parser.error("No filter conditions allowed with --serve")
+
+        config.engine.open()
+        server = resident.QueryServer(self.options.socket or resident.socket_path(), self.run_resident)
+        server.bind()
+        RtorrentControl.VERSION = self.version  # avoid looking it up again for every query
+
+        if self.options.detach:
+            daemon_log = os.path.join(config.config_dir, "log", "rtcontrol.log")
+            osmagic.daemonize(logfile=daemon_log if os.path.exists(os.path.dirname(daemon_log)) else None)
+        server.serve_forever()
+
+
+    def run_resident(self, argv):
+        """ Run a query for a client of the resident server, and return its exit code.
+
+            Cached items are dropped when older than "--cache-ttl", and fetched
+            again in full by the next query. rTorrent offers no way to ask for
+            changed items only, so an incremental refresh would still need one
+            "d.multicall" over the whole view, i.e. the same as a fresh fetch.
+        """
+        config.engine.expire_cache(self.options.cache_ttl)
+        global_state = config.fast_query, config.engine  # options like '-Q' change these
+        query = RtorrentControl()
+        query.resident = True
+        try:
+            try:
+                ScriptBase.get_options(query, argv)
+                prompting = any(getattr(query.options, i.name) for i in query.ACTION_MODES if i.interactive)
+                if any((query.options.serve, query.options.detach, query.options.interactive,
+                        query.options.call, query.options.spawn,
+                        prompting and not (query.options.yes or query.options.dry_run),
+                        query.options.config_dir, query.options.config_file, query.options.defines)):
+                    query.LOG.error("These options are only available when called directly, use --direct")
+                    return error.EX_USAGE
+                query.mainloop()
+            except error.LoggableError, exc:
+                if query.options.debug:
+                    raise
+                try:
+                    msg = str(exc)
+                except UnicodeError:
+                    msg = unicode(exc, "UTF-8")
+                query.LOG.error(msg)
+                return error.EX_SOFTWARE
+            except SystemExit, exc:
+                # --help, usage errors, and fatal()
+                return exc.code if isinstance(exc.code, int) else int(bool(exc.code))
+        finally:
+            config.fast_query, config.engine = global_state
+            if query.items_changed:
+                config.engine.expire_cache()
+            if query.options:
+                query.LOG.log(query.STD_LOG_LEVEL, "Total time: %.3f seconds." % (time.time() - query.startup))
+
+        return query.return_code
+
+
     def mainloop(self):
         """ The main loop.
         """
+        if self.options.serve:
+            return self.serve()
+
+        try:
+            self._run_query()
+        finally:
+            if self.output:
+                self.output.flush()
+
+
+    def _run_query(self):
+        """ Select items and handle them according to the given options.
+        """
         # Print field definitions?
         if self.options.help_fields:
             self.parser.print_help()
@@ -552,6 +1002,8 @@ class RtorrentControl(ScriptBaseWithConfig):
         if not self.args:
             self.parser.error("No filter conditions given!")
         self.check_for_connection()
+        if self.options.json_lines:
+            self.options.json = True
 
         # Check special action options
         actions = []
@@ -582,6 +1034,21 @@ class RtorrentControl(ScriptBaseWithConfig):
         if any(i.interactive for i in actions):
             self.options.interactive = True
 
+        # Check snapshot options
+        snapshot_extras = [i.strip() for i in (self.options.snapshot_with or '').split(',') if i.strip()]
+        if self.options.from_snapshot or self.options.snapshot_out:
+            from pyrocore.torrent import snapshot
+            if actions or any((self.options.to_view, self.options.view_only, self.options.tee_view,
+                    self.options.call, self.options.spawn, self.options.watch)):
+                self.parser.error("Snapshots cannot be combined with actions, views, commands, or watching")
+            if set(snapshot_extras) - set(snapshot.EXTRAS):
+                self.parser.error("Bad --snapshot-with value '%s' (use %s)" % (
+                    self.options.snapshot_with, ', '.join(snapshot.EXTRAS)))
+            if self.options.from_snapshot:
+                config.engine = snapshot.SnapshotEngine(os.path.expanduser(self.options.from_snapshot))
+        if (snapshot_extras or self.options.snapshot_fields) and not self.options.snapshot_out:
+            self.parser.error("--snapshot-with and --snapshot-fields need --snapshot-out")
+
         # Reduce results according to index range
         selection = None
         if self.options.select:
@@ -601,12 +1068,14 @@ class RtorrentControl(ScriptBaseWithConfig):
         # Preparation steps
         if self.options.fast_query != '=':
             config.fast_query = int(self.options.fast_query)
+        self.FORMATTER_DEFAULTS = dict(self.FORMATTER_DEFAULTS, now=time.time())
         self.raw_output_format = self.options.output_format
         default_output_format = "default"
         if actions:
             default_output_format = "action_cron" if self.options.cron else "action"
         self.validate_output_format(default_output_format)
         sort_key = self.validate_sort_fields()
+        summary = self.validate_statistics()
         matcher = matching.ConditionParser(engine.FieldDefinition.lookup, "name").parse(self.args)
         self.LOG.debug("Matcher is: %s" % matcher)
 
@@ -617,6 +1086,7 @@ class RtorrentControl(ScriptBaseWithConfig):
             daemon_log = os.path.join(config.config_dir, "log", "rtcontrol.log")
             osmagic.daemonize(logfile=daemon_log if os.path.exists(os.path.dirname(daemon_log)) else None)
             time.sleep(.05) # let things settle a little
+        self.output = OutputSink()
 
         # View handling
         if self.options.append_view and self.options.alter_view:
@@ -629,9 +1099,32 @@ class RtorrentControl(ScriptBaseWithConfig):
 
         # Find matching torrents
         view = config.engine.view(self.options.from_view, matcher)
-        matches = list(view.items())
-        orig_matches = matches[:]
-        matches.sort(key=sort_key, reverse=self.options.reverse_sort)
+        if self.options.watch:
+            return self.watch(view, sort_key, selection, actions)
+
+        if self.is_streamable(sort_key, selection, actions):
+            if self.options.json:
+                item_count = self.json_dump(view.items())
+            else:
+                item_count = self.emit_items(view.items(), summary=summary)
+            if not item_count:
+                self.return_code = 44
+            self.LOG.info("Dumped %d out of %d torrents." % (item_count, view.size(),))
+            self.LOG.debug("XMLRPC stats: %s" % config.engine._rpc)
+            return
+
+        if selection and selection[1] > 0 and not self.options.anneal:
+            # Only the first few items are needed
+            if sort_key:
+                matches = sort_key.top(view.items(), selection[1], reverse=self.options.reverse_sort)
+            else:
+                view.limit = selection[1]
+                matches = list(itertools.islice(view.items(), selection[1]))
+        else:
+            matches = list(view.items())
+            orig_matches = matches[:]
+            if sort_key:
+                matches = sort_key.sort(matches, reverse=self.options.reverse_sort)
 
         if self.options.anneal:
             if not self.options.quiet and set(self.options.anneal).difference(
@@ -641,8 +1134,8 @@ class RtorrentControl(ScriptBaseWithConfig):
                 if int(config.fast_query):
                     self.LOG.warn("Using --anneal together with the query optimizer might yield unexpected results!")
             for mode in self.options.anneal:
-                if self.anneal(mode, matches, orig_matches):
-                    matches.sort(key=sort_key, reverse=self.options.reverse_sort)
+                if self.anneal(mode, matches, orig_matches) and sort_key:
+                    matches = sort_key.sort(matches, reverse=self.options.reverse_sort)
 
         if selection:
             matches = matches[selection[0]-1:selection[1]]
@@ -661,17 +1154,10 @@ class RtorrentControl(ScriptBaseWithConfig):
         if self.options.tee_view and (self.options.to_view or self.options.view_only):
             self.show_in_view(view, matches)
 
-        # Generate summary?
-        summary = FieldStatistics(len(matches))
-        if self.options.stats or self.options.summary:
-            for field in self.get_output_fields():
-                try:
-                    0 + getattr(matches[0], field)
-                except (TypeError, ValueError, IndexError):
-                    summary.total[field] = ''
-                else:
-                    for item in matches:
-                        summary.add(field, getattr(item, field))
+        # Generate summary, unless that happens while printing matches
+        if summary is not None and not self.is_console_output(actions):
+            for item in matches:
+                summary.feed(item)
 
         def output_formatter(templ, namespace=None):
             "Output formatting helper"
@@ -681,55 +1167,93 @@ class RtorrentControl(ScriptBaseWithConfig):
                 view=view,
                 query=matcher,
                 matches=matches,
-                summary=summary
+                summary=summary if summary is not None else FieldStatistics(),
             )
             full_ns.update(namespace or {})
             return formatting.expand_template(templ, full_ns)
 
         # Execute action?
         if actions:
+            self.items_changed = not self.options.dry_run
             action = actions[0] # TODO: loop over it
             self.LOG.log(logging.DEBUG if self.options.cron else logging.INFO, "%s %s %d out of %d torrents." % (
                 "Would" if self.options.dry_run else "About to", action.label, len(matches), view.size(),
             ))
             action_results = []
+            action_failures = {}
+            json_writer = None
+            if self.options.json_lines and not self.options.dry_run:
+                json_writer = self.json_writer()  # stream results as they come in
             defaults = {"action": action.label}
             defaults.update(self.FORMATTER_DEFAULTS)
 
+            def json_record(item, results):
+                "Helper to build the JSON record for an action result"
+                if self.raw_output_format == '-':
+                    return results
+                record = dict(item=item, results=results)
+                if item.hash in action_failures:
+                    record["errors"] = action_failures[item.hash]
+                return record
+
+            # Send calls in batches, when there are no prompts in between
+            batched = (not self.options.dry_run and action.get("batched", True)
+                       and (self.options.yes or not self.options.interactive))
+            if batched:
+                config.engine.start_batch()
+
             if self.options.column_headers and matches:
                 self.emit(None, stencil=stencil)
 
             # Perform chosen action on matches
             template_args = [formatting.preparse("{{#tempita}}" + i if "{{" in i else i) for i in action.args]
-            for item in matches:
-                if not self.prompt.ask_bool("%s item %s" % (action.label, item.name)):
-                    continue
-                if (self.options.output_format
-                        and not self.options.view_only
-                        and not self.options.json
-                        and str(self.options.output_format) != "-"):
-                    self.emit(item, defaults, to_log=self.options.cron)
-
-                args = tuple([output_formatter(i, namespace=dict(item=item)) for i in template_args])
-
-                if self.options.dry_run:
-                    if self.options.debug:
-                        self.LOG.debug("Would call action %s(*%r)" % (action.method, args))
-                else:
-                    results = getattr(item, action.method)(*args)
-                    if self.options.json:
-                        if self.raw_output_format == '-':
-                            action_results.append(results)
-                        else:
-                            action_results.append(dict(item=item, results=results))
-                    if self.options.flush:
-                        item.flush()
-                    if self.options.view_only:
-                        show_in_client = lambda x: config.engine.open().log(xmlrpc.NOHASH, x)
-                        self.emit(item, defaults, to_log=show_in_client)
-
-            if self.options.json and not self.options.dry_run:
-                self.json_dump(action_results)
+            batch_failures = []
+            try:
+                for item in matches:
+                    if not self.prompt.ask_bool("%s item %s" % (action.label, item.name)):
+                        continue
+                    if (self.options.output_format
+                            and not self.options.view_only
+                            and not self.options.json
+                            and str(self.options.output_format) != "-"):
+                        self.emit(item, defaults, to_log=self.options.cron)
+
+                    args = tuple([output_formatter(i, namespace=dict(item=item)) for i in template_args])
+
+                    if self.options.dry_run:
+                        if self.options.debug:
+                            self.LOG.debug("Would call action %s(*%r)" % (action.method, args))
+                    else:
+                        self.output.flush()  # actions might print, too
+                        results = getattr(item, action.method)(*args)
+                        if self.options.json:
+                            if json_writer and not batched:
+                                json_writer.write(json_record(item, results))
+                            else:
+                                action_results.append((item, results))  # complete after the batch is sent
+                        if self.options.flush:
+                            item.flush()
+                        if self.options.view_only:
+                            show_in_client = lambda x: config.engine.open().log(xmlrpc.NOHASH, x)
+                            self.emit(item, defaults, to_log=show_in_client)
+            finally:
+                if batched:
+                    self.output.flush()
+                    batch_failures = config.engine.flush_batch()
+
+            for item, exc in batch_failures:
+                self.LOG.error(str(exc))
+                action_failures.setdefault(item.hash, []).append(str(exc))
+            if action_failures:
+                self.return_code = error.EX_SOFTWARE
+
+            if json_writer:
+                for item, results in action_results:
+                    json_writer.write(json_record(item, results))
+                json_writer.close()
+            elif self.options.json and not self.options.dry_run:
+                self.output.flush()
+                self.json_dump((json_record(*i) for i in action_results), projection=False)
 
         # Show in ncurses UI?
         elif not self.options.tee_view and (self.options.to_view or self.options.view_only):
@@ -739,6 +1263,7 @@ class RtorrentControl(ScriptBaseWithConfig):
         elif self.options.call or self.options.spawn:
             if self.options.call and self.options.spawn:
                 self.fatal("You cannot mix --call and --spawn")
+            self.items_changed = not self.options.dry_run
 
             template_cmds = []
             if self.options.call:
@@ -748,29 +1273,42 @@ class RtorrentControl(ScriptBaseWithConfig):
                     template_cmds.append([formatting.preparse("{{#tempita}}" + i if "{{" in i else i)
                                           for i in shlex.split(str(cmd))])
 
-            for item in matches:
-                cmds = [[output_formatter(i, namespace=dict(item=item)) for i in k] for k in template_cmds]
-                cmds = [[i.encode('utf-8') if isinstance(i, unicode) else i for i in k] for k in cmds]
-
-                if self.options.dry_run:
-                    self.LOG.info("Would call command(s) %r" % (cmds,))
-                else:
-                    for cmd in cmds:
-                        if self.options.call:
-                            logged_cmd = cmd[0]
-                        else:
-                            logged_cmd = '"%s"' % ('" "'.join(cmd),)
-                        if self.options.verbose:
-                            self.LOG.info("Calling: %s" % (logged_cmd,))
-                        try:
-                            if self.options.call:
-                                subprocess.check_call(cmd[0], shell=True)
-                            else:
-                                subprocess.check_call(cmd)
-                        except subprocess.CalledProcessError, exc:
-                            raise error.UserError("Command failed: %s" % (exc,))
-                        except OSError, exc:
-                            raise error.UserError("Command failed (%s): %s" % (logged_cmd, exc,))
+            def command_jobs():
+                "Generator for the commands of each item"
+                for item in matches:
+                    cmds = [[output_formatter(i, namespace=dict(item=item)) for i in k] for k in template_cmds]
+                    cmds = [[i.encode('utf-8') if isinstance(i, unicode) else i for i in k] for k in cmds]
+                    if self.options.call:
+                        cmds = [k[0] for k in cmds]
+
+                    if self.options.dry_run:
+                        self.LOG.info("Would call command(s) %r" % (cmds,))
+                        continue
+                    if self.options.verbose:
+                        for cmd in cmds:
+                            self.LOG.info("Calling: %s" % (cmd if self.options.call else '"%s"' % ('" "'.join(cmd),),))
+                    yield item.hash, cmds
+
+            self.output.flush()
+            pool = osmagic.CommandPool(jobs=self.options.jobs, ordered=self.options.ordered,
+                                       keep_going=self.options.keep_going, timeout=self.options.timeout,
+                                       shell=bool(self.options.call), output=self.output,
+                                       capture=True if self.resident else None)
+            failures = pool.run(command_jobs())
+            for failure in failures:
+                self.LOG.error(failure)
+            if failures:
+                self.return_code = error.EX_SOFTWARE
+
+        # Write snapshot file?
+        elif self.options.snapshot_out:
+            snapshot_fields = snapshot.default_fields()
+            if self.options.snapshot_fields:
+                snapshot_fields = [i.strip() for i in self.options.snapshot_fields.split(',') if i.strip()]
+            item_count = snapshot.save(self.options.snapshot_out, matches, config.engine,
+                                       view.viewname, snapshot_extras, snapshot_fields)
+            self.LOG.info("Wrote %d out of %d torrents to %s." % (
+                item_count, view.size(), self.options.snapshot_out))
 
         # Dump as JSON array?
         elif self.options.json:
@@ -787,23 +1325,7 @@ class RtorrentControl(ScriptBaseWithConfig):
 
         # Show on console?
         elif self.options.output_format and str(self.options.output_format) != "-":
-            if not self.options.summary:
-                line_count = 0
-                for item in matches:
-                    # Emit a header line every 'output_header_frequency' lines
-                    if self.options.column_headers and line_count % config.output_header_frequency == 0:
-                        self.emit(None, stencil=stencil)
-
-                    # Print matching item
-                    line_count += self.emit(item, self.FORMATTER_DEFAULTS)
-
-            # Print summary?
-            if matches and summary:
-                self.emit(None, stencil=stencil)
-                self.emit(summary.total, item_formatter=lambda i: i.rstrip() + " [SUM of %d item(s)]" % len(matches))
-                self.emit(summary.min, item_formatter=lambda i: i.rstrip() + " [MIN of %d item(s)]" % len(matches))
-                self.emit(summary.average, item_formatter=lambda i: i.rstrip() + " [AVG of %d item(s)]" % len(matches))
-                self.emit(summary.max, item_formatter=lambda i: i.rstrip() + " [MAX of %d item(s)]" % len(matches))
+            self.emit_items(matches, stencil, summary=summary)
 
             self.LOG.info("Dumped %d out of %d torrents." % (len(matches), view.size(),))
         else:
@@ -820,6 +1342,11 @@ class RtorrentControl(ScriptBaseWithConfig):
 def run(): #pragma: no cover
     """ The entry point.
     """
+    prompting = [i for action in RtorrentControl.ACTION_MODES if action.get("interactive") for i in action.options]
+    exit_code = resident.forward(sys.argv[1:], prompting)
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     ScriptBase.setup()
     RtorrentControl().run()
 
@@ -20,8 +20,11 @@
 from __future__ import absolute_import
 
 import sys
+import asyncore
 
-from pyrocore import config
+from pyrocore import config, error
+from pyrocore.util import os, osmagic
+from pyrocore.daemon import events
 from pyrocore.scripts.base import ScriptBase, ScriptBaseWithConfig
 
 
@@ -29,11 +32,20 @@ class RtorrentEventHandler(ScriptBaseWithConfig):
     ### Keep things wrapped to fit under this comment... ##############################
     """
         Handle rTorrent events.
+
+        Events are passed to a resident dispatcher (started via "--serve",
+        or as the "eventd" job of pyrotorque) if one is running, else the
+        handlers configured in "torque.ini" are called directly.
     """
 
     # argument description for the usage information
     ARGS_HELP = "<event> <infohash> [<args>...]"
 
+    OPTIONAL_CFG_FILES = ["torque.ini"]
+
+    # prefix of the dispatcher settings in "torque.ini"
+    JOB_PREFIX = "job.eventd."
+
 
     def add_options(self):
         """ Add program options.
@@ -42,11 +54,63 @@ class RtorrentEventHandler(ScriptBaseWithConfig):
 
         # basic options
         self.add_bool_option("--no-fork", "--fg", help="Don't fork into background (stay in foreground, default for terminal use)")
+        self.add_bool_option("-n", "--dry-run",
+            help="don't call any handlers, just tell which ones would be called")
+
+        # resident dispatcher
+        self.add_bool_option("--serve",
+            help="run as a resident event dispatcher, in the foreground")
+        self.add_value_option("--socket", "PATH",
+            help="path of the dispatcher socket [~/.pyroscope/run/rtevent.sock]")
+        self.add_value_option("--settle", "SECONDS", type="float", default=None,
+            help="time to wait for a burst of events before dispatching them [0.5]")
+
+
+    def job_params(self):
+        """ Return the "job.eventd.*" settings, without the prefix.
+        """
+        return dict((key[len(self.JOB_PREFIX):], val)
+            for key, val in config.torque.items()
+            if key.startswith(self.JOB_PREFIX)
+        )
+
+
+    def serve(self):
+        """ Run as a resident event dispatcher.
+        """
+        if self.args:
+            self.parser.error("No event arguments allowed with --serve")
+
+        params = self.job_params()
+        settle = self.options.settle
+        if settle is None:
+            settle = float(params.get("settle", "0.5"))
+
+        config.engine.open()
+        dispatcher = events.EventDispatcher(events.resolve_handlers(params), engine=config.engine,
+            settle=settle, dry_run=self.options.dry_run)
+        receiver = events.EventReceiver(events.socket_path(self.options.socket or params.get("socket")),
+            dispatcher.queue)
+        self.LOG.info("Receiving events on %s" % (receiver.path,))
+
+        dispatcher.start()
+        try:
+            asyncore.loop(timeout=1.0, use_poll=True)
+        except KeyboardInterrupt as exc:
+            self.LOG.info("Termination request received (%s)" % exc)
+        finally:
+            receiver.handle_close()
+            dispatcher.stop()
+            self.LOG.info("%d events received, %d coalesced, %d handled, %d failed" % (
+                dispatcher.queue.received, dispatcher.queue.coalesced, dispatcher.handled, dispatcher.failed))
 
 
     def mainloop(self):
         """ The main loop.
         """
+        if self.options.serve:
+            return self.serve()
+
         # Print usage if not enough args or bad options
         if len(self.args) < 2:
             self.parser.error("No event type and info hash given!")
@@ -54,9 +118,18 @@ class RtorrentEventHandler(ScriptBaseWithConfig):
         if sys.stdin.isatty():
             self.options.no_fork = True
 
-        # Need to demonize (single-fork) ouselfves here, since otherwise rTorrent dead-locks
+        # Need to demonize ourselves here, since otherwise rTorrent dead-locks
+        # when a handler calls back into it while it waits for us to finish
+        if not self.options.no_fork:
+            daemon_log = os.path.join(config.config_dir, "log", "rtevent.log")
+            osmagic.daemonize(logfile=daemon_log if os.path.exists(os.path.dirname(daemon_log)) else None)
 
-        # TODO: Actually implement something here
+        # No resident dispatcher available, so handle the event right here
+        dispatcher = events.EventDispatcher(events.resolve_handlers(self.job_params()),
+            engine=config.engine, dry_run=self.options.dry_run)
+        dispatcher.dispatch(events.Event(self.args[0], self.args[1].upper(), self.args[2:]))
+        if dispatcher.failed:
+            self.return_code = error.EX_SOFTWARE
 
 
 def run(): #pragma: no cover
@@ -67,4 +140,4 @@ def run(): #pragma: no cover
 
 
 if __name__ == "__main__":
-    run()
+    events.run()
@@ -30,11 +30,6 @@ import textwrap
 import xmlrpclib
 from pprint import pformat
 
-try:
-    import requests
-except ImportError:
-    requests = None
-
 from pyrobase import bencode
 from pyrobase.parts import Bunch
 
@@ -49,7 +44,9 @@ def read_blob(arg):
     if arg == '@-':
         result = sys.stdin.read()
     elif any(arg.startswith('@{}://'.format(x)) for x in {'http', 'https', 'ftp', 'file'}):
-        if not requests:
+        try:
+            import requests
+        except ImportError:
             raise error.UserError("You must 'pip install requests' to support @URL arguments.")
         try:
             response = requests.get(arg[1:])
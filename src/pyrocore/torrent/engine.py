@@ -392,6 +392,12 @@ class TorrentProxy(object):
         )))
 
 
+    def fetched_fields(self):
+        """ Return a copy of the raw field values fetched so far.
+        """
+        return dict(self._fields)
+
+
     def fetch(self, name, engine_name=None):
         """ Get a field on demand.
 
@@ -610,6 +616,7 @@ class TorrentView(object):
         self.engine = engine
         self.viewname = viewname or "default"
         self.matcher = matcher
+        self.limit = None  # hint that only this many matches are consumed
         self._items = None
 
 
@@ -654,13 +661,23 @@ class TorrentView(object):
 
     def items(self):
         """ Get list of download items.
+
+            Items are passed on while they're fetched, so a consumer
+            that stops early saves the remaining work.
         """
-        if self.matcher:
-            for item in self._fetch_items():
+        if self._items is None:
+            items = []
+            for item in self.engine.items(self):
+                items.append(item)
+                if not self.matcher or self.matcher.match(item):
+                    yield item
+            self._items = items
+        elif self.matcher:
+            for item in self._items:
                 if self.matcher.match(item):
                     yield item
         else:
-            for item in self._fetch_items():
+            for item in self._items:
                 yield item
 
 
@@ -706,6 +723,12 @@ class TorrentEngine(object):
         raise NotImplementedError()
 
 
+    def fetch_fields(self, items, names, viewname='default'):
+        """ Fetch the given fields of several items at once, if the engine can do that
+            faster than getting them item by item on first access.
+        """
+
+
     def show(self, items, view=None):
         """ Visualize a set of items (search result), and return the view name.
         """
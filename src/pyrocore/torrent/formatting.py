@@ -22,6 +22,7 @@ from __future__ import absolute_import
 import re
 import sys
 import json
+import heapq
 import operator
 
 from pyrobase import templating
@@ -192,34 +193,9 @@ class OutputMapping(algo.AttributeMapping):
             If the wrapped object is None, the upper-case C{key} (without any modifiers)
             is returned instead, to allow the formatting of a header line.
         """
-        # Check for formatter specifications
-        formatter = None
-        have_raw = False
-        if '.' in key:
-            key, formats = key.split('.', 1)
-            formats = formats.split('.')
-
-            have_raw = formats[0] == "raw"
-            if have_raw:
-                formats = formats[1:]
-
-            for fmtname in formats:
-                try:
-                    fmtfunc = globals()["fmt_"+fmtname]
-                except KeyError:
-                    raise error.UserError("Unknown formatting spec %r for %r" % (fmtname, key))
-                else:
-                    formatter = (lambda val, f=fmtfunc, k=formatter: f(k(val))) if formatter else fmtfunc
-
-        # Check for a field formatter
-        try:
-            field = engine.FieldDefinition.FIELDS[key]
-        except KeyError:
-            if key not in self.defaults and not engine.TorrentProxy.add_manifold_attribute(key):
-                raise error.UserError("Unknown field %r" % (key,))
-        else:
-            if field._formatter and not have_raw:
-                formatter = (lambda val, f=formatter: f(field._formatter(val))) if formatter else field._formatter
+        key, formatter, known = _resolve_field_spec(key)
+        if not known and key not in self.defaults:
+            raise error.UserError("Unknown field %r" % (key,))
 
         if self.obj is None:
             # Return column name
@@ -233,11 +209,173 @@ class OutputMapping(algo.AttributeMapping):
                 raise error.LoggableError("While formatting %s=%r: %s" % (key, val, exc))
 
 
-def preparse(output_format):
+def _resolve_field_spec(key, _cache={}):  # pylint: disable=dangerous-default-value
+    """ Split a field reference like "completed.raw.delta" into its name
+        and a composed formatter function; results are memoized (up to a limit).
+
+        @return: Tuple of field name, formatter (or None), and a flag
+            that tells whether the field name is a known one.
+        @raise UserError: For unknown formatting specs.
+    """
+    try:
+        return _cache[key]
+    except KeyError:
+        pass
+
+    name, formats = key, []
+    have_raw = False
+    if '.' in key:
+        name, formats = key.split('.', 1)
+        formats = formats.split('.')
+
+        have_raw = formats[0] == "raw"
+        if have_raw:
+            formats = formats[1:]
+
+    # Collect format specifier functions, in order of application
+    funcs = []
+    for fmtname in formats:
+        try:
+            funcs.append(globals()["fmt_"+fmtname])
+        except KeyError:
+            raise error.UserError("Unknown formatting spec %r for %r" % (fmtname, name))
+
+    # Check for a field formatter, which is applied first
+    field = engine.FieldDefinition.FIELDS.get(name) or engine.TorrentProxy.add_manifold_attribute(name)
+    if field and field._formatter and not have_raw:
+        funcs.insert(0, field._formatter)
+
+    formatter = None
+    for func in funcs:
+        formatter = (lambda val, f=func, k=formatter: f(k(val))) if formatter else func
+
+    if len(_cache) >= 250:
+        _cache.clear()  # keep long-running processes in check
+    _cache[key] = name, formatter, bool(field)
+    return _cache[key]
+
+
+class CompiledInterpolation(object):
+    """ An interpolation format with all field references resolved in advance,
+        so that formatting an item just means filling in the values.
+    """
+
+    # Matches "%%" escapes, and the mapping keys of conversion specifiers
+    SPEC_RE = re.compile(r"%(?:%|\(([^()]*)\))")
+
+    # Already compiled formats, by interpolation string (cleared when full)
+    CACHE = {}
+
+
+    @classmethod
+    def cached(cls, format_spec):
+        """ Return the compiled form of the given interpolation string or preparsed template.
+        """
+        format_spec = getattr(format_spec, "fmt", format_spec)
+        try:
+            return cls.CACHE[format_spec]
+        except KeyError:
+            if len(cls.CACHE) >= 250:
+                cls.CACHE.clear()  # keep long-running processes in check
+            return cls.CACHE.setdefault(format_spec, cls(format_spec))
+
+
+    def __init__(self, format_spec):
+        """ Parse the interpolation format in C{format_spec}.
+
+            @raise UserError: For unknown formatting specs.
+        """
+        self.fmt = format_spec
+        self.slots = []
+
+        # Replace all "%(key)" references by positional ones
+        parts, pos = [], 0
+        for match in self.SPEC_RE.finditer(format_spec):
+            parts.append(format_spec[pos:match.start()])
+            pos = match.end()
+            if match.group(1) is None:
+                parts.append("%%")
+            else:
+                parts.append('%')
+                self.slots.append(_resolve_field_spec(match.group(1)))
+        parts.append(format_spec[pos:])
+        self.positional = ''.join(parts)
+
+        # Anything else is not supported by mapping interpolation, so leave any errors to that
+        if '%' in self.SPEC_RE.sub('', format_spec):
+            self.positional = None
+
+
+    def __repr__(self):
+        """ Return the original interpolation string.
+        """
+        return "<%s(%r)>" % (self.__class__.__name__, self.fmt)
+
+
+    def format(self, item, defaults=None):
+        """ Return C{item} formatted according to this interpolation format.
+        """
+        if self.positional is None:
+            return self.fmt % OutputMapping(item, defaults)
+
+        defaults = defaults or {}
+        values = []
+        for name, formatter, known in self.slots:
+            if not known and name not in defaults and name != "pc":
+                raise error.UserError("Unknown field %r" % (name,))
+
+            try:
+                val = getattr(item, name)
+            except AttributeError as exc:
+                try:
+                    val = defaults[name]
+                except KeyError:
+                    if name != "pc":
+                        raise AttributeError("%s for %r.%s" % (exc, item, name))
+                    val = '%'
+
+            if formatter:
+                try:
+                    val = formatter(val)
+                except (TypeError, ValueError, KeyError, IndexError, AttributeError) as exc:
+                    raise error.LoggableError("While formatting %s=%r: %s" % (name, val, exc))
+            values.append(val)
+
+        return self.positional % tuple(values)
+
+
+def _template_path(path):
+    """ Resolve the path of a "file:" template reference.
+    """
+    if path.startswith('/'):
+        return '/' + path.lstrip('/')
+    elif path.startswith('~'):
+        return os.path.expanduser(path)
+    else:
+        return os.path.join(config.config_dir, "templates", path)
+
+
+def preparse(output_format, _cache={}):  # pylint: disable=dangerous-default-value
     """ Do any special processing of a template, and return the result.
+
+        Preparsed templates are cached, by their text for inline ones,
+        and by path and modification time for "file:" references.
     """
+    if hasattr(output_format, "__engine__"):
+        return output_format  # already preparsed
+
+    cache_key = output_format
+    if output_format.startswith("file:"):
+        try:
+            template_path = _template_path(output_format[5:])
+            cache_key = (template_path, os.path.getmtime(template_path))
+        except (EnvironmentError, TypeError):
+            cache_key = None  # let preparsing report the problem
+    if cache_key in _cache:
+        return _cache[cache_key]
+
     try:
-        return templating.preparse(output_format, lambda path: os.path.join(config.config_dir, "templates", path))
+        template = templating.preparse(output_format, _template_path)
     except ImportError as exc:
         if "tempita" in str(exc):
             raise error.UserError("To be able to use Tempita templates, install the 'tempita' package (%s)\n"
@@ -247,9 +385,25 @@ def preparse(output_format):
     except IOError as exc:
         raise error.LoggableError("Cannot read template: {}".format(exc))
 
+    if cache_key is not None:
+        if len(_cache) >= 250:
+            _cache.clear()  # keep long-running processes in check
+        _cache[cache_key] = template
+
+    return template
+
+
+def _template_helpers(_cache={}):  # pylint: disable=dangerous-default-value
+    """ Return the formatters and filters made available to templates (built only once).
+    """
+    if not _cache:
+        _cache["helpers"] = Bunch((name.split('_', 1)[1], method)
+            for name, method in globals().items()
+            if name.startswith("fmt_") or name.startswith("filter_")
+        )
+    return _cache["helpers"]
+
 
-# TODO: All constant stuff should be calculated once, make this a class or something
-# Also parse the template only once (possibly in config validation)!
 def expand_template(template, namespace):
     """ Expand the given (preparsed) template.
         Currently, only Tempita templates are supported.
@@ -260,17 +414,10 @@ def expand_template(template, namespace):
         @return: The expanded template.
         @raise LoggableError: In case of typical errors during template execution.
     """
-    # Create helper namespace
-    formatters = dict((name.split('_', 1)[1], method)
-        for name, method in globals().items()
-        if name.startswith("fmt_") or name.startswith("filter_")
-    )
-    helpers = Bunch()
-    helpers.update(formatters)
-
     # Default templating namespace
-    variables = dict(h=helpers, c=config.custom_template_helpers)
-    variables.update(formatters)  # redundant, for backwards compatibility
+    formatters = _template_helpers()
+    variables = dict(formatters)  # redundant, for backwards compatibility
+    variables.update(h=formatters, c=config.custom_template_helpers)
 
     # Provided namespace takes precedence
     variables.update(namespace)
@@ -327,13 +474,13 @@ def format_item(format_spec, item, defaults=None):
         return expand_template(format_spec, namespace)
     else:
         # Interpolation
-        format_spec = getattr(format_spec, "fmt", format_spec)
+        if item is not None:
+            return CompiledInterpolation.cached(format_spec).format(item, defaults)
 
-        if item is None:
-            # For headers, ensure we only have string formats
-            format_spec = re.sub(
-                r"(\([_.a-zA-Z0-9]+\)[-#+0 ]?[0-9]*?)[.0-9]*[diouxXeEfFgG]",
-                lambda m: m.group(1) + 's', format_spec)
+        # For headers, ensure we only have string formats
+        format_spec = re.sub(
+            r"(\([_.a-zA-Z0-9]+\)[-#+0 ]?[0-9]*?)[.0-9]*[diouxXeEfFgG]",
+            lambda m: m.group(1) + 's', getattr(format_spec, "fmt", format_spec))
 
         return format_spec % OutputMapping(item, defaults)
 
@@ -371,8 +518,120 @@ def validate_field_list(fields, allow_fmt_specs=False, name_filter=None):
     return fields
 
 
+class _Descending(object):
+    "Sort key wrapper that inverts the natural order of a value"
+    __slots__ = ("value",)
+
+    def __init__(self, value):
+        "Remember value to be compared"
+        self.value = value
+
+    def __lt__(self, other):
+        "Compare to other key, in reverse"
+        return other.value < self.value
+
+    def __eq__(self, other):
+        "Check for equality"
+        return self.value == other.value
+
+    def __ne__(self, other):
+        "Check for inequality"
+        return self.value != other.value
+
+
+class SortOrder(object):
+    """ Multi-field sort order, with an optional descending flag per field.
+
+        Instances are usable as a plain C{key} function, but L{sort} and
+        L{top} are much faster, since they extract every field only once
+        per item, and keep comparisons on plain values.
+    """
+    NUMERIC_TYPES = (int, long, float)
+
+    def __init__(self, fields, descending=()):
+        """ Set up sort order for the given field names.
+        """
+        self.fields = tuple(fields)
+        self.descending = tuple(i in descending for i in self.fields)
+
+
+    def __call__(self, item):
+        """ Return sort key for a single item.
+        """
+        return tuple(_Descending(getattr(item, field)) if desc else getattr(item, field)
+            for field, desc in zip(self.fields, self.descending))
+
+
+    def _decorate(self, items):
+        """ Extract the sort fields of all items once.
+
+            Returns rows of field values with the item appended, and the
+            effective descending flags per column; numeric descending
+            columns are negated in place, and then count as ascending.
+        """
+        getters = [operator.attrgetter(i) for i in self.fields]
+        rows = [[getter(item) for getter in getters] + [item] for item in items]
+        descending = list(self.descending)
+
+        for idx, desc in enumerate(descending):
+            if desc and all(isinstance(row[idx], self.NUMERIC_TYPES) for row in rows):
+                for row in rows:
+                    row[idx] = -row[idx]
+                descending[idx] = False
+
+        return rows, descending
+
+
+    def _passes(self, descending):
+        """ Group adjacent columns with the same direction into sort passes.
+        """
+        passes = []
+        for idx, desc in enumerate(descending):
+            if passes and passes[-1][1] == desc:
+                passes[-1][0].append(idx)
+            else:
+                passes.append(([idx], desc))
+        return passes
+
+
+    def _sort_rows(self, rows, passes, reverse):
+        """ Sort decorated rows in place, one stable pass per column group.
+        """
+        for indices, desc in reversed(passes):
+            rows.sort(key=operator.itemgetter(*indices), reverse=desc != reverse)
+
+
+    def sort(self, items, reverse=False):
+        """ Return a new list of the given items, in sort order.
+
+            Remaining descending (non-numeric) columns are handled by
+            stable sorting in several passes, from the least significant
+            group of columns to the most significant one.
+        """
+        rows, descending = self._decorate(items)
+        self._sort_rows(rows, self._passes(descending), reverse)
+        return [row[-1] for row in rows]
+
+
+    def top(self, items, count, reverse=False):
+        """ Return the first C{count} items in sort order.
+
+            Items are fed one by one into a heap of at most C{count}
+            entries, so only the best matches so far are kept. Mixed
+            sort directions wrap the descending values in a key object.
+        """
+        descending = [desc != reverse for desc in self.descending]
+        if all(descending) or not any(descending):
+            select = heapq.nlargest if descending[0] else heapq.nsmallest
+            return select(count, items, key=operator.attrgetter(*self.fields))
+
+        getters = [operator.attrgetter(i) for i in self.fields]
+        return heapq.nsmallest(count, items, key=lambda item: tuple(
+            _Descending(getter(item)) if desc else getter(item) for getter, desc in zip(getters, descending)))
+
+
 def validate_sort_fields(sort_fields):
-    """ Make sure the fields in the given list exist, and return sorting key.
+    """ Make sure the fields in the given list exist, and return sort order.
 
         If field names are prefixed with '-', sort order is reversed for that field (descending).
     """
@@ -390,23 +649,4 @@ def validate_sort_fields(sort_fields):
     log.debug("Sorting order is: %s" % ", ".join([('-' if i in descending else '') + i
         for i in sort_fields]))
 
-    # No descending fields?
-    if not descending:
-        return operator.attrgetter(*tuple(sort_fields))
-
-    # Need to provide complex key
-    class Key(object):
-        "Complex sort order key"
-        def __init__(self, obj, *args):
-            "Remember object to be compared"
-            self.obj = obj
-        def __lt__(self, other):
-            "Compare to other key"
-            for field in sort_fields:
-                lhs, rhs = getattr(self.obj, field), getattr(other.obj, field)
-                if lhs == rhs:
-                    continue
-                return rhs < lhs if field in descending else lhs < rhs
-            return False
-
-    return Key
+    return SortOrder(sort_fields, descending)
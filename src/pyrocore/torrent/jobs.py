@@ -23,14 +23,13 @@ try:
 except ImportError:
     import simplejson as json # pylint: disable=F0401
 
-import requests
-from requests.exceptions import RequestException
-
 from pyrobase.parts import Bunch
 from pyrocore import error
 from pyrocore import config as config_ini
 from pyrocore.util import fmt, xmlrpc, pymagic, stats
 
+requests = pymagic.lazy_import("requests")  # pylint: disable=invalid-name
+
 
 def _flux_engine_data(engine):
     """ Return rTorrent data set for pushing to InfluxDB.
@@ -154,7 +153,7 @@ class InfluxDBStats(object):
         try:
             # TODO: Use a session
             requests.post(fluxurl, data=fluxjson, timeout=self.influxdb.timeout)
-        except RequestException, exc:
+        except requests.RequestException, exc:
             self.LOG.info("InfluxDB POST error: {0}".format(exc))
 
 
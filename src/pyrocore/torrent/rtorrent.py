@@ -62,6 +62,14 @@ class RtorrentItem(engine.TorrentProxy):
         """
         observer = kwargs.pop('observer', False)
         args = (self._fields["hash"],) + args
+        if self._engine._batch is not None:
+            # Queue calls, to be sent later via "system.multicall"
+            for call in calls:
+                self._engine._batch.append((self, command, call, args, observer))
+            if len(self._engine._batch) >= self._engine.BATCH_SIZE:
+                self._engine._send_batch()
+            return
+
         try:
             for call in calls:
                 self._engine.LOG.debug("%s%s torrent #%s (%s)" % (
@@ -535,6 +543,13 @@ class RtorrentEngine(engine.TorrentEngine):
         "network.scgi.open_port": "scgi_port",
     }
 
+    # max. number of calls in one batched "system.multicall" request
+    BATCH_SIZE = 500
+
+    # min. and max. number of items fetched in a first page, for views with a limit hint
+    PAGE_SIZE_MIN = 50
+    PAGE_SIZE_MAX = 200
+
     # rTorrent names of fields that never change
     CONSTANT_FIELDS = set((
         "hash", "name", "is_private", "is_multi_file", "tracker_size", "size_bytes",
@@ -585,6 +600,9 @@ class RtorrentEngine(engine.TorrentEngine):
         self._session_dir = None
         self._download_dir = None
         self._item_cache = {}
+        self._item_cache_time = {}
+        self._batch = None
+        self._batch_failures = []
         self.known_throttle_names = {'', 'NULL'}
 
 
@@ -604,6 +622,12 @@ class RtorrentEngine(engine.TorrentEngine):
         if not os.path.isfile(rcfile):
             raise error.UserError("Config file %r doesn't exist!" % (rcfile,))
 
+        # Use result from the config snapshot, if the file didn't change since then
+        snapshot = getattr(config, "_snapshot", None)
+        if snapshot and rcfile in snapshot.data["rtorrent_rc"]:
+            namespace.scgi_url = snapshot.data["rtorrent_rc"][rcfile]
+            return
+
         # Parse the file
         self.LOG.debug("Loading rtorrent config from %r" % (rcfile,))
         rc_vals = Bunch(scgi_local='', scgi_port = '')
@@ -641,6 +665,11 @@ class RtorrentEngine(engine.TorrentEngine):
         # Prefer UNIX domain sockets over TCP sockets
         namespace.scgi_url = rc_vals.scgi_local or rc_vals.scgi_port
 
+        if snapshot:
+            snapshot.add_source(rcfile)
+            snapshot.data["rtorrent_rc"][rcfile] = namespace.scgi_url
+            snapshot.save()
+
 
     def __repr__(self):
         """ Return a representation of internal state.
@@ -739,6 +768,67 @@ class RtorrentEngine(engine.TorrentEngine):
         return [result_type(*x) for x in items]
 
 
+    def expire_cache(self, max_age=0):
+        """ Drop cached items of views that were fetched C{max_age} or more seconds ago.
+        """
+        now = time.time()
+        for viewname, fetch_time in self._item_cache_time.items():
+            if now - fetch_time >= max_age:
+                self.LOG.debug("Dropping cached items of view %r (%.1f secs old)" % (viewname, now - fetch_time))
+                del self._item_cache[viewname]
+                del self._item_cache_time[viewname]
+
+
+    def start_batch(self):
+        """ Queue item changes from now on, and send them in chunks
+            of 'BATCH_SIZE' calls via "system.multicall".
+        """
+        self._batch = []
+        self._batch_failures = []
+
+
+    def _send_batch(self):
+        """ Send all queued calls in one multicall request.
+        """
+        calls, self._batch[:] = self._batch[:], []
+        if not calls:
+            return
+
+        multicall_args = []
+        for _, _, call, args, _ in calls:
+            if call.startswith(':') or call[:2].endswith('.'):
+                call = call.lstrip(':')
+            else:
+                call = 'd.' + call
+            multicall_args.append(dict(methodName=call, params=list(args)))
+
+        try:
+            results = self.open().system.multicall(multicall_args)
+        except xmlrpc.ERRORS as exc:
+            raise error.EngineError("While sending %d batched calls to %r: %s" % (len(calls), self, exc))
+
+        for (item, command, call, args, observer), result in zip(calls, results):
+            self.LOG.debug("%s%s torrent #%s (%s)" % (command[0].upper(), command[1:], args[0], call))
+            if isinstance(result, dict):
+                self._batch_failures.append((item, error.EngineError("While %s torrent #%s: %s" % (
+                    command, args[0], result.get("faultString", result)))))
+            elif observer:
+                observer(result[0])
+
+
+    def flush_batch(self):
+        """ Send remaining queued calls, and stop batching.
+
+            @return: List of C{(item, exc)} tuples for failed calls.
+        """
+        try:
+            self._send_batch()
+            return self._batch_failures
+        finally:
+            self._batch = None
+            self._batch_failures = []
+
+
     def log(self, msg):
         """ Log a message in the torrent client.
         """
@@ -781,6 +871,8 @@ class RtorrentEngine(engine.TorrentEngine):
 
             # Fetch items
             items = []
+            fetch_time = time.time()
+            pre_filter = None
             try:
                 # Prepare multi-call arguments
                 args = ["d.%s%s" % ("" if field.startswith("is_") else "get_", field)
@@ -795,20 +887,27 @@ class RtorrentEngine(engine.TorrentEngine):
                             for field in args]
                     raw_items = [[i[0] for i in multi_call(args)]]
                 else:
-                    multi_call = self.open().d.multicall
-                    args = [view.viewname] + [field if '=' in field else field + '=' for field in args]
                     if view.matcher and int(config.fast_query):
                         pre_filter = matching.unquote_pre_filter(view.matcher.pre_filter())
                         self.LOG.info("!!! pre-filter: {}".format(pre_filter or 'N/A'))
+
+                    if view.limit and not pre_filter:
+                        # Only the first few matches are needed, so fetch page by page
+                        multi_call = self.open().system.multicall
+                        raw_items = self._fetch_pages(view, args)
+                    else:
+                        multi_call = self.open().d.multicall
+                        args = [view.viewname] + [field if '=' in field else field + '=' for field in args]
                         if pre_filter:
                             multi_call = self.open().d.multicall.filtered
                             args.insert(1, pre_filter)
-                    raw_items = multi_call(*tuple(args))
+                        raw_items = multi_call(*tuple(args))
 
                 ##self.LOG.debug("multicall %r" % (args,))
                 ##import pprint; self.LOG.debug(pprint.pformat(raw_items))
-                self.LOG.debug("Got %d items with %d attributes from %r [%s]" % (
-                    len(raw_items), len(prefetch), self.engine_id, multi_call))
+                if isinstance(raw_items, list):
+                    self.LOG.debug("Got %d items with %d attributes from %r [%s]" % (
+                        len(raw_items), len(prefetch), self.engine_id, multi_call))
 
                 for item in raw_items:
                     items.append(RtorrentItem(self, zip(
@@ -819,14 +918,92 @@ class RtorrentEngine(engine.TorrentEngine):
                 raise error.EngineError("While getting download items from %r: %s" % (self, exc))
 
             # Everything yielded, store for next iteration
-            if cache:
+            # (unless only a pre-filtered subset was fetched)
+            if cache and not pre_filter:
                 self._item_cache[view.viewname] = items
+                self._item_cache_time[view.viewname] = fetch_time
         else:
             # Yield prefetched results
             for item in self._item_cache[view.viewname]:
                 yield item
 
 
+    def _getter_command(self, name):
+        """ Return the "d.multicall" command that gets the given field like L{RtorrentItem.fetch},
+            or C{None} for fields derived from others.
+        """
+        if name.startswith("custom_"):
+            key = name[7:]
+            return "d.custom%s=" % key if len(key) == 1 and key in "12345" else "d.custom=" + key
+
+        field = engine.FieldDefinition.FIELDS.get(name)
+        if not isinstance(field, engine.OnDemandField) or name in ("done", "files") or name.startswith("kind_"):
+            return None
+        elif name.startswith("d_"):
+            return "d.%s=" % (field._engine_name or name)[2:]
+
+        getter_name = field._engine_name or self.PYRO2RT_MAPPING.get(name, name)
+        return "d.%s=" % getter_name[1:] if getter_name[0] == '=' else "d.get_%s=" % getter_name
+
+
+    def fetch_fields(self, items, names, viewname='default'):
+        """ Fetch the given fields of items on a view with one "d.multicall",
+            instead of one call per item and field on first access.
+
+            If the call fails, e.g. due to a command unknown to the client,
+            the fields are fetched on demand as before.
+        """
+        commands = [(name, self._getter_command(name)) for name in names
+                    if any(name not in item._fields for item in items)]
+        commands = [(name, command) for name, command in commands if command]
+        if not commands:
+            return
+
+        try:
+            rows = self.open().d.multicall(self._resolve_viewname(viewname) or 'default', "d.get_hash=",
+                                           *[command for _, command in commands], fail_silently=True)
+        except xmlrpc.ERRORS as exc:
+            self.LOG.debug("Fetching %d fields in one call failed, getting them on demand (%s)" % (len(commands), exc))
+            return
+
+        values = dict((row[0], row[1:]) for row in rows)
+        for item in items:
+            for (name, _), val in zip(commands, values.get(item._fields["hash"], ())):
+                item._fields.setdefault(name, val)
+
+
+    def _fetch_pages(self, view, fields):
+        """ Yield raw field values of the items on a view, fetching a first page
+            via "system.multicall", so that the rest is never requested when the
+            consumer stops early. If more items are needed (i.e. the filter is
+            selective), the remainder comes from one "d.multicall" over the view,
+            since paging would take many calls with one entry per item and field.
+        """
+        proxy = self.open()
+        hashes = proxy.download_list(xmlrpc.NOHASH, view.viewname)
+        calls = [(field.rsplit('=', 1)[0], field.rsplit('=', 1)[1].split(',') if '=' in field else [])
+                 for field in fields]
+
+        page = hashes[:min(max(self.PAGE_SIZE_MIN, 2 * view.limit), self.PAGE_SIZE_MAX)]
+        self.LOG.debug("Fetching %d items with %d attributes from %r, %d left" % (
+            len(page), len(calls), self.engine_id, len(hashes) - len(page)))
+        results = proxy.system.multicall([dict(methodName=name, params=[infohash] + params)
+                                          for infohash in page for name, params in calls])
+        for idx in range(len(page)):
+            values = results[idx * len(calls):(idx + 1) * len(calls)]
+            if any(isinstance(i, dict) for i in values):
+                continue  # item was removed in the meantime
+            yield [i[0] for i in values]
+
+        if len(page) < len(hashes):
+            self.LOG.debug("Fetching remaining items with %d attributes from %r" % (len(calls), self.engine_id))
+            seen = set(page)
+            hash_idx = fields.index("d.get_hash")
+            for values in proxy.d.multicall(view.viewname, *[i if '=' in i else i + '=' for i in fields]):
+                if values[hash_idx] not in seen:
+                    yield values
+
+
     def show(self, items, view=None, append=False, disjoin=False):
         """ Visualize a set of items (search result), and return the view name.
         """
@@ -0,0 +1,334 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Offline snapshots of download items.
+
+    A snapshot is a SQLite database with one column per fetched field,
+    and optionally the file lists and announce URLs of the items.
+    The L{SnapshotEngine} serves such a file like a (read-only)
+    torrent client, so queries can run without any connection.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+"""
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+from __future__ import absolute_import
+
+import os
+import time
+import sqlite3
+
+from pyrobase.parts import Bunch
+from pyrocore import error
+from pyrocore.util import pymagic
+from pyrocore.torrent import engine, rtorrent
+
+
+log = pymagic.get_lazy_logger(__name__)
+
+# Version of the database layout
+FORMAT = 1
+
+# Optional parts of a snapshot
+EXTRAS = ("files", "trackers")
+
+# Fields not fetched by default, since they're derived from the extras
+EXTRA_FIELDS = set(("files", "kind", "tracker", "traits"))
+
+# Field value types that can be stored in a column
+SCALAR_TYPES = (basestring, int, long, float)
+
+SCHEMA = """
+    CREATE TABLE meta (key TEXT PRIMARY KEY, value);
+    CREATE TABLE files (hash TEXT, idx INTEGER, path TEXT, size INTEGER,
+                        mtime REAL, prio INTEGER, created INTEGER, opened INTEGER);
+    CREATE TABLE trackers (hash TEXT, idx INTEGER, url TEXT);
+"""
+
+
+def _text(data):
+    """ Decode text like the XMLRPC layer does, i.e. ASCII stays a byte string.
+    """
+    try:
+        data.decode("ascii")
+    except UnicodeError:
+        return data.decode("utf-8")
+    else:
+        return data
+
+
+def _quote(name):
+    "Quote a field name for use as a column name"
+    if '"' in name:
+        raise ValueError("Bad field name %r" % (name,))
+    return '"%s"' % name
+
+
+def default_fields():
+    """ Return the names of all fields stored by default, i.e. all fields
+        defined at the time of the call, except those derived from L{EXTRAS}.
+    """
+    return sorted(set(engine.FieldDefinition.FIELDS) - EXTRA_FIELDS)
+
+
+def save(path, items, engine_=None, viewname="default", extras=(), fields=()):
+    """ Write the given items to a new snapshot file, and return the item count.
+
+        The values of C{fields} are fetched for every item first (in bulk,
+        if C{engine_} is given), and then all fields fetched so far
+        for any of the items become columns.
+        C{extras} can contain "files" and "trackers" to also store
+        those lists, which are then fetched for every item.
+    """
+    unknown = set(extras) - set(EXTRAS)
+    if unknown:
+        raise error.UserError("Unknown snapshot extras %s (use %s)" % (
+            ', '.join(sorted(unknown)), ', '.join(EXTRAS)))
+    unknown = [i for i in fields if not engine.FieldDefinition.lookup(i)]
+    if unknown:
+        raise error.UserError("Unknown snapshot fields %s" % (', '.join(unknown),))
+
+    # Collect field values first, they define the table layout
+    rows, failed, files, trackers = [], set(), [], []
+    wanted, fields = fields, set()
+    if engine_ is not None and wanted:
+        items = list(items)
+        engine_.fetch_fields(items, wanted, viewname)
+    for item in items:
+        for name in wanted:
+            try:
+                getattr(item, name)
+            except error.EngineError as exc:
+                if name not in failed:
+                    log.warn("Field %r is missing for some items in the snapshot (%s)" % (name, exc))
+                    failed.add(name)
+        values = dict((key, val) for key, val in item.fetched_fields().items()
+                      if isinstance(key, basestring) and isinstance(val, SCALAR_TYPES))
+        if "files" in extras:
+            files.extend((values["hash"], idx, i.path, i.size, i.mtime, i.prio, i.created, i.opened)
+                         for idx, i in enumerate(item.fetch("files")))
+        if "trackers" in extras:
+            trackers.extend((values["hash"], idx, url)
+                            for idx, url in enumerate(item.announce_urls()))
+        fields.update(values)
+        rows.append(values)
+
+    fields = ["hash"] + sorted(fields - set(["hash"]))
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.executescript(SCHEMA)
+        db.execute("CREATE TABLE items (%s)" % ', '.join(_quote(i) for i in fields))
+        db.executemany("INSERT INTO meta VALUES (?, ?)", sorted(dict(
+            format=FORMAT,
+            created=time.time(),
+            viewname=viewname,
+            extras=','.join(extras),
+            engine_id=getattr(engine_, "engine_id", "N/A"),
+            engine_software=getattr(engine_, "engine_software", "N/A"),
+        ).items()))
+        db.executemany("INSERT INTO items VALUES (%s)" % ', '.join('?' * len(fields)),
+                       ([row.get(i) for i in fields] for row in rows))
+        db.executemany("INSERT INTO files VALUES (?, ?, ?, ?, ?, ?, ?, ?)", files)
+        db.executemany("INSERT INTO trackers VALUES (?, ?, ?)", trackers)
+        db.commit()
+    finally:
+        db.close()
+    os.rename(tmp_path, path)
+
+    return len(rows)
+
+
+class SnapshotItem(rtorrent.RtorrentItem):
+    """ A download item loaded from a snapshot.
+    """
+
+    def _make_it_so(self, command, calls, *args, **kwargs):
+        """ Ignore caching of derived values, refuse all other changes.
+        """
+        if calls != ["custom.set"]:
+            raise error.EngineError("Cannot change items in snapshot %s (while %s torrent #%s)" % (
+                self._engine.path, command, self._fields["hash"]))
+
+
+    def _get_files(self, attrs=None):
+        """ Get the stored list of files.
+        """
+        if attrs:
+            raise error.EngineError("Snapshot %s has no file attributes %s" % (self._engine.path, ', '.join(attrs)))
+        return self._engine.extra("files", self._fields["hash"])
+
+
+    def fetch(self, name, engine_name=None):
+        """ Get a stored field value, or one derived from them.
+        """
+        if isinstance(name, (int, long)):
+            name = "custom_%d" % name
+
+        try:
+            return self._fields[name]
+        except KeyError:
+            if name in ("done", "files") or name.startswith("kind_") and name[5:].isdigit():
+                return super(SnapshotItem, self).fetch(name, engine_name)
+            raise error.EngineError("Field %r of torrent #%s is not contained in snapshot %s" % (
+                name, self._fields["hash"], self._engine.path))
+
+
+    def announce_urls(self, default=[]):  # pylint: disable=dangerous-default-value
+        """ Get the stored list of announce URLs.
+            Returns `default` if no trackers are found at all.
+        """
+        return [i.url for i in self._engine.extra("trackers", self._fields["hash"])] or default
+
+
+class SnapshotView(engine.TorrentView):
+    """ A view on the items in a snapshot.
+    """
+
+    def size(self):
+        """ Total unfiltered size of view.
+        """
+        if self._check_hash_view():
+            return 1
+        else:
+            return len(self.engine.load())
+
+
+class SnapshotEngine(engine.TorrentEngine):
+    """ A read-only torrent backend, serving items from a snapshot file.
+    """
+
+    def __init__(self, path):
+        """ Initialize engine for the given snapshot file.
+        """
+        super(SnapshotEngine, self).__init__()
+        self.path = path
+        self.meta = None
+        self._rpc = None
+        self._db = None
+        self._items = None
+        self._extras = {}
+
+
+    def __repr__(self):
+        """ Return a representation of internal state.
+        """
+        if self.meta:
+            return "%s of %s [%s, view %r, taken %s]" % (
+                self.__class__.__name__, self.engine_id, self.engine_software, self.meta["viewname"],
+                time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(self.meta["created"])),
+            )
+        else:
+            return "%s reading %r" % (self.__class__.__name__, self.path)
+
+
+    def load_config(self, namespace=None, rcfile=None):
+        """ Nothing to configure.
+        """
+
+
+    def open(self):
+        """ Open the snapshot file.
+        """
+        if self._db is not None:
+            return self
+
+        if not os.path.isfile(self.path):
+            raise error.UserError("Snapshot file %r doesn't exist!" % (self.path,))
+        try:
+            self._db = sqlite3.connect(self.path)
+            self._db.text_factory = _text
+            self.meta = dict(self._db.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError as exc:
+            self._db = None
+            raise error.UserError("Bad snapshot file %r (%s)" % (self.path, exc))
+        if self.meta.get("format") != FORMAT:
+            self._db = None
+            raise error.UserError("Snapshot file %r has unsupported format %r" % (self.path, self.meta.get("format")))
+
+        self.engine_id = self.meta["engine_id"]
+        self.engine_software = self.meta["engine_software"]
+        self.LOG.debug(repr(self))
+        return self
+
+
+    def load(self):
+        """ Return the list of all items in the snapshot.
+        """
+        if self._items is None:
+            cursor = self.open()._db.execute("SELECT * FROM items ORDER BY rowid")
+            names = [i[0] for i in cursor.description]
+            self._items = [SnapshotItem(self, [(key, val) for key, val in zip(names, row) if val is not None])
+                           for row in cursor]
+
+        return self._items
+
+
+    def extra(self, kind, infohash):
+        """ Return the stored files or announce URLs of an item.
+        """
+        if kind not in self._extras:
+            if kind not in self.open().meta["extras"].split(','):
+                raise error.EngineError("Snapshot %s was taken without %s" % (self.path, kind))
+            cursor = self._db.execute("SELECT * FROM %s ORDER BY hash, idx" % kind)
+            names = [i[0] for i in cursor.description]
+            self._extras[kind] = {}
+            for row in cursor:
+                record = Bunch(zip(names, row))
+                self._extras[kind].setdefault(record.pop("hash"), []).append(record)
+
+        return self._extras[kind].get(infohash, [])
+
+
+    def log(self, msg):
+        """ Log a message.
+        """
+        self.LOG.info(msg)
+
+
+    def view(self, viewname='default', matcher=None):
+        """ Get list of download items.
+        """
+        return SnapshotView(self, viewname, matcher)
+
+
+    def items(self, view=None, prefetch=None, cache=True):
+        """ Get list of download items.
+
+            The snapshot contains a single view, which can be
+            referred to by its name or as "default".
+        """
+        if view is None:
+            view = SnapshotView(self, "default")
+        elif isinstance(view, basestring):
+            view = SnapshotView(self, view)
+
+        items = self.load()
+        infohash = view._check_hash_view()
+        if infohash:
+            items = [i for i in items if i._fields["hash"] == infohash.upper()]
+        elif view.viewname not in ("default", self.meta["viewname"]):
+            raise error.EngineError("Snapshot %s only contains view %r, not %r" % (
+                self.path, self.meta["viewname"], view.viewname))
+
+        for item in items:
+            yield item
+
+
+    def show(self, items, view=None, append=False, disjoin=False):
+        """ Visualize a set of items (search result), and return the view name.
+        """
+        raise error.EngineError("Cannot show items of snapshot %s in a client" % (self.path,))
@@ -64,7 +64,7 @@ class MetafileHandler(object):
                 # Ignore 0-byte dummy files (Firefox creates these while downloading)
                 self.job.LOG.warn("Ignoring 0-byte metafile %r" % (self.ns.pathname,))
                 return
-            self.metadata = metafile.checked_open(self.ns.pathname)
+            self.metadata, self.ns.info_hash = metafile.checked_open(self.ns.pathname, with_hash=True)
         except EnvironmentError as exc:
             self.job.LOG.error("Can't read metafile %r (%s)" % (
                 self.ns.pathname, str(exc).replace(": %r" % self.ns.pathname, ""),
@@ -74,7 +74,6 @@ class MetafileHandler(object):
             self.job.LOG.error("Invalid metafile %r: %s" % (self.ns.pathname, exc))
             return
 
-        self.ns.info_hash = metafile.info_hash(self.metadata)
         self.ns.info_name = self.metadata["info"]["name"]
         self.job.LOG.info("Loaded %r from metafile %r" % (self.ns.info_name, self.ns.pathname))
 
@@ -19,7 +19,9 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 from __future__ import absolute_import
 
+import time
 import logging
+import threading
 
 log = logging.getLogger(__name__)
 
@@ -89,3 +91,27 @@ class AttributeMapping(object):
                 return self.defaults[key]
             except KeyError:
                 raise AttributeError("%s for %r.%s" % (exc, self.obj, key))
+
+
+class RateLimiter(object):
+    """ Thread-safe limiter for the rate of some amount consumed over time (e.g. bytes per second).
+    """
+
+    def __init__(self, rate):
+        """ Set up limiter for C{rate} units per second.
+        """
+        self.rate = float(rate)
+        self.due = time.time()
+        self.lock = threading.Lock()
+
+
+    def consume(self, amount):
+        """ Account for C{amount} units, and sleep as long as needed to keep the average rate.
+        """
+        with self.lock:
+            now = time.time()
+            self.due = max(self.due, now) + amount / self.rate
+            delay = self.due - now
+
+        if delay > 0:
+            time.sleep(delay)
@@ -0,0 +1,216 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Bencode decoding with byte spans.
+
+    The L{Decoder} here records where the values of a metafile's top-level
+    keys are located in the raw data, so the info hash can be calculated
+    on the raw bytes of the info dict, like a client does.
+    In strict mode, it also makes sure the data is in canonical form,
+    which saves encoding the decoded data again just to compare it.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+"""
+# This program is free software; you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; either version 2 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License along
+# with this program; if not, write to the Free Software Foundation, Inc.,
+# 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+from __future__ import absolute_import
+
+import hashlib
+
+from pyrobase.bencode import BencodeError, bdecode
+
+
+class Skipped(object):
+    """ A value left undecoded by a lazy L{Decoder}.
+    """
+    __slots__ = ("data", "start", "end")
+
+    def __init__(self, data, start, end):
+        """ Refer to the raw value at C{data[start:end]}.
+        """
+        self.data = data
+        self.start = start
+        self.end = end
+
+
+    def __repr__(self):
+        """ Return a representation of the skipped value.
+        """
+        return "<%s %d bytes>" % (self.__class__.__name__, self.end - self.start)
+
+
+    def raw(self):
+        """ Return the raw bencoded value.
+        """
+        return self.data[self.start:self.end]
+
+
+    def value_type(self):
+        """ Return the type of the decoded value (C{str}, C{int}, C{list}, or C{dict}).
+        """
+        return {'i': int, 'l': list, 'd': dict}.get(self.data[self.start:self.start+1], str)
+
+
+    def string_length(self):
+        """ Return the length of a skipped string, without copying it,
+            or C{None} for other types.
+        """
+        if self.value_type() is not str:
+            return None
+        return int(self.data[self.start:self.data.find(':', self.start)], 10)
+
+
+    def decode(self):
+        """ Decode the value now.
+        """
+        return bdecode(self.raw())
+
+    __bencode__ = decode
+
+
+class Decoder(object):
+    """ Decode a bencoded string, recording the byte spans of top-level dict values.
+    """
+
+    def __init__(self, data, strict=False, lazy=()):
+        """ Initialize decoder.
+
+            @param strict: Reject data that is not in canonical form, i.e. has
+                unsorted or duplicate dict keys, or numbers with extra characters.
+            @param lazy: Dict keys with values that are skipped and returned as
+                L{Skipped} objects (e.g. "pieces" and "files"); they're not validated.
+        """
+        self.data = data
+        self.strict = strict
+        self.lazy = frozenset(lazy)
+        self.spans = {}
+
+
+    def _error(self, msg, pos):
+        "Raise a decoding error at the given offset"
+        raise BencodeError("%s at offset %d (%r...)" % (msg, pos, self.data[pos:pos+32]))
+
+
+    def _string(self, pos):
+        "Return start and end of the string at the given offset"
+        colon = self.data.find(':', pos)
+        try:
+            length = int(self.data[pos:colon], 10)
+        except ValueError:
+            length = -1
+        if colon < 0 or length < 0:
+            self._error("Bad string length", pos)
+        if self.strict and str(length) != self.data[pos:colon]:
+            self._error("Non-canonical string length", pos)
+        if colon + 1 + length > len(self.data):
+            self._error("String exceeds the data", pos)
+
+        return colon + 1, colon + 1 + length
+
+
+    def _skip(self, pos):
+        "Return the end offset of the value at C{pos}, without decoding it"
+        kind = self.data[pos:pos+1]
+        if kind == 'l' or kind == 'd':
+            pos += 1
+            while self.data[pos:pos+1] != 'e':
+                pos = self._skip(pos)
+            return pos + 1
+        elif kind.isdigit():
+            return self._string(pos)[1]
+        else:
+            return self._decode(pos, -1)[1]
+
+
+    def _decode(self, pos, depth):
+        "Decode the value at C{pos}, and return it with its end offset"
+        data = self.data
+        kind = data[pos:pos+1]
+
+        if kind.isdigit():
+            start, end = self._string(pos)
+            return data[start:end], end
+
+        elif kind == 'i':
+            end = data.find('e', pos + 1)
+            try:
+                obj = int(data[pos+1:end], 10)
+            except ValueError:
+                end = -1
+            if end < 0:
+                self._error("Bad integer", pos)
+            if self.strict and str(obj) != data[pos+1:end]:
+                self._error("Non-canonical integer", pos)
+            return obj, end + 1
+
+        elif kind == 'l':
+            obj = []
+            pos += 1
+            while data[pos:pos+1] != 'e':
+                item, pos = self._decode(pos, depth + 1)
+                obj.append(item)
+            return obj, pos + 1
+
+        elif kind == 'd':
+            obj = {}
+            key = None
+            pos += 1
+            while data[pos:pos+1] != 'e':
+                if self.strict and not data[pos:pos+1].isdigit():
+                    self._error("Dict key is not a string", pos)
+                last_key = key
+                key, start = self._decode(pos, depth + 1)
+                if self.strict and last_key is not None and key <= last_key:
+                    self._error("Dict key %r out of order" % (key,), pos)
+
+                if key in self.lazy:
+                    pos = self._skip(start)
+                    obj[key] = Skipped(data, start, pos)
+                else:
+                    obj[key], pos = self._decode(start, depth + 1)
+                if depth == 0:
+                    self.spans[key] = (start, pos)
+            return obj, pos + 1
+
+        elif not kind:
+            raise BencodeError("Unexpected end of data at offset %d/%d" % (pos, len(data)))
+        else:
+            self._error("Format error", pos)
+
+
+    def decode(self):
+        """ Decode C{self.data}, and return the deserialized object.
+
+            @raise BencodeError: Invalid data, or trailing junk.
+        """
+        self.spans = {}
+        obj, end = self._decode(0, 0)
+        if end != len(self.data):
+            self._error("Trailing data", end)
+
+        return obj
+
+
+    def raw(self, key):
+        """ Return the raw bencoded value of a top-level dict key.
+        """
+        start, end = self.spans[key]
+        return self.data[start:end]
+
+
+    def info_hash(self):
+        """ Return the info hash calculated on the raw "info" dict, or C{None} if there is none.
+        """
+        if "info" not in self.spans:
+            return None
+        return hashlib.sha1(self.raw("info")).hexdigest().upper()
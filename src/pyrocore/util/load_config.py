@@ -23,8 +23,11 @@ from __future__ import with_statement
 from __future__ import absolute_import
 
 import re
+import sys
 import glob
 import errno
+import marshal
+import hashlib
 import StringIO
 import ConfigParser
 
@@ -66,6 +69,92 @@ def walk_resources(package_or_requirement, resource_name, recurse=True, base='')
             yield base + filename
 
 
+class ConfigSnapshot(object):
+    """ Cache of parsed configuration data, which is only valid as long as
+        none of the files it was derived from are changed, added, or removed.
+    """
+    FORMAT = 1
+
+
+    def __init__(self, path):
+        """ Create snapshot stored at the given path (C{None} disables storing it).
+        """
+        self.path = path
+        self.LOG = pymagic.get_class_logger(self)
+        self.sources = {}
+        self.data = dict(rtorrent_rc={})
+
+
+    @staticmethod
+    def stamp(filename):
+        """ Return a signature of the current state of the given file.
+        """
+        try:
+            stat = os.stat(filename)
+        except EnvironmentError:
+            return None
+        return (stat.st_mtime, stat.st_size)
+
+
+    def add_source(self, filename):
+        """ Record the given file as one the cached data depends upon.
+        """
+        filename = os.path.abspath(filename)
+        self.sources[filename] = self.stamp(filename)
+
+
+    def load(self):
+        """ Load the stored snapshot, if it is still current.
+
+            @return: C{True} if the cached data can be used.
+        """
+        if not self.path:
+            return False
+
+        try:
+            with open(self.path, "rb") as handle:
+                snapshot = marshal.loads(handle.read())
+        except (EnvironmentError, EOFError, ValueError, TypeError) as exc:
+            if getattr(exc, "errno", None) != errno.ENOENT:
+                self.LOG.debug("Ignoring unreadable config snapshot %r (%s)" % (self.path, exc))
+            return False
+
+        if snapshot.get("format") != self.FORMAT or snapshot.get("python") != sys.version:
+            return False
+        for filename, stamp in snapshot["sources"].items():
+            if self.stamp(filename) != stamp:
+                self.LOG.debug("Config snapshot %r is stale, %r changed" % (self.path, filename))
+                return False
+
+        self.sources = snapshot["sources"]
+        self.data = snapshot["data"]
+        return True
+
+
+    def save(self):
+        """ Store the snapshot, replacing any old one atomically.
+        """
+        if not self.path:
+            return
+
+        snapshot = dict(format=self.FORMAT, python=sys.version, sources=self.sources, data=self.data)
+        try:
+            text = marshal.dumps(snapshot)
+        except ValueError as exc:
+            self.LOG.debug("Cannot store config snapshot (%s)" % (exc,))
+            return
+
+        tmp_path = "%s.%d.tmp" % (self.path, os.getpid())
+        try:
+            with open(tmp_path, "wb") as handle:
+                handle.write(text)
+            os.rename(tmp_path, self.path)
+        except EnvironmentError as exc:
+            self.LOG.debug("Cannot store config snapshot %r (%s)" % (self.path, exc))
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
 class ConfigLoader(object):
     """ Populates this module's dictionary with the user-defined configuration values.
     """
@@ -79,9 +168,22 @@ class ConfigLoader(object):
         """
         self.config_dir = config_dir or os.path.join(os.path.expanduser("~"), ".pyroscope")
         self.LOG = pymagic.get_class_logger(self)
+        self.snapshot = None
         self._loaded = False
 
 
+    def _snapshot_path(self, optional_cfg_files):
+        """ Return path of the config snapshot for the given set of files,
+            or C{None} if there is no place to store it.
+        """
+        run_dir = os.path.join(self.config_dir, "run")
+        if not os.path.isdir(run_dir) or os.environ.get("PYRO_CONFIG_SNAPSHOT", "1") == "0":
+            return None
+
+        key = hashlib.md5('\0'.join([os.path.expanduser("~"), self.config_dir] + optional_cfg_files)).hexdigest()
+        return os.path.join(run_dir, "config-%s.snapshot" % key[:12])
+
+
     def _update_config(self, namespace):  # pylint: disable=no-self-use
         """ Inject the items from the given dict into the configuration.
         """
@@ -173,8 +275,16 @@ class ConfigLoader(object):
             if any(i in cfg_file for i in set('/' + os.sep)):
                 continue # skip any non-plain filenames
 
+            resource_name = "data/config/" + cfg_file
+            if self.snapshot:
+                filename = pymagic.resource_path("pyrocore", resource_name)
+                if filename:
+                    self.snapshot.add_source(filename)
+                else:
+                    self.snapshot.path = None  # no way to detect changes
+
             try:
-                defaults = pymagic.resource_string("pyrocore", "data/config/" + cfg_file) #@UndefinedVariable
+                defaults = pymagic.resource_string("pyrocore", resource_name) #@UndefinedVariable
             except IOError as exc:
                 if idx and exc.errno == errno.ENOENT:
                     continue
@@ -190,6 +300,8 @@ class ConfigLoader(object):
         """ Load INI style configuration.
         """
         self.LOG.debug("Loading %r..." % (config_file,))
+        if self.snapshot:
+            self.snapshot.add_source(config_file)
         ini_file = ConfigParser.SafeConfigParser()
         ini_file.optionxform = str # case-sensitive option names
         if ini_file.read(config_file):
@@ -220,18 +332,34 @@ class ConfigLoader(object):
             raise RuntimeError("INTERNAL ERROR: Attempt to load configuration twice!")
 
         try:
-            # Load configuration
-            namespace = {}
-            self._set_defaults(namespace, optional_cfg_files)
-
-            self._load_ini(namespace, os.path.join(self.config_dir, self.CONFIG_INI))
-
-            for cfg_file in optional_cfg_files:
-                if not os.path.isabs(cfg_file):
-                    cfg_file = os.path.join(self.config_dir, cfg_file)
-
-                if os.path.exists(cfg_file):
-                    self._load_ini(namespace, cfg_file)
+            # Use the snapshot of the INI files, if none of them changed
+            self.snapshot = ConfigSnapshot(self._snapshot_path(optional_cfg_files))
+            config._snapshot = self.snapshot  # pylint: disable=protected-access
+            if self.snapshot.load() and "namespace" in self.snapshot.data:
+                namespace = marshal.loads(self.snapshot.data["namespace"])
+            else:
+                # Load configuration
+                namespace = {}
+                self._set_defaults(namespace, optional_cfg_files)
+
+                self._load_ini(namespace, os.path.join(self.config_dir, self.CONFIG_INI))
+
+                for cfg_file in optional_cfg_files:
+                    if not os.path.isabs(cfg_file):
+                        cfg_file = os.path.join(self.config_dir, cfg_file)
+
+                    self.snapshot.add_source(cfg_file)
+                    if os.path.exists(cfg_file):
+                        self._load_ini(namespace, cfg_file)
+
+                self.snapshot.add_source(__file__.replace(".pyc", ".py").replace(".pyo", ".py"))
+                try:
+                    self.snapshot.data["namespace"] = marshal.dumps(namespace)
+                except ValueError as exc:
+                    self.LOG.debug("Not storing config snapshot, configuration cannot be marshalled (%s)" % (exc,))
+                    self.snapshot.path = None  # so the engine doesn't store it either
+                else:
+                    self.snapshot.save()
 
             self._validate_namespace(namespace)
             self._load_py(namespace, namespace["config_script"])
@@ -21,12 +21,17 @@ from __future__ import with_statement
 from __future__ import absolute_import
 from __future__ import unicode_literals
 
+import io
 import re
 import sys
+import json
+import copy
 import time
 import stat
 import math
 import errno
+import bisect
+import binascii
 import pprint
 import fnmatch
 import hashlib
@@ -37,7 +42,15 @@ import six
 from pyrobase import bencode
 from pyrobase.parts import Bunch
 from pyrocore import config, error
-from pyrocore.util import os, fmt, pymagic
+from pyrocore.util import os, fmt, algo, osmagic, pymagic, bencoding
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir # pylint: disable=F0401
+    except ImportError:
+        scandir = None
 
 
 # Allowed characters in a metafile filename or path
@@ -115,12 +128,18 @@ def check_info(info):
     """ Validate info dict.
 
         Raise ValueError if validation fails.
+        Values left undecoded by a lazy decoder only get their type checked,
+        and for "pieces" also the length.
     """
     if not isinstance(info, dict):
         raise ValueError("bad metainfo - not a dictionary")
 
     pieces = info.get("pieces")
-    if not isinstance(pieces, basestring) or len(pieces) % 20 != 0:
+    if isinstance(pieces, bencoding.Skipped):
+        pieces_length = pieces.string_length()
+    else:
+        pieces_length = len(pieces) if isinstance(pieces, basestring) else None
+    if pieces_length is None or pieces_length % 20 != 0:
         raise ValueError("bad metainfo - bad pieces key")
 
     piece_size = info.get("piece length")
@@ -140,6 +159,9 @@ def check_info(info):
         length = info.get("length")
         if not isinstance(length, (int, long)) or length < 0:
             raise ValueError("bad metainfo - bad length")
+    elif isinstance(info.get("files"), bencoding.Skipped):
+        if info["files"].value_type() is not list:
+            raise ValueError("bad metainfo - bad file list")
     else:
         files = info.get("files")
         if not isinstance(files, (list, tuple)):
@@ -349,6 +371,9 @@ def add_fast_resume(meta, datapath):
 
 def info_hash(metadata):
     """ Return info hash as a string.
+
+        This encodes the decoded info dict again, which is only correct for
+        data in canonical form; for a file, use L{bencoding.Decoder.info_hash}.
     """
     return hashlib.sha1(bencode.bencode(metadata['info'])).hexdigest().upper()
 
@@ -368,29 +393,195 @@ def data_size(metadata):
     return total_size
 
 
-def checked_open(filename, log=None, quiet=False):
+def data_files(metadata, datapath):
+    """ Return a list of C{(path, size)} tuples for the data files of a metafile,
+        given the path to its data.
+    """
+    info = metadata["info"]
+    if "length" in info:
+        return [(datapath, info["length"])]
+    else:
+        return [(os.path.join(*([datapath] + i["path"])), i["length"]) for i in info["files"]]
+
+
+def checked_open(filename, log=None, quiet=False, lazy=(), with_hash=False):
     """ Open and validate the given metafile.
         Optionally provide diagnostics on the passed logger, for
         invalid metafiles, which then just cause a warning but no exception.
         "quiet" can supress that warning.
+
+        Values of the dict keys in "lazy" (e.g. "pieces" and "files") are
+        not decoded, see L{bencoding.Decoder}; for those, only their type
+        is checked, and not their content.
+        With "with_hash" set, a tuple of the data and the info hash is returned,
+        calculated on the info dict as stored in the file.
     """
     with open(filename, "rb") as handle:
         raw_data = handle.read()
-    data = bencode.bdecode(raw_data)
 
+    # The canonical form of the data is checked while decoding
+    decoder = bencoding.Decoder(raw_data, strict=True, lazy=lazy)
     try:
+        data = decoder.decode()
         check_meta(data)
-        if raw_data != bencode.bencode(data):
-            raise ValueError("Bad bencoded data - dict keys out of order?")
     except ValueError as exc:
-        if log:
+        if log is not None:
             # Warn about it, unless it's a quiet value query
             if not quiet:
                 log.warn("%r: %s" % (filename, exc))
         else:
             raise
 
-    return data
+        # Badly encoded data still raises an error
+        if isinstance(exc, bencoding.BencodeError):
+            decoder.strict = False
+            data = decoder.decode()
+            try:
+                check_meta(data)
+            except ValueError as check_exc:
+                if not quiet:
+                    log.warn("%r: %s" % (filename, check_exc))
+
+    return (data, decoder.info_hash()) if with_hash else data
+
+
+def piece_ranges(indexes, batch):
+    """ Return a list of C{(first, last)} ranges covering the given sorted piece indexes,
+        each holding at most C{batch} pieces.
+    """
+    ranges = []
+    for idx in indexes:
+        if ranges and ranges[-1][1] == idx and idx - ranges[-1][0] < batch:
+            ranges[-1][1] = idx + 1
+        else:
+            ranges.append([idx, idx + 1])
+
+    return [tuple(i) for i in ranges]
+
+
+class PieceHasher(object):
+    """ Split a stream of data into pieces, and hash them.
+    """
+
+    def __init__(self, piece_size, callback):
+        """ Set up hasher, C{callback} is called with C{(filename, digest, length)} for each piece.
+        """
+        self.piece_size = piece_size
+        self.callback = callback
+        self.sha1sum = hashlib.sha1()
+        self.done = 0
+
+
+    def update(self, data, filename):
+        """ Add data (any buffer) read from the given file.
+        """
+        pos = 0
+        while pos < len(data):
+            # Hash rest of piece or data, whatever is smaller
+            count = min(len(data) - pos, self.piece_size - self.done)
+            self.sha1sum.update(data[pos:pos + count]) # bogus pylint: disable=E1101
+            self.done += count
+            pos += count
+
+            # Piece is done
+            if self.done == self.piece_size:
+                self.finish(filename)
+
+
+    def finish(self, filename):
+        """ Complete the current (partial) piece, if there is one.
+        """
+        if self.done:
+            self.callback(filename, self.sha1sum.digest(), self.done) # bogus pylint: disable=E1101
+            self.sha1sum = hashlib.sha1()
+            self.done = 0
+
+
+class PieceCache(object):
+    """ Persistent cache of piece hashes, to avoid re-hashing unchanged files.
+
+        Entries are keyed by the real path of a file, and are only valid while its
+        size, mtime, and inode stay the same. Since pieces are aligned to the whole
+        data stream, an entry holds the hashes of the pieces lying completely within
+        the file, for a given piece size and offset of the file relative to piece borders.
+    """
+
+    # Version of the file layout
+    FORMAT = 1
+
+
+    def __init__(self, path):
+        """ Set up cache stored in the given file.
+        """
+        self.path = path
+        self.entries = {}
+        self.LOG = pymagic.get_class_logger(self)
+        self._stamps = {}
+
+
+    def _key(self, filename):
+        "Return the cache key for a file (or C{None} for names that can't be stored)"
+        key = fmt.to_unicode(os.path.realpath(filename))
+        return key if isinstance(key, six.text_type) else None
+
+
+    def load(self):
+        """ Load the cache file, if there is one.
+        """
+        try:
+            with open(self.path, "rb") as handle:
+                data = json.load(handle)
+        except EnvironmentError:
+            data = {}
+        except ValueError as exc:
+            self.LOG.warning("Ignoring bad hash cache %r (%s)" % (self.path, exc))
+            data = {}
+
+        self.entries = data.get("files", {}) if data.get("format") == self.FORMAT else {}
+        return self
+
+
+    def get(self, filename, piece_size, phase):
+        """ Return the cached hashes of the pieces within the given file, or C{None}.
+
+            The state of the file is remembered, and used by a later L{put};
+            so changes made while hashing invalidate the new entry.
+        """
+        key = self._key(filename)
+        if key is None:
+            return None
+
+        filestat = os.stat(filename)
+        self._stamps[key] = [filestat.st_size, filestat.st_mtime, filestat.st_ino]
+        entry = self.entries.get(key)
+        if not entry or entry["stamp"] != self._stamps[key] \
+                or entry["piece_size"] != piece_size or entry["phase"] != phase:
+            return None
+
+        pieces = binascii.unhexlify(entry["pieces"])
+        return [pieces[i:i+20] for i in range(0, len(pieces), 20)]
+
+
+    def put(self, filename, piece_size, phase, digests):
+        """ Store the hashes of the pieces within the given file.
+        """
+        key = self._key(filename)
+        if key is not None and key in self._stamps:
+            self.entries[key] = dict(stamp=self._stamps[key], piece_size=piece_size, phase=phase,
+                                     pieces=binascii.hexlify(b"".join(digests)).decode("ascii"))
+
+
+    def save(self):
+        """ Atomically write the cache file, dropping entries of files that are gone.
+        """
+        for key in list(self.entries):
+            if not os.path.exists(key):
+                del self.entries[key]
+
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as handle:
+            json.dump(dict(format=self.FORMAT, files=self.entries), handle)
+        os.rename(tmp_path, self.path)
 
 
 class Metafile(object):
@@ -408,15 +599,26 @@ class Metafile(object):
     CHUNK_MIN = 2**15
     CHUNK_MAX = 2**24
 
+    # Amount of data hashed per job, when hashing in parallel
+    JOB_SIZE = 2**24
+
+    # Size of the (reused) read buffer used for hashing
+    READ_SIZE = 2**20
+
 
     def __init__(self, filename, datapath=None):
         """ Initialize metafile.
         """
         self.filename = filename
         self.progress = None
+        self.jobs = 1
+        self.hash_cache = None
+        self.drop_cache = False
+        self.rate_limit = 0
         self.datapath = datapath
         self.ignore = self.IGNORE_GLOB[:]
         self.LOG = pymagic.get_class_logger(self)
+        self._limiter = None
 
 
     def _get_datapath(self):
@@ -462,18 +664,8 @@ class Metafile(object):
 
         # Directory?
         elif os.path.isdir(self.datapath):
-            # Walk the directory tree
-            for dirpath, dirnames, filenames in os.walk(self.datapath): #, followlinks=True):
-                # Don't scan blacklisted directories
-                for bad in dirnames[:]:
-                    if any(fnmatch.fnmatch(bad, pattern) for pattern in self.ignore):
-                        dirnames.remove(bad)
-
-                # Yield all filenames that aren't blacklisted
-                for filename in filenames:
-                    if not any(fnmatch.fnmatch(filename, pattern) for pattern in self.ignore):
-                        #yield os.path.join(dirpath[len(self.datapath)+1:], filename)
-                        yield os.path.join(dirpath, filename)
+            for filename, _ in self._scan(self.datapath, self._ignored()):
+                yield filename
 
         # Single file
         else:
@@ -481,16 +673,324 @@ class Metafile(object):
             yield self.datapath
 
 
+    def _ignored(self):
+        "Return a regex matching all names to ignore"
+        return re.compile('|'.join("(?:%s)" % fnmatch.translate(i) for i in self.ignore) or r"(?!)")
+
+
+    def _scan(self, dirpath, ignored):
+        """ Yield C{(path, size)} for the files below C{dirpath},
+            skipping names (of files and directories) that match C{ignored}.
+
+            Like C{os.walk}, symlinks to directories are not followed.
+        """
+        if scandir is None:
+            for path, dirnames, filenames in os.walk(dirpath):
+                dirnames[:] = [i for i in dirnames if not ignored.match(i)]
+                for filename in filenames:
+                    if not ignored.match(filename):
+                        filename = os.path.join(path, filename)
+                        yield filename, os.path.getsize(filename)
+            return
+
+        # The entries of a directory listing come with cached type and stat info
+        for entry in scandir(dirpath):
+            if ignored.match(entry.name):
+                continue
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    for item in self._scan(entry.path, ignored):
+                        yield item
+            else:
+                yield entry.path, entry.stat().st_size
+
+
+    def manifest(self):
+        """ Return a sorted list of C{(path, size)} tuples for the files in "self.datapath",
+            scanning it only once.
+        """
+        if self._fifo:
+            raise RuntimeError("INTERNAL ERROR: Cannot scan a FIFO!")
+        elif os.path.isdir(self.datapath):
+            return sorted(self._scan(self.datapath, self._ignored()))
+        else:
+            return [(self.datapath, os.path.getsize(self.datapath))]
+
+
     def _calc_size(self):
         """ Get total size of "self.datapath".
         """
-        return sum(os.path.getsize(filename)
-            for filename in self.walk()
-        )
+        return sum(size for _, size in self.manifest())
+
+
+    def _read_data(self, filename, buf, offset, size):
+        """ Read C{size} bytes at C{offset} of a file into the given buffer,
+            and yield memory views of each chunk read, without copying data.
+
+            Chunks fill the buffer front to back, wrapping around at its end,
+            so a buffer of C{size} bytes ends up holding all of the data.
+
+            With C{self.drop_cache} set, data already consumed is evicted from the
+            OS page cache, and C{self.rate_limit} caps the read rate (bytes per second).
+        """
+        view = memoryview(buf)
+        start = 0
+        with io.open(filename, "rb", buffering=0) as handle:
+            osmagic.fadvise(handle.fileno(), offset, size, osmagic.FADV_SEQUENTIAL)
+            if offset:
+                handle.seek(offset)
+            while size > 0:
+                count = handle.readinto(view[start:start + min(size, len(view) - start, self.READ_SIZE)])
+                if not count:
+                    raise IOError(errno.EIO, "File %r changed while hashing it" % (filename,))
+                size -= count
+                yield view[start:start + count]
+                start = (start + count) % len(view)
+
+                if self.drop_cache:
+                    osmagic.fadvise(handle.fileno(), offset, count, osmagic.FADV_DONTNEED)
+                offset += count
+                if self._limiter:
+                    self._limiter.consume(count)
+
+
+    def _range_segments(self, spans, piece_size, first, last):
+        """ Yield C{(filename, offset, count)} for the parts of files making up
+            the pieces C{first} to C{last}-1 of the data described by C{spans},
+            a list of C{(offset, filename, size)} tuples in stream order.
+        """
+        totalsize = spans[-1][0] + spans[-1][2]
+        pos, end = first * piece_size, min(last * piece_size, totalsize)
+        idx = bisect.bisect_right([i[0] for i in spans], pos) - 1
+
+        while pos < end:
+            fileoffset, filename, filesize = spans[idx]
+            count = min(fileoffset + filesize, end) - pos
+            if count > 0:
+                yield filename, pos - fileoffset, count
+                pos += count
+            idx += 1
+
+
+    def _hash_range(self, spans, piece_size, first, last):
+        """ Hash the pieces C{first} to C{last}-1 of the data described by C{spans}.
+
+            Returns a list of C{(filename, digest, length)} tuples, one per piece.
+        """
+        results = []
+        hasher = PieceHasher(piece_size, lambda *piece: results.append(piece))
+        buf = bytearray(self.READ_SIZE)
+
+        for filename, offset, count in self._range_segments(spans, piece_size, first, last):
+            for data in self._read_data(filename, buf, offset, count):
+                hasher.update(data, filename)
+
+        # A partial last piece belongs to the last file, like in a serial run
+        if last * piece_size >= spans[-1][0] + spans[-1][2]:
+            hasher.finish(spans[-1][1])
+
+        return results
+
+
+    def _read_range(self, spans, piece_size, first, last):
+        """ Read the pieces C{first} to C{last}-1 of the data described by C{spans}
+            into a new buffer.
+
+            Returns the buffer, and a list of C{(filename, length)} tuples for its parts.
+        """
+        segments = list(self._range_segments(spans, piece_size, first, last))
+        buf = bytearray(sum(i[2] for i in segments))
+        view = memoryview(buf)
+        pos = 0
+        for filename, offset, count in segments:
+            for _ in self._read_data(filename, view[pos:pos + count], offset, count):
+                pass
+            pos += count
+
+        return buf, [(filename, count) for filename, _, count in segments]
+
+
+    def _hash_buffer(self, buf, segments, piece_size, last_filename=None):
+        """ Hash the pieces in a buffer filled by L{_read_range}; a partial last piece
+            is only completed when C{last_filename} is given.
+
+            Returns a list of C{(filename, digest, length)} tuples, one per piece.
+        """
+        results = []
+        hasher = PieceHasher(piece_size, lambda *piece: results.append(piece))
+        view = memoryview(buf)
+        pos = 0
+        for filename, count in segments:
+            hasher.update(view[pos:pos + count], filename)
+            pos += count
+        if last_filename:
+            hasher.finish(last_filename)
 
+        return results
 
-    def _make_info(self, piece_size, progress, walker, piece_callback=None):
-        """ Create info dict.
+
+    def _device(self, filename):
+        """ Return the ID of the device holding a file, or C{None} if it can't be accessed.
+        """
+        try:
+            return os.stat(filename).st_dev
+        except EnvironmentError:
+            return None
+
+
+    def _hash_ranges(self, spans, piece_size, ranges):
+        """ Hash the given C{(first, last)} piece ranges of the data described by C{spans}.
+
+            With several C{self.jobs}, each device holding data gets one reader thread
+            that reads its ranges sequentially, and hands them to a pool of
+            C{self.jobs} hashing threads; so data spread over several disks is read
+            from all of them at once, without making any disk seek between ranges.
+            Reading and hashing both release the GIL.
+
+            Yields the results of L{_hash_range} for each range, in order.
+        """
+        if self.jobs < 2 or len(ranges) < 2:
+            for first, last in ranges:
+                yield self._hash_range(spans, piece_size, first, last)
+            return
+
+        import threading
+        from six.moves import queue
+        from multiprocessing.pool import ThreadPool
+
+        # Assign ranges to the device their first byte is on
+        totalsize = spans[-1][0] + spans[-1][2]
+        devices = {}
+        for idx, (first, last) in enumerate(ranges):
+            filename = next(self._range_segments(spans, piece_size, first, last))[0]
+            devices.setdefault(self._device(filename), []).append(idx)
+
+        # Buffers in flight are limited to one being read per device, plus one per hashing thread
+        done = queue.Queue()
+        slots = threading.Semaphore(self.jobs + len(devices))
+        stopped = threading.Event()
+        pool = ThreadPool(self.jobs)
+
+        def hash_range(idx, buf, segments):
+            "Hash a range that was read, and hand over the results"
+            try:
+                last_filename = spans[-1][1] if ranges[idx][1] * piece_size >= totalsize else None
+                done.put((idx, self._hash_buffer(buf, segments, piece_size, last_filename)))
+            except Exception as exc:  # pylint: disable=broad-except
+                done.put((idx, exc))
+            finally:
+                slots.release()
+
+        def read_ranges(indexes):
+            "Read the ranges on one device in order, and queue them for hashing"
+            for idx in indexes:
+                slots.acquire()
+                if stopped.is_set():
+                    return
+                try:
+                    buf, segments = self._read_range(spans, piece_size, *ranges[idx])
+                    pool.apply_async(hash_range, (idx, buf, segments))
+                except Exception as exc:  # pylint: disable=broad-except
+                    slots.release()
+                    done.put((idx, exc))
+                    return
+
+        readers = [threading.Thread(target=read_ranges, args=(i,)) for i in devices.values()]
+        self.LOG.debug("Reading %d ranges from %d device(s), hashing with %d threads..." % (
+            len(ranges), len(readers), self.jobs))
+        for reader in readers:
+            reader.daemon = True
+            reader.start()
+
+        # Results come in as they are ready, and are passed on in order
+        results = {}
+        try:
+            for idx in range(len(ranges)):
+                while idx not in results:
+                    try:
+                        key, result = done.get(True, 1.0) # a timeout keeps the wait interruptible
+                    except queue.Empty:
+                        continue
+                    results[key] = result
+                result = results.pop(idx)
+                if isinstance(result, Exception):
+                    raise result
+                yield result
+        finally:
+            # Readers stop after the range they're reading right now
+            stopped.set()
+            for _ in readers:
+                slots.release()
+            pool.terminate()
+            pool.join()
+
+
+    def _hash_spans(self, files, piece_size, progress, piece_callback=None):
+        """ Hash the given C{(path, size)} files in piece-aligned ranges,
+            using C{self.jobs} threads, and return the list of piece hashes.
+
+            With C{self.hash_cache} set, the pieces within unchanged files
+            are taken from that cache, and only the others are hashed.
+        """
+        spans = []
+        totalsize = 0
+        for filename, filesize in files:
+            spans.append((totalsize, filename, filesize))
+            totalsize += filesize
+        if not totalsize:
+            return []
+
+        # Pieces are (filename, digest) tuples, or None when they need hashing
+        piece_count = (totalsize + piece_size - 1) // piece_size
+        pieces = [None] * piece_count
+        cache = None
+        if self.hash_cache:
+            cache = PieceCache(self.hash_cache).load()
+            for fileoffset, filename, _ in spans:
+                digests = cache.get(filename, piece_size, fileoffset % piece_size)
+                first = -(-fileoffset // piece_size)
+                for idx, digest in enumerate(digests or []):
+                    pieces[first + idx] = (filename, digest)
+
+        todo = [i for i, piece in enumerate(pieces) if piece is None]
+        totalhashed = (piece_count - len(todo)) * piece_size
+        if cache:
+            self.LOG.info("Taking %d of %d piece hashes from cache %r" % (piece_count - len(todo), piece_count, cache.path))
+
+        ranges = piece_ranges(todo, max(1, self.JOB_SIZE // piece_size))
+        self.LOG.debug("Hashing %d pieces in %d ranges with %d threads..." % (len(todo), len(ranges), self.jobs))
+
+        # Results come back in order, so piece callbacks see the same sequence as in a serial run
+        done = 0
+        for (first, _), results in six.moves.zip(ranges, self._hash_ranges(spans, piece_size, ranges)):
+            for idx, (filename, digest, length) in enumerate(results):
+                pieces[first + idx] = (filename, digest)
+                totalhashed += length
+            if piece_callback:
+                while done < piece_count and pieces[done] is not None:
+                    piece_callback(*pieces[done])
+                    done += 1
+            if progress:
+                progress(totalhashed, totalsize)
+
+        if piece_callback:
+            for piece in pieces[done:]:
+                piece_callback(*piece)
+        if progress and not ranges:
+            progress(totalhashed, totalsize)
+
+        if cache:
+            for fileoffset, filename, filesize in spans:
+                first, last = -(-fileoffset // piece_size), (fileoffset + filesize) // piece_size
+                if last > first:
+                    cache.put(filename, piece_size, fileoffset % piece_size, [i[1] for i in pieces[first:last]])
+            cache.save()
+
+        return [i[1] for i in pieces]
+
+
+    def _make_info(self, piece_size, progress, files, piece_callback=None):
+        """ Create info dict for the given C{(path, size)} files.
         """
         # These collect the file descriptions and piece hashes
         file_list = []
@@ -498,58 +998,51 @@ class Metafile(object):
 
         # Initialize progress state
         hashing_secs = time.time()
-        totalsize = -1 if self._fifo else self._calc_size()
+        self._limiter = algo.RateLimiter(self.rate_limit) if self.rate_limit else None
+        if not self._fifo:
+            files = list(files)
+        totalsize = -1 if self._fifo else sum(size for _, size in files)
         totalhashed = 0
 
-        # Start a new piece
-        sha1sum = hashlib.sha1()
-        done = 0
-        filename = None
-
-        # Hash all files
-        for filename in walker:
-            # Assemble file info
-            filesize = os.path.getsize(filename)
+        def add_file(filename, filesize):
+            "Assemble file info"
             filepath = filename[len(os.path.dirname(self.datapath) if self._fifo else self.datapath):].lstrip(os.sep)
             file_list.append({
                 "length": filesize,
                 "path": [fmt.to_utf8(x) for x in fmt.to_unicode(filepath).replace(os.sep, '/').split('/')],
             })
-            self.LOG.debug("Hashing %r, size %d..." % (filename, filesize))
+            return filesize
 
-            # Open file and hash it
-            fileoffset = 0
-            handle = open(filename, "rb")
-            try:
-                while fileoffset < filesize:
-                    # Read rest of piece or file, whatever is smaller
-                    chunk = handle.read(min(filesize - fileoffset, piece_size - done))
-                    sha1sum.update(chunk) # bogus pylint: disable=E1101
-                    done += len(chunk)
-                    fileoffset += len(chunk)
-                    totalhashed += len(chunk)
-
-                    # Piece is done
-                    if done == piece_size:
-                        pieces.append(sha1sum.digest()) # bogus pylint: disable=E1101
-                        if piece_callback:
-                            piece_callback(filename, pieces[-1])
-
-                        # Start a new piece
-                        sha1sum = hashlib.sha1()
-                        done = 0
+        def add_piece(filename, digest, _):
+            "Collect a piece hash"
+            pieces.append(digest)
+            if piece_callback:
+                piece_callback(filename, digest)
+
+        # Hash in parallel, or using a cache? (a FIFO must be read as it is written)
+        if (self.jobs > 1 or self.hash_cache) and not self._fifo:
+            totalhashed = sum(add_file(*i) for i in files)
+            pieces = self._hash_spans(files, piece_size, progress, piece_callback)
+
+        # Hash all files, one after the other
+        else:
+            hasher = PieceHasher(piece_size, add_piece)
+            buf = bytearray(self.READ_SIZE)
+            filename = None
+            for filename, filesize in files:
+                add_file(filename, filesize)
+                self.LOG.debug("Hashing %r, size %d..." % (filename, filesize))
+
+                for data in self._read_data(filename, buf, 0, filesize):
+                    hasher.update(data, filename)
+                    totalhashed += len(data)
 
                     # Report progress
                     if progress:
                         progress(totalhashed, totalsize)
-            finally:
-                handle.close()
 
-        # Add hash of partial last piece
-        if done > 0:
-            pieces.append(sha1sum.digest()) # bogus pylint: disable=E1103
-            if piece_callback:
-                piece_callback(filename, pieces[-1])
+            # Add hash of partial last piece
+            hasher.finish(filename)
 
         # Build the meta dict
         metainfo = {
@@ -573,16 +1066,21 @@ class Metafile(object):
         return check_info(metainfo), totalhashed
 
 
-    def _make_meta(self, tracker_url, root_name, private, progress, chunk_min, chunk_max):
-        """ Create torrent dict.
+    def _hash_data(self, progress, chunk_min, chunk_max):
+        """ Choose a piece size, and create the info dict for "self.datapath".
         """
         # Calculate piece size
         if self._fifo:
+            # Paths are read from the FIFO while hashing
+            files = ((i, os.path.getsize(i)) for i in self.walk())
+
             # TODO we need to add a (command line) param, probably for total data size
             # for now, always 1MB
             piece_size_exp = 20
         else:
-            total_size = self._calc_size()
+            # Scan once, the sizes are used for the piece size and hashing
+            files = self.manifest()
+            total_size = sum(size for _, size in files)
             if total_size:
                 piece_size_exp = int(math.log(total_size) / math.log(2)) - 9
             else:
@@ -594,7 +1092,13 @@ class Metafile(object):
         del piece_size_exp  # make unbounded value unavailable
 
         # Build info hash
-        info, totalhashed = self._make_info(piece_size, progress, self.walk() if self._fifo else sorted(self.walk()))
+        return self._make_info(piece_size, progress, files)
+
+
+    def _make_meta(self, tracker_url, root_name, private, info):
+        """ Create torrent dict for one tracker, from a (shared) info dict.
+        """
+        info = copy.deepcopy(info)
 
         # Enforce unique hash per tracker
         info["x_cross_seed"] = hashlib.md5(tracker_url).hexdigest()
@@ -616,7 +1120,7 @@ class Metafile(object):
         #XXX meta["encoding"] = "UTF-8"
 
         # Return validated meta dict
-        return check_meta(meta), totalhashed
+        return check_meta(meta)
 
 
     def create(self, datapath, tracker_urls, comment=None, root_name=None,
@@ -624,6 +1128,8 @@ class Metafile(object):
                      callback=None, chunk_min=0, chunk_max=0):
         """ Create a metafile with the path given on object creation.
             Returns the last metafile dict that was written (as an object, not bencoded).
+
+            The data is hashed only once, also when creating metafiles for several trackers.
         """
         if datapath:
             self.datapath = datapath
@@ -634,7 +1140,7 @@ class Metafile(object):
             tracker_urls = list(tracker_urls)
         multi_mode = len(tracker_urls) > 1
 
-        # TODO add optimization so the hashing happens only once for multiple URLs!
+        targets = []
         for tracker_url in tracker_urls:
             # Lookup announce URLs from config file
             try:
@@ -658,12 +1164,20 @@ class Metafile(object):
                     self.LOG.error("Malformed announce URL %r, skipping!" % (tracker_url,))
                     continue
                 output_name = ''.join(output_name)
+            targets.append((output_name, tracker_url))
 
-            # Hash the data
-            self.LOG.info("Creating %r for %s %r..." % (
-                output_name, "filenames read from" if self._fifo else "data in", self.datapath,
-            ))
-            meta, _ = self._make_meta(tracker_url, root_name, private, progress, chunk_min, chunk_max)
+        if not targets:
+            return None
+
+        # Hash the data
+        self.LOG.info("Creating %s for %s %r..." % (
+            ', '.join(repr(i[0]) for i in targets),
+            "filenames read from" if self._fifo else "data in", self.datapath,
+        ))
+        info, _ = self._hash_data(progress, chunk_min, chunk_max)
+
+        for output_name, tracker_url in targets:
+            meta = self._make_meta(tracker_url, root_name, private, info)
 
             # Add optional fields
             if comment:
@@ -698,13 +1212,86 @@ class Metafile(object):
         check_piece.piece_index = 0
 
         datameta, _ = self._make_info(int(metainfo["info"]["piece length"]), progress,
-            [datapath] if "length" in metainfo["info"] else
-            (os.path.join(*([datapath] + i["path"])) for i in metainfo["info"]["files"]),
-            piece_callback=check_piece
-        )
+            [(i[0], os.path.getsize(i[0])) for i in data_files(metainfo, datapath)], piece_callback=check_piece)
         return datameta["pieces"] == metainfo["info"]["pieces"]
 
 
+    def verify(self, metainfo, datapath, selected=None, states=None, fail_fast=False,
+                     progress=None, callback=None):
+        """ Check piece hashes of a metafile against the given datapath,
+            using up to C{self.jobs} threads.
+
+            Returns the list of piece states (C{True} for OK, C{False} for bad,
+            and C{None} for unchecked), and the list of missing file indexes.
+            Only files sharing a piece with the selected ones can be missing,
+            other files aren't looked at.
+
+            @param selected: Indexes of the files to check (default: all of them);
+                only the pieces overlapping these files are hashed.
+            @param states: Known piece states, e.g. from an interrupted check;
+                pieces that have a state are not hashed again.
+            @param fail_fast: Stop at the first bad piece?
+            @param progress: Called with C{(hashed, total)} byte counts.
+            @param callback: Called with the piece states after each batch of pieces.
+        """
+        if datapath:
+            self.datapath = datapath
+
+        info = metainfo["info"]
+        piece_size = int(info["piece length"])
+        piece_count = len(info["pieces"]) // 20
+        states = list(states or [None] * piece_count)
+        if len(states) != piece_count:
+            raise ValueError("Got %d piece states for %d pieces" % (len(states), piece_count))
+        self._limiter = algo.RateLimiter(self.rate_limit) if self.rate_limit else None
+
+        # Map files into the data stream, and find the pieces to check
+        spans = []
+        wanted = set()
+        offset = 0
+        for idx, (filename, filesize) in enumerate(data_files(metainfo, self.datapath)):
+            spans.append((offset, filename, filesize))
+            if filesize and (selected is None or idx in selected):
+                wanted.update(range(offset // piece_size, (offset + filesize - 1) // piece_size + 1))
+            offset += filesize
+
+        # Pieces of missing or short files are bad without looking
+        missing = []
+        for idx, (start, filename, filesize) in enumerate(spans):
+            pieces = wanted.intersection(range(start // piece_size, (start + filesize - 1) // piece_size + 1)) \
+                     if filesize else None
+            if pieces and (not os.path.isfile(filename) or os.path.getsize(filename) < filesize):
+                missing.append(idx)
+                for piece in pieces:
+                    if states[piece] is None:
+                        states[piece] = False
+        todo = sorted(i for i in wanted if states[i] is None)
+        totalsize = sum(min(piece_size, offset - i * piece_size) for i in todo)
+        totalhashed = 0
+        failed = False
+
+        batches = self._hash_ranges(spans, piece_size, piece_ranges(todo, max(1, self.JOB_SIZE // piece_size)))
+        try:
+            todo = iter(todo)
+            for results in batches:
+                for (filename, digest, length), piece in zip(results, todo):
+                    states[piece] = digest == info["pieces"][piece*20:piece*20+20]
+                    if not states[piece]:
+                        self.LOG.warn("Piece #%d: Hashes differ in file %r" % (piece, filename))
+                        failed = True
+                    totalhashed += length
+                if callback:
+                    callback(states)
+                if progress:
+                    progress(totalhashed, totalsize)
+                if fail_fast and failed:
+                    break
+        finally:
+            batches.close()
+
+        return states, missing
+
+
     def listing(self, masked=True):
         """ List torrent info & contents. Returns a list of formatted lines.
         """
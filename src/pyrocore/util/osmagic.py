@@ -24,9 +24,46 @@ import time
 import errno
 import signal
 import logging
+import tempfile
+import subprocess
 
+from pyrobase.parts import Bunch
+
+from pyrocore import error
 from pyrocore.util import os
 
+# Access pattern advice for "fadvise" (Linux values)
+FADV_NORMAL = 0
+FADV_SEQUENTIAL = 2
+FADV_WILLNEED = 3
+FADV_DONTNEED = 4
+
+_fadvise_call = None
+
+
+def fadvise(fileno, offset, length, advice):
+    """ Announce an access pattern for file data via C{posix_fadvise(2)}
+        (C{length=0} means up to the end of the file).
+
+        Return C{True} if the advice was given, C{False} where that's not supported.
+    """
+    global _fadvise_call  # pylint: disable=global-statement
+
+    if _fadvise_call is None:
+        _fadvise_call = False
+        try:
+            import ctypes
+            import ctypes.util
+
+            libc = ctypes.CDLL(ctypes.util.find_library('c') or "libc.so.6", use_errno=True)
+            _fadvise_call = libc.posix_fadvise64
+            _fadvise_call.argtypes = [ctypes.c_int, ctypes.c_int64, ctypes.c_int64, ctypes.c_int]
+        except (ImportError, OSError, AttributeError):
+            pass
+
+    return bool(_fadvise_call) and _fadvise_call(fileno, offset, length, advice) == 0
+
+
 def _write_pidfile(pidfile):
     """ Write file with current process ID.
     """
@@ -156,3 +193,190 @@ def daemonize(pidfile=None, logfile=None, sync=True):
                 time.sleep(polling[1])
 
     log.debug("Process detached (PID %d)" % os.getpid())
+
+
+class CommandPool(object):
+    """ Run command sequences in a bounded number of child processes.
+
+        Each job is a list of commands run one after the other, and up
+        to C{jobs} of them run concurrently. With more than one job slot,
+        the standard output of a job is collected and written in one piece
+        when it's done, either in job order (C{ordered}), or in completion order.
+    """
+
+    # Limits for the delay between polls of running processes
+    MIN_DELAY = 0.001
+    MAX_DELAY = 0.05
+
+
+    def __init__(self, jobs=1, ordered=False, keep_going=False, timeout=None, shell=False, output=None,
+                 capture=None):
+        """ Set up pool.
+
+            @param jobs: Max. number of concurrent jobs.
+            @param ordered: Write collected output in job order?
+            @param keep_going: Continue with other jobs after a failure?
+            @param timeout: Overall time limit in seconds.
+            @param shell: Commands are shell command lines (else argument lists)?
+            @param output: Stream for collected output (default: stdout).
+            @param capture: Collect output also for a single job slot?
+        """
+        self.LOG = logging.getLogger(__name__ + '.' + self.__class__.__name__)
+        self.jobs = max(1, jobs or 1)
+        self.ordered = ordered
+        self.keep_going = keep_going
+        self.timeout = timeout
+        self.shell = shell
+        self.output = output or sys.stdout
+        self.capture = self.jobs > 1 if capture is None else capture
+        self.failures = []
+        self._collected = {}
+        self._next_index = 0
+
+
+    def _describe(self, cmd):
+        "Helper for loggable command representation"
+        return cmd if self.shell else '"%s"' % ('" "'.join(cmd),)
+
+
+    def _start(self, job):
+        """ Start next command of a job; return False if it cannot be started.
+        """
+        cmd = job.commands.pop(0)
+        job.cmd = cmd
+        try:
+            job.proc = subprocess.Popen(cmd, shell=self.shell, stdout=job.output)
+        except OSError as exc:
+            job.proc = None
+            self.failures.append("Command failed (%s): %s" % (self._describe(cmd), exc))
+            return False
+        return True
+
+
+    def _write(self, handle):
+        "Helper to copy collected output"
+        handle.seek(0)
+        self.output.write(handle.read())
+        handle.close()
+
+
+    def _collect(self, job):
+        """ Write output of a finished job, or keep it until all prior jobs are done.
+        """
+        if job.output is None:
+            return
+        if not self.ordered:
+            self._write(job.output)
+            return
+
+        self._collected[job.index] = job.output
+        while self._next_index in self._collected:
+            self._write(self._collected.pop(self._next_index))
+            self._next_index += 1
+
+
+    def _run_direct(self, jobs):
+        """ Run jobs one after the other, waiting for each command in turn.
+        """
+        for index, (label, commands) in enumerate(jobs):
+            job = Bunch(index=index, label=label, commands=list(commands), cmd=None, proc=None,
+                        output=tempfile.TemporaryFile() if self.capture else None)
+            try:
+                while job.commands and self._start(job):
+                    if job.proc.wait():
+                        self.failures.append("Command failed: %s" % (
+                            subprocess.CalledProcessError(job.proc.returncode, job.cmd),))
+                        break
+            finally:
+                if job.proc and job.proc.returncode is None:
+                    self.LOG.warn("Killing %s (PID %d)" % (self._describe(job.cmd), job.proc.pid))
+                    try:
+                        job.proc.kill()
+                        job.proc.wait()
+                    except OSError:
+                        pass  # already gone
+                self._collect(job)
+
+            if self.failures and not self.keep_going:
+                break
+
+
+    def run(self, jobs):
+        """ Run jobs from the given iterable of C{(label, commands)} tuples,
+            and return the list of failure messages.
+
+            Unless C{keep_going} is set, remaining jobs are killed
+            and a L{error.UserError} raised on the first failure.
+        """
+        if self.jobs == 1 and not self.timeout:
+            # No need to poll, just wait for each command
+            self._run_direct(jobs)
+            if self.failures and not self.keep_going:
+                raise error.UserError(self.failures[0])
+            return self.failures
+
+        pending = enumerate(jobs)
+        running = []
+        exhausted = False
+        deadline = time.time() + self.timeout if self.timeout else None
+        delay = self.MIN_DELAY
+
+        try:
+            while True:
+                # Fill free slots
+                while not exhausted and len(running) < self.jobs and (self.keep_going or not self.failures):
+                    try:
+                        index, (label, commands) = next(pending)
+                    except StopIteration:
+                        exhausted = True
+                        break
+
+                    job = Bunch(index=index, label=label, commands=list(commands), cmd=None, proc=None,
+                                output=tempfile.TemporaryFile() if self.capture else None)
+                    if job.commands and self._start(job):
+                        running.append(job)
+                    else:
+                        self._collect(job)
+
+                if not running or (self.failures and not self.keep_going):
+                    break
+
+                # Check for finished commands
+                finished = False
+                for job in running[:]:
+                    if job.proc.poll() is None:
+                        continue
+                    finished = True
+                    if job.proc.returncode:
+                        self.failures.append("Command failed: %s" % (
+                            subprocess.CalledProcessError(job.proc.returncode, job.cmd),))
+                    elif job.commands and self._start(job):
+                        continue
+                    running.remove(job)
+                    self._collect(job)
+
+                if deadline and time.time() > deadline:
+                    raise error.UserError("Timeout after %.1f seconds, with %d command(s) still running" % (
+                        self.timeout, len(running)))
+
+                if finished:
+                    delay = self.MIN_DELAY
+                else:
+                    time.sleep(delay)
+                    delay = min(2 * delay, self.MAX_DELAY)
+        finally:
+            for job in running:
+                self.LOG.warn("Killing %s (PID %d)" % (self._describe(job.cmd), job.proc.pid))
+                try:
+                    job.proc.kill()
+                    job.proc.wait()
+                except OSError:
+                    pass  # already gone
+                self._collect(job)
+            for index in sorted(self._collected):
+                self._write(self._collected.pop(index))
+
+        if self.failures and not self.keep_going:
+            raise error.UserError(self.failures[0])
+
+        return self.failures
@@ -19,17 +19,65 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 from __future__ import absolute_import
 
+import os
+import sys
 import json
 import logging
-import pkg_resources
+import importlib
 
 from peak.util.proxies import LazyProxy
 
 
-# Create aliases to make pydev / pylint happy
-resource_isdir = pkg_resources.resource_isdir # @UndefinedVariable pylint: disable=E1101
-resource_listdir = pkg_resources.resource_listdir # @UndefinedVariable pylint: disable=E1101
-resource_string = pkg_resources.resource_string # @UndefinedVariable pylint: disable=E1101
+def lazy_import(module_name):
+    """ Return a proxy for the named module, which is only imported on first use.
+
+        Use this for heavy or optional dependencies at module level,
+        so they don't add to the startup time of commands not needing them.
+        A missing module raises C{ImportError} on first attribute access.
+    """
+    return LazyProxy(lambda n=module_name: importlib.import_module(n))
+
+
+def resource_path(package_or_requirement, resource_name):
+    """ Return the filesystem path of a resource in an already imported plain
+        package directory, or C{None} if C{pkg_resources} has to handle it.
+    """
+    module = sys.modules.get(package_or_requirement) if isinstance(package_or_requirement, basestring) else None
+    package_dir = os.path.dirname(getattr(module, "__file__", None) or '')
+    if not package_dir or not os.path.isdir(package_dir):
+        return None  # unknown package, or zipped egg
+    return os.path.join(package_dir, *resource_name.split('/'))
+
+
+def resource_isdir(package_or_requirement, resource_name):
+    """ Is the named resource a directory?
+    """
+    path = resource_path(package_or_requirement, resource_name)
+    if path is None:
+        import pkg_resources
+        return pkg_resources.resource_isdir(package_or_requirement, resource_name)
+    return os.path.isdir(path)
+
+
+def resource_listdir(package_or_requirement, resource_name):
+    """ List the contents of the named resource directory.
+    """
+    path = resource_path(package_or_requirement, resource_name)
+    if path is None:
+        import pkg_resources
+        return pkg_resources.resource_listdir(package_or_requirement, resource_name)
+    return os.listdir(path)
+
+
+def resource_string(package_or_requirement, resource_name):
+    """ Return the named resource's contents as a byte string.
+    """
+    path = resource_path(package_or_requirement, resource_name)
+    if path is None:
+        import pkg_resources
+        return pkg_resources.resource_string(package_or_requirement, resource_name)
+    with open(path, "rb") as handle:
+        return handle.read()
 
 
 def import_name(module_spec, name=None):
@@ -19,7 +19,9 @@
 # 51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 from __future__ import absolute_import
 
+import math
 import time
+from collections import defaultdict
 
 
 def engine_data(engine):
@@ -52,3 +54,142 @@ def engine_data(engine):
     )
 
     return data
+
+
+class QuantileSketch(object):
+    """ Mergeable quantile estimator with bounded relative error.
+
+        Values are counted in logarithmically sized buckets (like in
+        DDSketch), so memory only depends on the range of the values,
+        not their number.
+    """
+
+    def __init__(self, accuracy=0.01):
+        """ Create an empty sketch, with quantiles being accurate
+            within the given relative error.
+        """
+        self.accuracy = accuracy
+        self.gamma = (1 + accuracy) / (1 - accuracy)
+        self.count = 0
+        self.zeros = 0
+        self.min = None
+        self.max = None
+        self.positive = defaultdict(int)
+        self.negative = defaultdict(int)
+        self.integral = True
+        self._log_gamma = math.log(self.gamma)
+
+
+    def __len__(self):
+        "Number of values added"
+        return self.count
+
+
+    def add(self, value):
+        "Add a value"
+        if value > 0:
+            self.positive[int(math.ceil(math.log(value) / self._log_gamma))] += 1
+        elif value < 0:
+            self.negative[int(math.ceil(math.log(-value) / self._log_gamma))] += 1
+        else:
+            self.zeros += 1
+        self.count += 1
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.integral = self.integral and isinstance(value, (int, long))
+
+
+    def merge(self, other):
+        "Add all values of another sketch with the same accuracy"
+        if other.gamma != self.gamma:
+            raise ValueError("Cannot merge sketches of different accuracy (%g vs. %g)"
+                             % (other.accuracy, self.accuracy))
+
+        for key, count in other.positive.items():
+            self.positive[key] += count
+        for key, count in other.negative.items():
+            self.negative[key] += count
+        self.zeros += other.zeros
+        self.count += other.count
+        for value in (other.min, other.max):
+            if value is not None:
+                self.min = value if self.min is None else min(self.min, value)
+                self.max = value if self.max is None else max(self.max, value)
+        self.integral = self.integral and other.integral
+
+
+    def _value(self, key):
+        "Representative value of a bucket"
+        return 2 * self.gamma ** key / (self.gamma + 1)
+
+
+    def quantile(self, fraction):
+        """ Return estimated value at the given quantile (0..1),
+            or C{None} for an empty sketch.
+
+            The estimate is the value at the nearest rank, and never
+            lies outside of the smallest and largest value added.
+        """
+        if not self.count:
+            return None
+
+        rank = max(0, int(math.ceil(fraction * self.count)) - 1)
+        buckets = [(-self._value(key), self.negative[key]) for key in sorted(self.negative, reverse=True)]
+        buckets.append((0, self.zeros))
+        buckets.extend((self._value(key), self.positive[key]) for key in sorted(self.positive))
+
+        seen = 0
+        for value, count in buckets:
+            seen += count
+            if seen > rank:
+                break
+
+        value = min(max(value, self.min), self.max)
+        return int(round(value)) if self.integral else value
+
+
+class Histogram(object):
+    """ Mergeable histogram with power-of-2 sized buckets.
+    """
+
+    def __init__(self):
+        "Create an empty histogram"
+        self.negative = 0
+        self.zeros = 0
+        self.counts = defaultdict(int)
+
+
+    def add(self, value):
+        "Add a value"
+        if value > 0:
+            self.counts[math.frexp(value)[1] - 1] += 1
+        elif value < 0:
+            self.negative += 1
+        else:
+            self.zeros += 1
+
+
+    def merge(self, other):
+        "Add all values of another histogram"
+        for key, count in other.counts.items():
+            self.counts[key] += count
+        self.negative += other.negative
+        self.zeros += other.zeros
+
+
+    def buckets(self):
+        """ Return list of non-empty C{(lower, upper, count)} buckets in ascending order.
+
+            Values are in the range C{lower <= value < upper}, except for
+            zeros, which get a C{(0, 0, count)} bucket, and negative values,
+            which are all in C{(None, 0, count)}.
+        """
+        result = []
+        if self.negative:
+            result.append((None, 0, self.negative))
+        if self.zeros:
+            result.append((0, 0, self.zeros))
+        for key in sorted(self.counts):
+            lower = 1 << key if key >= 0 else 2.0 ** key
+            result.append((lower, lower * 2, self.counts[key]))
+        return result
@@ -18,6 +18,7 @@
     with this program; if not, write to the Free Software Foundation, Inc.,
     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
+import time
 import logging
 import unittest
 
@@ -33,5 +34,15 @@ class AlgoTest(unittest.TestCase):
         pass
 
 
+class RateLimiterTest(unittest.TestCase):
+
+    def test_rate(self):
+        limiter = algo.RateLimiter(1000)
+        started = time.time()
+        for _ in range(5):
+            limiter.consume(40)
+        self.assertTrue(0.15 < time.time() - started < 1.0)
+
+
 if __name__ == "__main__":
     unittest.main()
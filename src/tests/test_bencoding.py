@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Bencode decoder tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from pyrobase import bencode
+from pyrobase.parts import Bunch
+from pyrocore.util import bencoding, metafile
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+class DecoderTest(unittest.TestCase):
+
+    TORRENT = os.path.join(os.path.dirname(__file__), "test.torrent")
+
+    def setUp(self):
+        with open(self.TORRENT, "rb") as handle:
+            self.raw = handle.read()
+
+    def test_metafile(self):
+        decoder = bencoding.Decoder(self.raw, strict=True)
+        data = decoder.decode()
+        self.assertEqual(data, bencode.bdecode(self.raw))
+        self.assertEqual(decoder.raw("info"), bencode.bencode(data["info"]))
+        self.assertEqual(decoder.info_hash(), metafile.info_hash(data))
+
+    def test_values(self):
+        for raw, value in (("i-42e", -42), ("0:", ""), ("l1:ai0ee", ["a", 0]), ("d1:ad1:bleee", {"a": {"b": []}})):
+            self.assertEqual(bencoding.Decoder(raw, strict=True).decode(), value)
+        self.assertEqual(bencoding.Decoder("i5e").info_hash(), None)
+
+    def test_strict(self):
+        for raw in ("i03e", "i-0e", "03:abc", "d1:bi1e1:ai2ee", "d1:ai1e1:ai2ee", "di1ei2ee"):
+            self.assertRaises(bencode.BencodeError, bencoding.Decoder(raw, strict=True).decode)
+            self.assertEqual(bencoding.Decoder(raw).decode(), bencode.bdecode(raw))
+
+    def test_errors(self):
+        for raw in ("", "i1", "ie", "5:abc", "-1:", "l1:a", "x", "i1ei2e", "d1:a"):
+            self.assertRaises(bencode.BencodeError, bencoding.Decoder(raw).decode)
+
+    def test_lazy(self):
+        decoder = bencoding.Decoder(self.raw, strict=True, lazy=("pieces", "files"))
+        data = decoder.decode()
+        full = bencode.bdecode(self.raw)
+        self.assertTrue(isinstance(data["info"]["pieces"], bencoding.Skipped))
+        self.assertEqual(data["info"]["pieces"].decode(), full["info"]["pieces"])
+        self.assertEqual(bencode.bencode(data), self.raw)
+        self.assertEqual(decoder.info_hash(), metafile.info_hash(full))
+
+    def test_skipped_type(self):
+        data = bencoding.Decoder("d1:ai42e1:b3:abc1:cle1:dde1:e0:e", lazy="abcde").decode()
+        self.assertEqual([int, str, list, dict, str], [data[i].value_type() for i in "abcde"])
+        self.assertEqual([None, 3, None, None, 0], [data[i].string_length() for i in "abcde"])
+
+
+class CheckedOpenTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-bencoding-")
+        self.path = os.path.join(self.tmpdir, "test.torrent")
+        self.data = bencode.bread(DecoderTest.TORRENT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_hash(self):
+        data, info_hash = metafile.checked_open(DecoderTest.TORRENT, with_hash=True)
+        self.assertEqual(data, self.data)
+        self.assertEqual(info_hash, metafile.info_hash(self.data))
+
+    def write_unsorted(self):
+        "Write the metafile with its top-level keys in reverse order"
+        with open(self.path, "wb") as handle:
+            handle.write("d%se" % ''.join(bencode.bencode(key) + bencode.bencode(val)
+                                          for key, val in sorted(self.data.items(), reverse=True)))
+
+    def test_unsorted(self):
+        self.write_unsorted()
+        self.assertRaises(ValueError, metafile.checked_open, self.path)
+
+        warnings = []
+        data, info_hash = metafile.checked_open(self.path, log=Bunch(warn=warnings.append), with_hash=True)
+        self.assertEqual(len(warnings), 1)
+        self.assertTrue("out of order" in warnings[0])
+        self.assertEqual(data["info"], self.data["info"])
+        self.assertEqual(info_hash, metafile.info_hash(self.data))
+
+    def test_unsorted_and_invalid(self):
+        del self.data["info"]["piece length"]
+        self.write_unsorted()
+
+        warnings = []
+        metafile.checked_open(self.path, log=Bunch(warn=warnings.append))
+        self.assertEqual(2, len(warnings))
+        self.assertTrue("out of order" in warnings[0])
+        self.assertTrue("piece length" in warnings[1])
+
+    def test_lazy(self):
+        data = metafile.checked_open(DecoderTest.TORRENT, lazy=("pieces", "files"))
+        self.assertTrue(isinstance(data["info"]["pieces"], bencoding.Skipped))
+
+        del self.data["info"]["piece length"]
+        bencode.bwrite(self.path, self.data)
+        self.assertRaises(ValueError, metafile.checked_open, self.path, lazy=("pieces", "files"))
+
+    def test_lazy_pieces(self):
+        self.data["info"]["pieces"] = self.data["info"]["pieces"][:-1]
+        bencode.bwrite(self.path, self.data)
+        self.assertRaises(ValueError, metafile.checked_open, self.path, lazy=("pieces", "files"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,10 +18,17 @@
     with this program; if not, write to the Free Software Foundation, Inc.,
     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
+import os
+import time
+import shutil
 import logging
+import tempfile
 import unittest
 
+from pyrobase.parts import Bunch
 from pyrocore import config
+from pyrocore.torrent import rtorrent
+from pyrocore.util import load_config
 
 log = logging.getLogger(__name__)
 log.trace("module loaded")
@@ -33,5 +40,98 @@ class ConfigTest(unittest.TestCase):
         pass
 
 
+class ConfigSnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.config_dir = tempfile.mkdtemp()
+        os.mkdir(os.path.join(self.config_dir, "run"))
+        self.config_ini = os.path.join(self.config_dir, "config.ini")
+        self.write(self.config_ini, "[ANNOUNCE]\nFOO = http://foo.example.com/announce\n")
+        self.saved_config = dict(vars(config))
+
+    def tearDown(self):
+        vars(config).clear()
+        vars(config).update(self.saved_config)
+        shutil.rmtree(self.config_dir)
+
+    def write(self, path, text):
+        with open(path, "w") as handle:
+            handle.write(text)
+
+    def load(self):
+        loader = load_config.ConfigLoader(self.config_dir)
+        loader.load()
+        return loader
+
+    def test_snapshot(self):
+        path = os.path.join(self.config_dir, "run", "x.snapshot")
+        snapshot = load_config.ConfigSnapshot(path)
+        snapshot.add_source(self.config_ini)
+        snapshot.add_source(self.config_ini + ".missing")
+        snapshot.data["answer"] = 42
+        snapshot.save()
+
+        snapshot = load_config.ConfigSnapshot(path)
+        self.assertTrue(snapshot.load())
+        self.assertEqual(42, snapshot.data["answer"])
+
+        self.write(self.config_ini + ".missing", "")
+        self.assertFalse(load_config.ConfigSnapshot(path).load())
+
+    def test_disabled_snapshot(self):
+        snapshot = load_config.ConfigSnapshot(None)
+        snapshot.save()
+        self.assertFalse(snapshot.load())
+
+    def test_loader(self):
+        loader = self.load()
+        self.assertTrue(os.path.exists(loader.snapshot.path))
+        self.assertIn(self.config_ini, loader.snapshot.sources)
+        self.assertEqual(["http://foo.example.com/announce"], config.announce["FOO"])
+
+        self.assertTrue(load_config.ConfigSnapshot(loader.snapshot.path).load())
+        self.load()
+        self.assertEqual(["http://foo.example.com/announce"], config.announce["FOO"])
+
+        # Change the config, making sure the mtime differs
+        self.write(self.config_ini, "[ANNOUNCE]\nFOO = http://bar.example.com/announce\n")
+        stamp = time.time() + 10
+        os.utime(self.config_ini, (stamp, stamp))
+        self.assertFalse(load_config.ConfigSnapshot(loader.snapshot.path).load())
+        self.load()
+        self.assertEqual(["http://bar.example.com/announce"], config.announce["FOO"])
+
+    def test_unmarshallable_config(self):
+        class Loader(load_config.ConfigLoader):
+            def _load_ini(self, namespace, config_file):
+                super(Loader, self)._load_ini(namespace, config_file)
+                namespace["foo"] = object()
+
+        loader = Loader(self.config_dir)
+        loader.load()
+        self.assertEqual(None, loader.snapshot.path)
+        self.assertEqual([], os.listdir(os.path.join(self.config_dir, "run")))
+        self.assertEqual(["http://foo.example.com/announce"], config.announce["FOO"])
+
+        # The engine must not store the snapshot without the namespace either
+        rcfile = os.path.join(self.config_dir, "rtorrent.rc")
+        self.write(rcfile, "scgi_port = localhost:5000\n")
+        namespace = Bunch(scgi_url="")
+        rtorrent.RtorrentEngine().load_config(namespace, rcfile)
+        self.assertEqual("scgi://localhost:5000", namespace.scgi_url)
+        self.assertEqual([], os.listdir(os.path.join(self.config_dir, "run")))
+
+        Loader(self.config_dir).load()
+        self.assertEqual(["http://foo.example.com/announce"], config.announce["FOO"])
+
+    def test_snapshot_without_namespace(self):
+        loader = self.load()
+        del loader.snapshot.data["namespace"]
+        loader.snapshot.save()
+
+        self.load()
+        self.assertEqual(["http://foo.example.com/announce"], config.announce["FOO"])
+
+
 if __name__ == "__main__":
     unittest.main()
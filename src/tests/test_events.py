@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Event dispatcher tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import sys
+import time
+import shutil
+import logging
+import asyncore
+import subprocess
+import tempfile
+import unittest
+
+from pyrocore import error
+from pyrocore.daemon import events
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+def wait_for_go(engine, event):
+    "Handler that waits for a 'go' file in the directory passed as the event argument"
+    for _ in range(1000):
+        if os.path.exists(os.path.join(event.args[0], "go")):
+            break
+        time.sleep(0.01)
+    with open(os.path.join(event.args[0], "done.tmp"), "w") as handle:
+        handle.write(event.infohash)
+    os.rename(os.path.join(event.args[0], "done.tmp"), os.path.join(event.args[0], "done"))
+
+
+class EventQueueTest(unittest.TestCase):
+
+    def test_coalesce(self):
+        queue = events.EventQueue()
+        self.assertTrue(queue.put("completed", "abc", ["1"]))
+        self.assertTrue(queue.put("erased", "ABC"))
+        self.assertFalse(queue.put("completed", "ABC", ["2"]))
+        self.assertEqual(2, len(queue))
+        self.assertEqual((3, 1), (queue.received, queue.coalesced))
+
+        pending = queue.take()
+        self.assertEqual(["completed", "erased"], [i.name for i in pending])
+        self.assertEqual((2, ["2"]), (pending[0].count, pending[0].args))
+        self.assertEqual(0, len(queue))
+
+    def test_take_timeout(self):
+        self.assertEqual([], events.EventQueue().take(timeout=0.01))
+
+
+class EventDispatcherTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, "rtevent.sock")
+        self.called = []
+        self.old_env = os.environ.get(events.SOCKET_ENV, None)
+        os.environ[events.SOCKET_ENV] = self.path
+
+    def tearDown(self):
+        if self.old_env is None:
+            os.environ.pop(events.SOCKET_ENV, None)
+        else:
+            os.environ[events.SOCKET_ENV] = self.old_env
+        shutil.rmtree(self.tmpdir)
+
+    def handler(self, engine, event):
+        self.called.append((engine, event.name, event.infohash, event.count))
+
+    def test_no_dispatcher(self):
+        self.assertFalse(events.forward(["completed", "ABC"]))
+        self.assertFalse(events.forward(["--help"]))
+
+    def test_forward(self):
+        sock_map = {}
+        queue = events.EventQueue()
+        receiver = events.EventReceiver(self.path, queue, sock_map=sock_map)
+        try:
+            os.environ[events.SOCKET_ENV] = self.path
+            for _ in range(3):
+                self.assertTrue(events.forward(["completed", "abc", "x"]))
+            asyncore.loop(timeout=0.1, use_poll=True, map=sock_map, count=3)
+        finally:
+            receiver.handle_close()
+        self.assertFalse(os.path.exists(self.path))
+
+        pending = queue.take()
+        self.assertEqual(1, len(pending))
+        self.assertEqual(("ABC", 3, ["x"]), (pending[0].infohash, pending[0].count, pending[0].args))
+
+    def test_dispatch(self):
+        dispatcher = events.EventDispatcher(dict(completed=[self.handler]), engine="engine", settle=0)
+        dispatcher.start()
+        dispatcher.queue.put("completed", "abc")
+        dispatcher.queue.put("erased", "abc")
+        dispatcher.stop()
+        self.assertEqual([("engine", "completed", "ABC", 1)], self.called)
+        self.assertEqual((1, 0), (dispatcher.handled, dispatcher.failed))
+
+    def test_failing_handler(self):
+        def broken(engine, event):
+            raise RuntimeError("broken")
+        dispatcher = events.EventDispatcher(dict(completed=[broken, self.handler]))
+        dispatcher.dispatch(events.Event("completed", "ABC"))
+        self.assertEqual((1, 1), (dispatcher.handled, dispatcher.failed))
+
+    def test_resolve_handlers(self):
+        handlers = events.resolve_handlers({
+            "on.completed": "pyrocore.daemon.events:log_event, pyrocore.daemon.events:log_event",
+            "settle": "0.5",
+        })
+        self.assertEqual(["completed"], list(handlers))
+        self.assertEqual([events.log_event] * 2, handlers["completed"])
+        self.assertRaises(error.UserError, events.resolve_handlers, {"on.x": "pyrocore.daemon.events:nope"})
+
+
+class RtEventTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-rtevent-")
+        with open(os.path.join(self.tmpdir, "torque.ini"), "w") as handle:
+            handle.write("[TORQUE]\njob.eventd.on.completed = tests.test_events:wait_for_go\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_fallback_detaches(self):
+        env = dict(os.environ, PYTHONPATH=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        env.pop(events.SOCKET_ENV, None)
+        cmd = [sys.executable, "-c", "from pyrocore.scripts import rtevent; rtevent.run()",
+               "-q", "--config-dir", self.tmpdir, "completed", "abc", self.tmpdir]
+        with open(os.devnull) as stdin:
+            with open(os.path.join(self.tmpdir, "rtevent.log"), "w") as output:
+                exit_code = subprocess.call(cmd, stdin=stdin, stdout=output, stderr=output,
+                                            env=env, close_fds=True)
+        self.assertEqual(0, exit_code)
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir, "done")))  # handler still waiting
+
+        open(os.path.join(self.tmpdir, "go"), "w").close()
+        for _ in range(1000):
+            if os.path.exists(os.path.join(self.tmpdir, "done")):
+                break
+            time.sleep(0.01)
+        with open(os.path.join(self.tmpdir, "done")) as handle:
+            self.assertEqual("ABC", handle.read())
@@ -21,6 +21,8 @@
 import logging
 import unittest
 
+from pyrobase.parts import Bunch
+from pyrocore import error
 from pyrocore.torrent import formatting
 
 log = logging.getLogger(__name__)
@@ -32,6 +34,71 @@ class FormattingTest(unittest.TestCase):
     def test_formatting(self):
         pass
 
+    def test_preparse_is_cached(self):
+        template = formatting.preparse(u"{{d.name}}")
+        self.assertTrue(template is formatting.preparse(u"{{d.name}}"))
+        self.assertTrue(template is formatting.preparse(template))
+
+    def test_expand_template(self):
+        result = formatting.expand_template(u"{{d.name}} {{d.size|sz}} {{h.pathbase(d.name)}}",
+                                            dict(d=Bunch(name=u"/tmp/foo", size=1024)))
+        self.assertEqual(u"/tmp/foo    1.0 KiB foo", result)
+
+
+class CompiledInterpolationTest(unittest.TestCase):
+
+    ITEM = Bunch(name=u"foo", size=1024**2, alias="ABC", ratio=1.5, is_private=True)
+    CASES = [
+        u"%(name)s",
+        u"%(name)s\t%(size.sz)s\t%(alias)-8s|",
+        u"%(ratio)6.2f %% %(is_private)s %(is_private.raw)s",
+        u"%(ratio.pc)d%(pc)s %(now)s",
+        u"no fields, but 100%% literal",
+    ]
+
+    def test_same_as_mapping(self):
+        for case in self.CASES:
+            expected = case % formatting.OutputMapping(self.ITEM, dict(now=0))
+            result = formatting.format_item(formatting.preparse(case), self.ITEM, dict(now=0))
+            self.assertEqual(expected, result)
+
+    def test_is_cached(self):
+        compiled = formatting.CompiledInterpolation.cached(u"%(name)s")
+        self.assertTrue(compiled is formatting.CompiledInterpolation.cached(formatting.preparse(u"%(name)s")))
+
+    def test_cache_is_bounded(self):
+        for i in range(600):
+            formatting.CompiledInterpolation.cached(u"%%(name)s %%(size.sz)s %%(unknown_%d)s" % i)
+        self.assertTrue(0 < len(formatting.CompiledInterpolation.CACHE) <= 250)
+        self.assertTrue(0 < len(formatting._resolve_field_spec.__defaults__[0]) <= 250)
+
+    def test_unknown_spec(self):
+        self.assertRaises(error.UserError, formatting.CompiledInterpolation, u"%(name.nosuchfmt)s")
+
+    def test_unknown_field(self):
+        compiled = formatting.CompiledInterpolation(u"%(nosuchfield)s")
+        self.assertRaises(error.UserError, compiled.format, self.ITEM)
+        self.assertEqual(u"42", compiled.format(self.ITEM, dict(nosuchfield=42)))
+
+
+class SortOrderTest(unittest.TestCase):
+
+    ITEMS = [Bunch(name=name, size=size, alias=alias) for name, size, alias in [
+        (u"b", 3, "X"), (u"a", 3, "Y"), (u"c", 1, "X"), (u"a", 2, "Z"), (u"d", 3, "Y"),
+    ]]
+    CASES = ["name", "-size", "-size,name", "size,-name", "alias,-name,size", "-alias,-size"]
+
+    def reference(self, order, reverse=False):
+        return sorted(self.ITEMS, key=order, reverse=reverse)
+
+    def test_sort(self):
+        for fields in self.CASES:
+            for reverse in (False, True):
+                order = formatting.SortOrder(fields.replace('-', '').split(','),
+                                             [i[1:] for i in fields.split(',') if i.startswith('-')])
+                self.assertEqual(self.reference(order, reverse), order.sort(self.ITEMS, reverse), fields)
+                self.assertEqual(self.reference(order, reverse)[:2], order.top(iter(self.ITEMS), 2, reverse), fields)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Metafile lister tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import sys
+import json
+import shutil
+import logging
+import tempfile
+import unittest
+from StringIO import StringIO
+from collections import OrderedDict
+
+from pyrobase import bencode
+from pyrocore.scripts import lstor
+from pyrocore.util import metafile
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+TORRENT = os.path.join(os.path.dirname(__file__), "test.torrent")
+
+
+def make_lister(*args):
+    "Return a lister with the given command line"
+    lister = lstor.MetafileLister()
+    lister.get_options(list(args))
+    return lister
+
+
+def list_metafile(filename, *args):
+    "List a single metafile with the given command line options"
+    options = make_lister(*args).options
+    return lstor.list_metafile((filename, options, lstor.lazy_keys(options)))
+
+
+class LazyKeysTest(unittest.TestCase):
+
+    def test_lazy(self):
+        for args in (["-o", "__hash__,info.name"], ["-o", "__file__", "-o", "info.piece length"],
+                     ["--ndjson", "-o", "info.name"]):
+            self.assertEqual(("pieces", "files"), lstor.lazy_keys(make_lister(*args).options), args)
+
+    def test_eager(self):
+        for args in ([], ["--raw"], ["--ndjson"], ["-o", "__size__"], ["-o", "info"], ["-o", "info.files"],
+                     ["-o", "__hash__,info.pieces"], ["--json", "-o", "info.name"]):
+            self.assertEqual((), lstor.lazy_keys(make_lister(*args).options), args)
+
+
+class ListMetafileTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-lstor-")
+        self.data = bencode.bread(TORRENT)
+        self.info_hash = metafile.info_hash(self.data)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_listing(self):
+        listing, messages = list_metafile(TORRENT)
+        self.assertEqual([], messages)
+        self.assertTrue("NAME test.torrent" in listing, listing)
+        self.assertTrue(self.info_hash in listing, listing)
+
+    def test_output(self):
+        self.assertEqual(("%s\tlogging.cfg" % self.info_hash, []),
+                         list_metafile(TORRENT, "-o", "__hash__,info.name"))
+        self.assertEqual(("%d\t%s" % (self.data["info"]["length"], TORRENT), []),
+                         list_metafile(TORRENT, "-o", "__size__", "-o", "__file__"))
+
+    def test_missing_field(self):
+        listing, messages = list_metafile(TORRENT, "-o", "info.name,info.nothing")
+        self.assertEqual(None, listing)
+        self.assertEqual(["error"], [level for level, _ in messages])
+        self.assertTrue("'info.nothing' not found" in messages[0][1], messages)
+
+    def test_ndjson(self):
+        listing, messages = list_metafile(TORRENT, "--ndjson", "-o", "info.name,nothing.here", "-o", "__hash__")
+        record = json.loads(listing, object_pairs_hook=OrderedDict)
+        self.assertEqual([], messages)
+        self.assertEqual([("info.name", "logging.cfg"), ("nothing.here", None), ("__hash__", self.info_hash)],
+                         record.items())
+
+        # Values that are not dicts cannot be looked into
+        record = json.loads(list_metafile(TORRENT, "--ndjson", "-o", "info.name.x")[0])
+        self.assertEqual({"info.name.x": None}, record)
+
+    def test_ndjson_full(self):
+        listing, _ = list_metafile(TORRENT, "--ndjson")
+        record = json.loads(listing, object_pairs_hook=OrderedDict)
+        self.assertEqual(sorted(record.keys()), record.keys())
+        self.assertEqual(self.info_hash, record["__hash__"])
+        self.assertEqual(self.data["info"]["length"], record["__size__"])
+        self.assertTrue(record["info"]["pieces"].endswith(" piece hashes>"), record["info"]["pieces"])
+        self.assertEqual(1, len(listing.splitlines()))
+
+    def test_invalid(self):
+        path = os.path.join(self.tmpdir, "broken.torrent")
+        del self.data["info"]["piece length"]
+        bencode.bwrite(path, self.data)
+
+        for args in (["-o", "__hash__,info.name"], ["-o", "__hash__,__size__"]):
+            listing, messages = list_metafile(path, *args)
+            self.assertEqual(None, listing)
+            self.assertEqual(["warning"], [level for level, _ in messages])
+            self.assertTrue("Bad metafile" in messages[0][1], messages)
+
+        listing, messages = list_metafile(path, "-V", "-o", "__hash__,info.name")
+        self.assertEqual("%s\tlogging.cfg" % metafile.info_hash(self.data), listing)
+        self.assertEqual(["warning"], [level for level, _ in messages])
+
+
+class JobsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-lstor-")
+        self.paths = []
+        for i in range(9):
+            self.paths.append(os.path.join(self.tmpdir, "%d.torrent" % i))
+            shutil.copy(TORRENT, self.paths[-1])
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def mainloop(self, *args):
+        "Run the lister's main loop, and return its output lines"
+        lister = make_lister(*args)
+        stdout, sys.stdout = sys.stdout, StringIO()
+        try:
+            try:
+                lister.mainloop()
+            finally:
+                output, sys.stdout = sys.stdout.getvalue(), stdout
+        except SystemExit as exc:
+            return output.splitlines(), exc
+
+        return output.splitlines(), None
+
+    def test_list_metafiles(self):
+        options = make_lister("-o", "__file__").options
+        missing = os.path.join(self.tmpdir, "missing.torrent")
+        results = lstor.list_metafiles([(i, options, ()) for i in (self.paths[0], missing)])
+        self.assertEqual((self.paths[0], []), results[0])
+        self.assertTrue(isinstance(results[1], EnvironmentError), results)
+
+    def test_order(self):
+        for jobs in ("1", "3"):
+            self.assertEqual((self.paths, None), self.mainloop("--jobs", jobs, "-o", "__file__", *self.paths))
+
+    def test_errors(self):
+        with open(self.paths[4], "wb") as handle:
+            handle.write("d4:infoi1ee")
+        os.remove(self.paths[6])
+
+        for jobs in ("1", "3"):
+            output, exc = self.mainloop("--jobs", jobs, "--ndjson", "-o", "__file__", *self.paths)
+            self.assertTrue(exc is not None, jobs)
+            self.assertEqual([self.paths[i] for i in (0, 1, 2, 3, 5)], [json.loads(i)["__file__"] for i in output])
+
+
+if __name__ == "__main__":
+    unittest.main()
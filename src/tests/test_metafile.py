@@ -19,10 +19,16 @@
     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
 
+import os
+import time
 import random
+import shutil
+import hashlib
 import logging
+import tempfile
 import unittest
 
+from pyrocore.util import metafile
 from pyrocore.util.metafile import * #@UnusedWildImport
 
 log = logging.getLogger(__name__)
@@ -57,5 +63,177 @@ class MaskTest(unittest.TestCase):
             self.failIfEqual(expected, randomized)
             self.failUnlessEqual(expected, mask_keys(randomized))
 
+
+class HashingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-metafile-")
+        self.datapath = os.path.join(self.tmpdir, "data")
+        os.mkdir(self.datapath)
+        for idx, size in enumerate((70000, 0, 1, 32768, 100000, 5)):
+            with open(os.path.join(self.datapath, "f%d" % idx), "wb") as handle:
+                handle.write(''.join(chr(random.randint(0, 255)) for _ in range(size)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def make_info(self, jobs, piece_size=2**15, device=None):
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"), self.datapath)
+        torrent.jobs = jobs
+        if device:
+            torrent._device = device
+        torrent.JOB_SIZE = 2 * piece_size
+        calls = []
+        info, totalhashed = torrent._make_info(piece_size, lambda done, total: calls.append((done, total)),
+                                               torrent.manifest(),
+                                               piece_callback=lambda filename, piece: calls.append(filename))
+        return info, totalhashed, calls
+
+    def test_parallel(self):
+        for piece_size in (2**15, 2**16, 2**20):
+            info, totalhashed, calls = self.make_info(1, piece_size)
+            pinfo, ptotalhashed, pcalls = self.make_info(4, piece_size)
+            self.assertEqual(pinfo, info)
+            self.assertEqual(ptotalhashed, totalhashed)
+            self.assertEqual([i for i in pcalls if not isinstance(i, tuple)],
+                             [i for i in calls if not isinstance(i, tuple)])
+            self.assertEqual([i for i in pcalls if isinstance(i, tuple)][-1],
+                             [i for i in calls if isinstance(i, tuple)][-1])
+
+    def test_devices(self):
+        info, totalhashed, calls = self.make_info(1)
+        for device in (lambda filename: filename[-1] in "035", lambda filename: filename[-1]):
+            dinfo, dtotalhashed, dcalls = self.make_info(3, device=device)
+            self.assertEqual(dinfo, info)
+            self.assertEqual(dtotalhashed, totalhashed)
+            self.assertEqual([i for i in dcalls if not isinstance(i, tuple)],
+                             [i for i in calls if not isinstance(i, tuple)])
+
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"))
+        torrent.jobs = 2
+        spans = [(0, os.path.join(self.datapath, "f0"), 70000), (70000, self.datapath + "/missing", 1000)]
+        self.assertRaises(EnvironmentError, list, torrent._hash_ranges(spans, 2**15, [(0, 1), (1, 2), (2, 3)]))
+
+    def test_hash_cache(self):
+        info, _, calls = self.make_info(1)
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"), self.datapath)
+        torrent.hash_cache = os.path.join(self.tmpdir, "cache.json")
+        hashed = []
+        hash_range = torrent._hash_range
+        torrent._hash_range = lambda spans, piece_size, first, last: \
+            hashed.extend(range(first, last)) or hash_range(spans, piece_size, first, last)
+        make_info = lambda: torrent._make_info(2**15, None, torrent.manifest(),
+                                               piece_callback=lambda filename, piece: pcalls.append(filename))
+
+        pcalls = []
+        self.assertEqual(make_info()[0], info)
+        self.assertEqual(hashed, range(7))
+        self.assertEqual(pcalls, [i for i in calls if not isinstance(i, tuple)])
+
+        # Only pieces touching a changed file, or crossing file borders, are hashed again
+        del hashed[:], pcalls[:]
+        with open(os.path.join(self.datapath, "f4"), "r+b") as handle:
+            handle.write("X")
+        os.utime(os.path.join(self.datapath, "f4"), (0, 0))
+        self.assertEqual(make_info()[0], self.make_info(1)[0])
+        self.assertEqual(hashed, [2, 3, 4, 5, 6])
+        self.assertEqual(pcalls, [i for i in calls if not isinstance(i, tuple)])
+
+        del hashed[:]
+        make_info()
+        self.assertEqual(hashed, [2, 3, 6])
+
+    def test_manifest(self):
+        os.makedirs(os.path.join(self.datapath, "sub", "CVS"))
+        for name in ("sub/f6", "sub/f7.bak", "sub/CVS/f8", ".hidden"):
+            with open(os.path.join(self.datapath, name), "wb") as handle:
+                handle.write("x" * 7)
+        os.symlink(os.path.join(self.datapath, "sub"), os.path.join(self.datapath, "link"))
+
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"), self.datapath)
+        manifest = torrent.manifest()
+        self.assertEqual([(os.path.relpath(path, self.datapath), size) for path, size in manifest],
+                         [("f0", 70000), ("f1", 0), ("f2", 1), ("f3", 32768), ("f4", 100000), ("f5", 5),
+                          ("sub/f6", 7)])
+        self.assertEqual(sorted(torrent.walk()), [i[0] for i in manifest])
+
+        scandir, metafile.scandir = metafile.scandir, None
+        try:
+            self.assertEqual(torrent.manifest(), manifest)
+        finally:
+            metafile.scandir = scandir
+
+    def test_pieces(self):
+        data = ''.join(open(os.path.join(self.datapath, "f%d" % i), "rb").read() for i in range(6))
+        for piece_size in (2**15, 2**16):
+            info, _, _ = self.make_info(1, piece_size)
+            self.assertEqual(info["pieces"], ''.join(hashlib.sha1(data[i:i + piece_size]).digest()
+                                                     for i in range(0, len(data), piece_size)))
+
+    def test_gentle_io(self):
+        info, _, _ = self.make_info(1)
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"), self.datapath)
+        torrent.drop_cache = True
+        torrent.rate_limit = 1024 * 1024
+        started = time.time()
+        self.assertEqual(torrent._make_info(2**15, None, torrent.manifest())[0], info)
+        self.assertTrue(time.time() - started > 0.15)
+
+    def test_multi_tracker(self):
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"))
+        hashed = []
+        make_info = torrent._make_info
+        torrent._make_info = lambda *args, **kw: hashed.append(args) or make_info(*args, **kw)
+        torrent.create(self.datapath, ["http://tracker.one.com/announce", "http://tracker.two.org/announce"],
+                       private=True)
+
+        self.assertEqual(len(hashed), 1)
+        one, two = [bencode.bread(os.path.join(self.tmpdir, "test-%s.torrent" % i)) for i in ("one", "two")]
+        self.assertNotEqual(one["info"]["x_cross_seed"], two["info"]["x_cross_seed"])
+        self.assertEqual(one["info"]["pieces"], two["info"]["pieces"])
+        self.assertEqual(one["info"]["private"], 1)
+        self.assertEqual(sorted([one["announce"], two["announce"]]),
+                         ["http://tracker.one.com/announce", "http://tracker.two.org/announce"])
+
+    def test_verify(self):
+        torrent = Metafile(os.path.join(self.tmpdir, "test.torrent"))
+        torrent.create(self.datapath, "http://tracker.example.com/announce", chunk_max=2**15)
+        metainfo = bencode.bread(os.path.join(self.tmpdir, "test.torrent"))
+        piece_count = len(metainfo["info"]["pieces"]) // 20
+
+        # f0 is 70000 bytes long, i.e. pieces 0..2
+        with open(os.path.join(self.datapath, "f4"), "r+b") as handle:
+            handle.seek(50000)
+            byte = handle.read(1)
+            handle.seek(50000)
+            handle.write(chr(ord(byte) ^ 0xFF))
+        for jobs in (1, 3):
+            torrent.jobs = jobs
+            states, missing = torrent.verify(metainfo, self.datapath)
+            self.assertEqual(missing, [])
+            self.assertEqual([i for i, ok in enumerate(states) if not ok], [(70000 + 1 + 32768 + 50000) // 2**15])
+
+            states, missing = torrent.verify(metainfo, self.datapath, selected=set([0]))
+            self.assertEqual(states, [True] * 3 + [None] * (piece_count - 3))
+
+        # Known states are not checked again
+        states, missing = torrent.verify(metainfo, self.datapath, states=[True] * piece_count)
+        self.assertEqual(states, [True] * piece_count)
+
+        os.remove(os.path.join(self.datapath, "f5"))
+        states, missing = torrent.verify(metainfo, self.datapath, fail_fast=True)
+        self.assertEqual(missing, [5])
+        self.assertFalse(states[-1])
+
+        # Missing files are only reported when they share a piece with a selected file
+        os.remove(os.path.join(self.datapath, "f0"))
+        states, missing = torrent.verify(metainfo, self.datapath, selected=set([4]))
+        self.assertEqual(missing, [5])
+        self.assertEqual(states[:3], [None] * 3)
+        states, missing = torrent.verify(metainfo, self.datapath, selected=set([3]))
+        self.assertEqual(missing, [0])
+        self.assertEqual(states[:4], [None, None, False, True])
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -18,9 +18,14 @@
     with this program; if not, write to the Free Software Foundation, Inc.,
     51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
 """
+import os
+import shutil
 import logging
+import tempfile
 import unittest
+from StringIO import StringIO
 
+from pyrocore import error
 from pyrocore.util import osmagic
 
 log = logging.getLogger(__name__)
@@ -33,5 +38,62 @@ class DaemonTest(unittest.TestCase):
         pass
 
 
+class CommandPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-osmagic-")
+        self.path = os.path.join(self.tmpdir, "output")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def jobs(self, condition):
+        """ Return jobs that each wait for C{condition} on the next job,
+            so they complete in reverse order, independent of scheduling delays.
+        """
+        wait = "n=0; until %s || test $n -ge 1000; do sleep 0.01; n=$((n+1)); done; " % condition
+        done = "echo %d; touch %s/%d"
+        return [(i, [(wait.replace("{}", str(i + 1)) if i < 3 else "") + done % (i, self.tmpdir, i)])
+                for i in range(4)]
+
+    def test_ordered(self):
+        output = StringIO()
+        jobs = self.jobs("test -e %s/{}" % self.tmpdir)
+        osmagic.CommandPool(jobs=4, ordered=True, shell=True, output=output).run(jobs)
+        self.assertEqual("0\n1\n2\n3\n", output.getvalue())
+
+    def test_unordered(self):
+        # Wait until the output of the next job was written, i.e. its completion was noticed
+        with open(self.path, "w", 0) as output:
+            osmagic.CommandPool(jobs=4, shell=True, output=output).run(self.jobs("grep -qx {} %s" % self.path))
+        with open(self.path) as handle:
+            self.assertEqual("3\n2\n1\n0\n", handle.read())
+
+    def test_single_slot(self):
+        output = StringIO()
+        jobs = [(i, [["echo", str(i)], ["sh", "-c", "exit %d" % (i % 2)]]) for i in range(4)]
+        pool = osmagic.CommandPool(jobs=1, keep_going=True, output=output, capture=True)
+        self.assertEqual(2, len(pool.run(jobs)))
+        self.assertEqual("0\n1\n2\n3\n", output.getvalue())
+        self.assertRaises(error.UserError, osmagic.CommandPool(jobs=1, output=output, capture=True).run, jobs)
+
+    def test_command_sequence(self):
+        output = StringIO()
+        osmagic.CommandPool(jobs=2, ordered=True, output=output).run(
+            [(i, [["echo", str(i)], ["echo", "done"]]) for i in range(2)])
+        self.assertEqual("0\ndone\n1\ndone\n", output.getvalue())
+
+    def test_failures(self):
+        jobs = [(i, ["exit %d" % (i % 2)]) for i in range(4)]
+        self.assertRaises(error.UserError, osmagic.CommandPool(jobs=2, shell=True).run, jobs)
+        self.assertEqual(2, len(osmagic.CommandPool(jobs=2, shell=True, keep_going=True).run(jobs)))
+
+    def test_timeout(self):
+        pool = osmagic.CommandPool(jobs=2, shell=True, timeout=0.1)
+        self.assertRaises(error.UserError, pool.run, [(i, ["sleep 5"]) for i in range(2)])
+        pool = osmagic.CommandPool(jobs=1, shell=True, timeout=0.1)
+        self.assertRaises(error.UserError, pool.run, [(0, ["sleep 5"])])
+
+
 if __name__ == "__main__":
     unittest.main()
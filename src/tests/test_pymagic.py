@@ -60,6 +60,30 @@ class ImportTest(unittest.TestCase):
             assert False, "Import MUST fail!"
 
 
+    def test_lazy_import(self):
+        module = pymagic.lazy_import("pyrocore.util.algo")
+        assert module.flatten is not None
+
+        module = pymagic.lazy_import("pyrocore.does_not_exit")
+        try:
+            module.whatever
+        except ImportError:
+            pass
+        else:
+            assert False, "Import MUST fail!"
+
+
+class ResourceTest(unittest.TestCase):
+
+    def test_resource_dir(self):
+        assert pymagic.resource_isdir("pyrocore", "data/config")
+        assert "config.ini" in pymagic.resource_listdir("pyrocore", "data/config")
+
+    def test_resource_string(self):
+        text = pymagic.resource_string("pyrocore", "data/config/config.ini")
+        assert "[GLOBAL]" in text, text[:100]
+
+
 class LogTest(unittest.TestCase):
 
     def test_get_class_logger(self):
@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Resident query server tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import sys
+import socket
+import logging
+import tempfile
+import unittest
+
+from pyrocore.daemon import resident
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+class ResidentTest(unittest.TestCase):
+
+    def test_socket_path(self):
+        self.assertEqual("/tmp/x.sock", resident.socket_path(["-q", "--socket", "/tmp/x.sock"]))
+        self.assertEqual("/tmp/y.sock", resident.socket_path(["--socket=/tmp/y.sock"]))
+
+    def test_direct_mode(self):
+        path = os.path.join(tempfile.gettempdir(), "rtcontrol-test-%d.sock" % os.getpid())
+        self.assertEqual(None, resident.forward(["--socket", path, "//"]))  # no server
+        self.assertEqual(None, resident.forward(["--socket", path, "-i", "//"]))
+        self.assertEqual(None, resident.forward(["--socket", path, "@other", "//"]))
+
+    def test_is_direct(self):
+        prompting = ("--delete", "-H")
+        for argv in (["//"], ["--delete", "--yes", "//"], ["-n", "-H", "//"], ["--dry-run", "--delete", "//"]):
+            self.assertFalse(resident.is_direct(argv, prompting), argv)
+        for argv in (["-i", "//"], ["@other", "//"], ["--delete", "//"], ["-H", "//"],
+                     ["--call=echo", "--yes", "//"], ["--spawn", "echo", "//"]):
+            self.assertTrue(resident.is_direct(argv, prompting), argv)
+
+    def test_query(self):
+        path = os.path.join(tempfile.gettempdir(), "rtcontrol-test-%d.sock" % os.getpid())
+        server = resident.QueryServer(path, lambda argv: sys.stdout.write(' '.join(argv)) or 42)
+        server.bind()
+        try:
+            client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            client.connect(path)
+            client.sendall('{"argv": ["foo", "bar"]}\n')
+            conn, _ = server.sock.accept()
+            server.handle(conn)
+            conn.close()
+            self.assertEqual("O7\nfoo barX2\n42", client.makefile("rb").read())
+            client.close()
+        finally:
+            server.sock.close()
+            os.remove(path)
+            os.environ.pop(resident.SOCKET_ENV, None)
+
+    def test_client_tty(self):
+        from pyrocore.scripts.rtcontrol import OutputSink
+        self.assertTrue(OutputSink(resident.FrameWriter(None, 'O', tty=True)).line_buffered)
+        self.assertFalse(OutputSink(resident.FrameWriter(None, 'O')).is_tty)
+
+
+if __name__ == "__main__":
+    unittest.main()
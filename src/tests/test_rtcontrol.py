@@ -0,0 +1,271 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" rtcontrol tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import sys
+import json
+import errno
+import logging
+import unittest
+from StringIO import StringIO
+
+from pyrobase.parts import Bunch
+from pyrocore import config
+from pyrocore.scripts.base import ScriptBase
+from pyrocore.scripts.rtcontrol import RtorrentControl, OutputSink, JsonStreamWriter, FieldStatistics
+from pyrocore.torrent import rtorrent
+from pyrocore.util import pymagic
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+class FakeEngine(rtorrent.RtorrentEngine):
+    """ Engine serving a different state of its items in each round,
+        and then interrupting the caller.
+    """
+
+    def __init__(self, rounds):
+        super(FakeEngine, self).__init__()
+        self.rounds = rounds
+        self.state = None
+        self.calls = []
+        self._rpc = Bunch(d=Bunch(multicall=self.multicall, get_message=self.get_message),
+                          view=Bunch(size=lambda *_: len(self.state)))
+
+    def items(self, view=None, prefetch=None, cache=True):
+        if not self.rounds:
+            raise KeyboardInterrupt()
+        self.state = self.rounds.pop(0)
+        return [rtorrent.RtorrentItem(self, dict(hash=key, name=key)) for key in sorted(self.state)]
+
+    def multicall(self, viewname, *commands, **_):
+        self.calls.append(commands)
+        fields = [i[len("d.get_"):-1] for i in commands]
+        return [[dict(self.state[key], hash=key)[i] for i in fields] for key in sorted(self.state)]
+
+    def get_message(self, infohash):
+        self.calls.append(("d.get_message", infohash))
+        return self.state[infohash]["message"]
+
+
+class FakeStdout(StringIO):
+    """ Record writes and flushes, and optionally fail like a closed pipe.
+    """
+
+    def __init__(self, tty=False, broken=False):
+        StringIO.__init__(self)
+        self.tty = tty
+        self.broken = broken
+        self.calls = []
+
+    def isatty(self):
+        return self.tty
+
+    def write(self, text):
+        self.calls.append(("write", text))
+        if self.broken:
+            raise IOError(errno.EPIPE, "Broken pipe")
+        StringIO.write(self, text)
+
+    def flush(self):
+        self.calls.append(("flush",))
+
+
+def run_query(*args, **kwargs):
+    """ Run rtcontrol with the given arguments, and return its output.
+    """
+    query = RtorrentControl()
+    ScriptBase.get_options(query, list(args))
+    stdout, sys.stdout = sys.stdout, kwargs.get("stdout") or StringIO()
+    try:
+        query.mainloop()
+    finally:
+        output, sys.stdout = sys.stdout.getvalue(), stdout
+    return output
+
+
+class FieldStatisticsTest(unittest.TestCase):
+
+    ITEMS = [Bunch(name="item%d" % i, size=i * 1000) for i in range(1, 5)]
+
+    def test_feed(self):
+        summary = FieldStatistics(["name", "size"])
+        for item in self.ITEMS:
+            summary.feed(item)
+        self.assertEqual((4, 10000, 1000, 4000, 2500), (summary.size, summary.total.size,
+                         summary.min.size, summary.max.size, summary.average.size))
+        self.assertEqual('', summary.total.name)
+
+    def test_old_interface(self):
+        summary = FieldStatistics(len(self.ITEMS))
+        for item in self.ITEMS:
+            summary.add("size", item.size)
+        self.assertEqual((4, 10000, 1000, 4000, 2500), (summary.size, summary.total.size,
+                         summary.min.size, summary.max.size, summary.average.size))
+
+
+class OutputSinkTest(unittest.TestCase):
+
+    def test_pipe(self):
+        stream = FakeStdout()
+        sink = OutputSink(stream)
+        self.assertFalse(sink.line_buffered)
+        sink.write("a\n")
+        sink.write("b\n")
+        self.assertEqual([], stream.calls)
+        sink.flush()
+        self.assertEqual([("write", "a\nb\n"), ("flush",)], stream.calls)
+        sink.flush()
+        self.assertEqual([("write", "a\nb\n"), ("flush",), ("flush",)], stream.calls)
+
+    def test_buffer_size(self):
+        stream = FakeStdout()
+        sink = OutputSink(stream)
+        sink.BUFFER_SIZE = 10
+        for _ in range(5):
+            sink.write("1234\n")
+        self.assertEqual([("write", "1234\n" * 2), ("flush",), ("write", "1234\n" * 2), ("flush",)], stream.calls)
+        self.assertEqual("1234\n" * 4, stream.getvalue())
+
+    def test_tty(self):
+        stream = FakeStdout(tty=True)
+        sink = OutputSink(stream)
+        self.assertTrue(sink.is_tty and sink.line_buffered)
+        sink.write("a\n")
+        self.assertEqual([("write", "a\n"), ("flush",)], stream.calls)
+        self.assertFalse(OutputSink(stream, line_buffered=False).line_buffered)
+
+    def test_no_isatty(self):
+        self.assertFalse(OutputSink(object()).is_tty)
+
+    def test_broken_pipe(self):
+        stream = FakeStdout(broken=True)
+        sink = OutputSink(stream)
+        sink.write("a\n")
+        try:
+            sink.flush()
+        except IOError as exc:
+            self.assertEqual(errno.EPIPE, exc.errno)
+        else:
+            self.fail("EPIPE was swallowed")
+
+        # The lost text is not written again
+        stream.broken = False
+        sink.flush()
+        self.assertEqual([("write", "a\n"), ("flush",)], stream.calls)
+
+    def test_query_broken_pipe(self):
+        saved_engine = config.engine
+        config.engine = FakeEngine([dict(A=dict(message="x"))] * 2)
+        try:
+            # Passed on to ScriptBase.run(), which exits quietly on EPIPE
+            try:
+                run_query("-o", "name", "message=x*", stdout=FakeStdout(broken=True))
+            except IOError as exc:
+                self.assertEqual(errno.EPIPE, exc.errno)
+            else:
+                self.fail("EPIPE was swallowed")
+        finally:
+            config.engine = saved_engine
+
+
+class JsonStreamWriterTest(unittest.TestCase):
+
+    RECORDS = [dict(name="item%d" % i, size=i * 1000, tags=["a", u"\xe4"], nested=dict(x=None)) for i in range(3)]
+
+    def write(self, records, lines=False):
+        stream = StringIO()
+        writer = JsonStreamWriter(OutputSink(stream), lines=lines)
+        for record in records:
+            writer.write(record)
+        writer.close()
+        self.assertEqual(len(records), writer.count)
+        return stream.getvalue()
+
+    def test_array(self):
+        for count in (0, 1, 3):
+            output = self.write(self.RECORDS[:count])
+            self.assertEqual(self.RECORDS[:count], json.loads(output))
+
+            # Same text as dumping the whole list at once
+            self.assertEqual(json.dumps(self.RECORDS[:count], indent=2, separators=(',', ': '),
+                                        sort_keys=True, cls=pymagic.JSONEncoder) + '\n', output)
+
+    def test_lines(self):
+        for count in (0, 1, 3):
+            output = self.write(self.RECORDS[:count], lines=True)
+            self.assertTrue(output.endswith('\n') or not output)
+            self.assertEqual(self.RECORDS[:count], [json.loads(i) for i in output.splitlines()])
+
+
+class FakeEngineTestBase(unittest.TestCase):
+
+    def setUp(self):
+        self.saved_engine = config.engine
+
+    def tearDown(self):
+        config.engine = self.saved_engine
+
+
+class JsonOutputTest(FakeEngineTestBase):
+
+    def test_json(self):
+        state = dict(A=dict(message="x1"), B=dict(message="y"), C=dict(message="x3"))
+        config.engine = FakeEngine([state] * 2)
+        self.assertEqual([dict(name="A", message="x1"), dict(name="C", message="x3")],
+                         json.loads(run_query("--json", "-o", "name,message", "message=x*")))
+
+        config.engine = FakeEngine([state] * 2)
+        self.assertEqual([dict(name="A", message="x1"), dict(name="C", message="x3")],
+                         [json.loads(i) for i in run_query("--json-lines", "-o", "name,message", "-s-",
+                                                           "message=x*").splitlines()])
+
+        config.engine = FakeEngine([state] * 2)
+        self.assertEqual([], json.loads(run_query("--json", "-o", "name", "message=nothing")))
+
+
+class WatchTest(FakeEngineTestBase):
+
+    def test_changes(self):
+        config.engine = FakeEngine([
+            dict(A=dict(message="x1"), B=dict(message="y"), C=dict(message="x3")),
+            dict(A=dict(message="x1b"), B=dict(message="x2")),
+            dict(A=dict(message="z"), B=dict(message="x2")),
+            dict(A=dict(message="z"), B=dict(message="x2")),
+        ])
+        output = run_query("--watch", "0.1", "-o", "name,message", "message=x*")
+
+        self.assertEqual([
+            "+ A\tx1", "+ C\tx3",                   # initial result
+            "+ B\tx2", "- C\tx3", "~ A\tx1b",      # B starts matching, C removed, A changed
+            "- A\tx1b",                             # A stops matching
+        ], output.splitlines())
+
+    def test_bulk_fetch(self):
+        config.engine = FakeEngine([dict(A=dict(message="x1"), B=dict(message="x2"))] * 3)
+        output = run_query("--watch", "0.1", "-o", "name", "message=x*")
+
+        self.assertEqual(["+ A", "+ B"], output.splitlines())
+        self.assertEqual([("d.get_message", "A"), ("d.get_message", "B")] + [("d.get_hash=", "d.get_message=")] * 2,
+                         config.engine.calls)
+
+
+if __name__ == "__main__":
+    unittest.main()
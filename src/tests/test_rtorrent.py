@@ -20,8 +20,10 @@
 """
 import logging
 import unittest
+import itertools
 
-from pyrocore.torrent import rtorrent
+from pyrobase.parts import Bunch
+from pyrocore.torrent import engine, rtorrent
 
 log = logging.getLogger(__name__)
 log.trace("module loaded")
@@ -33,5 +35,97 @@ class RTorrentTest(unittest.TestCase):
         pass
 
 
+class BatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.engine = rtorrent.RtorrentEngine()
+        self.engine._rpc = Bunch(system=Bunch(multicall=self.multicall))
+        self.items = [rtorrent.RtorrentItem(self.engine, dict(hash="%040X" % i)) for i in range(3)]
+
+    def multicall(self, calls):
+        self.requests.append([(i["methodName"], i["params"]) for i in calls])
+        return [dict(faultCode=-501, faultString="failed") if i["params"][0].endswith('1') else [0]
+                for i in calls]
+
+    def test_batched_calls(self):
+        self.engine.start_batch()
+        for item in self.items:
+            item.start()
+            item.set_custom("foo", "bar")
+        self.assertEqual([], self.requests)
+
+        failures = self.engine.flush_batch()
+        self.assertEqual(1, len(self.requests))
+        self.assertEqual(["d.open", "d.start", "d.custom.set"] * 3, [i[0] for i in self.requests[0]])
+        self.assertEqual(["%040X" % 0, "foo", "bar"], self.requests[0][2][1])
+        self.assertEqual([self.items[1]] * 3, [i[0] for i in failures])
+        self.assertTrue(self.engine._batch is None)
+
+    def test_chunking(self):
+        self.engine.BATCH_SIZE = 4
+        self.engine.start_batch()
+        for item in self.items:
+            item.start()
+        self.engine.flush_batch()
+        self.assertEqual([4, 2], [len(i) for i in self.requests])
+
+
+class PagedFetchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.requests = []
+        self.hashes = ["%040X" % i for i in range(500)]
+        self.engine = rtorrent.RtorrentEngine()
+        self.engine._rpc = Bunch(system=Bunch(multicall=self.multicall), download_list=lambda *_: self.hashes,
+                                 d=Bunch(multicall=self.d_multicall))
+
+    def multicall(self, calls):
+        self.requests.append(len(calls))
+        return [dict(faultCode=-501, faultString="gone") if i["params"][0] == self.hashes[1]
+                else [i["params"][0] if i["methodName"] == "d.get_hash" else 0]
+                for i in calls]
+
+    def d_multicall(self, *args):
+        self.requests.append(args[0])
+        if args[0] != "default":
+            return []
+        return [[i if field == "d.get_hash=" else 0 for field in args[1:]] for i in self.hashes]
+
+    def test_early_stop(self):
+        view = engine.TorrentView(self.engine, "default")
+        view.limit = 10
+        items = list(itertools.islice(view.items(), view.limit))
+
+        fields = len(self.engine.PREFETCH_FIELDS)
+        self.assertEqual([50 * fields], self.requests)
+        self.assertEqual(self.hashes[0], items[0].hash)
+        self.assertEqual(self.hashes[2], items[1].hash)  # removed item is skipped
+
+    def test_all_pages(self):
+        view = engine.TorrentView(self.engine, "default")
+        view.limit = 10
+        self.assertEqual(499, len(list(view.items())))
+
+        fields = len(self.engine.PREFETCH_FIELDS)
+        self.assertEqual([50 * fields, "default"], self.requests)
+        self.assertEqual(499, len(self.engine._item_cache["default"]))
+        self.assertEqual(self.hashes[:1] + self.hashes[2:], [i.hash for i in self.engine._item_cache["default"]])
+
+    def test_page_size(self):
+        view = engine.TorrentView(self.engine, "default")
+        view.limit = 1000
+        next(view.items())
+
+        fields = len(self.engine.PREFETCH_FIELDS)
+        self.assertEqual([self.engine.PAGE_SIZE_MAX * fields], self.requests)
+
+    def test_unbounded(self):
+        self.hashes = []
+        view = engine.TorrentView(self.engine, "default")
+        self.assertEqual([], list(view.items()))
+        self.assertEqual(["default"], self.requests)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Snapshot tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import shutil
+import logging
+import tempfile
+import unittest
+
+from pyrobase.parts import Bunch
+from pyrocore import error
+from pyrocore.util import matching, xmlrpc
+from pyrocore.torrent import engine, rtorrent, snapshot
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+class LiveItem(rtorrent.RtorrentItem):
+
+    def announce_urls(self, default=[]):
+        return ["http://tracker.example.com/announce"]
+
+
+class SnapshotTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp(prefix="pyro-snapshot-")
+        self.path = os.path.join(self.tmpdir, "items.db")
+        self.items = [LiveItem(None, dict(hash="%040X" % i, name="item%d" % i, size=i * 1000, ratio=i * 500,
+                                          completed_chunks=i, size_chunks=4,
+                                          files=[Bunch(path="f%d" % i, size=i * 1000, mtime=1.5,
+                                                       prio=1, created=1, opened=0)]))
+                      for i in range(1, 5)]
+        self.items[0]._fields["message"] = u"Türkisch"
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_roundtrip(self):
+        self.assertEqual(snapshot.save(self.path, self.items, viewname="main", extras=snapshot.EXTRAS), 4)
+        snap = snapshot.SnapshotEngine(self.path)
+        items = list(snap.items())
+        self.assertEqual([i.hash for i in items], [i.hash for i in self.items])
+        fields = self.items[1].fetched_fields()
+        del fields["files"]
+        self.assertEqual(items[1].fetched_fields(), fields)
+        self.assertEqual(items[0].message, u"Türkisch")
+        self.assertEqual(items[1].done, 50.0)
+        self.assertEqual([i.path for i in items[2].files], ["f3"])
+        self.assertEqual(items[3].tracker, "http://tracker.example.com/announce")
+        self.assertEqual(snap.view("main").size(), 4)
+
+    def test_fields(self):
+        def get_priority(infohash):
+            raise xmlrpc.XmlRpcError("no priority for %s" % infohash)
+        rpc = Bunch(d=Bunch(get_message=lambda infohash: "msg" + infohash[-1], get_priority=get_priority))
+        for item in self.items:
+            item._engine = Bunch(_rpc=rpc)
+
+        snapshot.save(self.path, self.items, fields=["message", "prio"])
+        items = snapshot.SnapshotEngine(self.path).load()
+        self.assertEqual([u"Türkisch", "msg2", "msg3", "msg4"], [i.message for i in items])
+        self.assertRaises(error.EngineError, items[0].fetch, "prio")
+        self.assertRaises(error.UserError, snapshot.save, self.path, self.items, fields=["no such field"])
+        self.assertTrue("message" in snapshot.default_fields())
+        self.assertFalse("files" in snapshot.default_fields())
+
+    def test_bulk_fields(self):
+        calls = []
+        def multicall(viewname, *commands, **kwargs):
+            calls.append((viewname,) + commands)
+            return [[i.hash, "msg" + i.hash[-1], i.hash[-1]] for i in self.items]
+        proxy = rtorrent.RtorrentEngine()
+        proxy._rpc = Bunch(d=Bunch(multicall=multicall))
+        for item in self.items:
+            item._engine = proxy
+
+        snapshot.save(self.path, self.items, proxy, viewname="main", fields=["message", "prio", "done", "size"])
+        self.assertEqual([("main", "d.get_hash=", "d.get_message=", "d.get_priority=")], calls)
+        items = snapshot.SnapshotEngine(self.path).load()
+        self.assertEqual([u"Türkisch", "msg2", "msg3", "msg4"], [i.message for i in items])
+        self.assertEqual(["1", "2", "3", "4"], [i.fetch("prio") for i in items])
+
+    def test_bulk_fields_failure(self):
+        def multicall(*_, **__):
+            raise xmlrpc.XmlRpcError("unknown command")
+        proxy = rtorrent.RtorrentEngine()
+        proxy._rpc = Bunch(d=Bunch(multicall=multicall, get_message=lambda infohash: "msg" + infohash[-1]))
+        for item in self.items:
+            item._engine = proxy
+
+        snapshot.save(self.path, self.items, proxy, fields=["message"])
+        items = snapshot.SnapshotEngine(self.path).load()
+        self.assertEqual([u"Türkisch", "msg2", "msg3", "msg4"], [i.message for i in items])
+
+    def test_query(self):
+        snapshot.save(self.path, self.items)
+        matcher = matching.ConditionParser(engine.FieldDefinition.lookup, "name").parse(["size=+2k"])
+        view = snapshot.SnapshotEngine(self.path).view(None, matcher)
+        self.assertEqual([i.name for i in view.items()], ["item3", "item4"])
+
+    def test_missing_data(self):
+        snapshot.save(self.path, self.items, viewname="main")
+        snap = snapshot.SnapshotEngine(self.path)
+        item = snap.load()[0]
+        self.assertRaises(error.EngineError, item.fetch, "directory")
+        self.assertRaises(error.EngineError, item.announce_urls)
+        self.assertRaises(error.EngineError, item.start)
+        self.assertRaises(error.EngineError, list, snap.items("stopped"))
+
+    def test_bad_file(self):
+        with open(self.path, "w") as handle:
+            handle.write("not a database" * 100)
+        self.assertRaises(error.UserError, snapshot.SnapshotEngine(self.path).open)
+        self.assertRaises(error.UserError, snapshot.SnapshotEngine(self.path + ".missing").open)
+        self.assertRaises(error.UserError, snapshot.save, self.path, self.items, extras=["peers"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Startup time budget tests.
+
+    Copyright (c) 2017 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import os
+import sys
+import json
+import logging
+import unittest
+import subprocess
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+# Import time budget in msecs per entry point module, only checked when the
+# environment variable below is set, since timings vary too much on shared machines
+BUDGET_ENV = "PYRO_TEST_IMPORT_BUDGET"
+BUDGETS = {
+    "pyrocore.daemon.events": 50,
+    "pyrocore.scripts.chtor": 250,
+    "pyrocore.scripts.hashcheck": 250,
+    "pyrocore.scripts.lstor": 200,
+    "pyrocore.scripts.mktor": 250,
+    "pyrocore.scripts.pyroadmin": 250,
+    "pyrocore.scripts.pyrotorque": 200,
+    "pyrocore.scripts.rtcontrol": 300,
+    "pyrocore.scripts.rtmv": 250,
+    "pyrocore.scripts.rtsweep": 300,
+    "pyrocore.scripts.rtxmlrpc": 250,
+}
+
+# Heavy or optional modules that must only be imported when actually used
+LAZY_MODULES = ("pkg_resources", "tempita", "pyinotify", "waitress", "requests", "psutil", "apscheduler")
+
+# Library modules that use lazily imported dependencies
+LIBRARY_MODULES = ("pyrocore.torrent.jobs", "pyrocore.torrent.formatting", "pyrocore.util.pymagic")
+
+PROBE = """
+import sys, time, json
+started = time.time()
+import %s
+print(json.dumps(dict(msecs=(time.time() - started) * 1000, modules=sorted(sys.modules))))
+"""
+
+
+def probe_import(module_name):
+    """ Import a module in a fresh interpreter, and return the import time and loaded modules.
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([os.path.dirname(os.path.dirname(os.path.abspath(__file__)))]
+        + [i for i in env.get("PYTHONPATH", "").split(os.pathsep) if i])
+    output = subprocess.check_output([sys.executable, "-c", PROBE % module_name], env=env)
+    return json.loads(output.splitlines()[-1])
+
+
+class StartupTest(unittest.TestCase):
+
+    def test_lazy_modules(self):
+        for module_name in sorted(BUDGETS) + list(LIBRARY_MODULES):
+            result = probe_import(module_name)
+            self.assertIn(module_name, result["modules"])
+            loaded = [i for i in LAZY_MODULES if i in result["modules"]]
+            self.assertEqual([], loaded, "%s eagerly imports %s" % (module_name, ', '.join(loaded)))
+
+    @unittest.skipUnless(os.environ.get(BUDGET_ENV), "set %s=1 to check import times" % BUDGET_ENV)
+    def test_import_budget(self):
+        for module_name, budget in sorted(BUDGETS.items()):
+            msecs = min(probe_import(module_name)["msecs"] for _ in range(3))
+            log.info("%s imported in %.1f msecs (budget %d)" % (module_name, msecs, budget))
+            self.assertTrue(msecs <= budget, "%s takes %.1f msecs to import, over the budget of %d msecs"
+                % (module_name, msecs, budget))
+
+    def test_event_shim(self):
+        result = probe_import("pyrocore.daemon.events")
+        self.assertNotIn("pyrocore.config", result["modules"])
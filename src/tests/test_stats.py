@@ -0,0 +1,75 @@
+# -*- coding: utf-8 -*-
+# pylint: disable=
+""" Statistics tests.
+
+    Copyright (c) 2011 The PyroScope Project <pyroscope.project@gmail.com>
+
+    This program is free software; you can redistribute it and/or modify
+    it under the terms of the GNU General Public License as published by
+    the Free Software Foundation; either version 2 of the License, or
+    (at your option) any later version.
+
+    This program is distributed in the hope that it will be useful,
+    but WITHOUT ANY WARRANTY; without even the implied warranty of
+    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+    GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License along
+    with this program; if not, write to the Free Software Foundation, Inc.,
+    51 Franklin Street, Fifth Floor, Boston, MA 02110-1301 USA.
+"""
+import logging
+import unittest
+
+from pyrocore.util import stats
+
+log = logging.getLogger(__name__)
+log.trace("module loaded")
+
+
+class QuantileSketchTest(unittest.TestCase):
+
+    def test_empty(self):
+        self.assertEqual(None, stats.QuantileSketch().quantile(0.5))
+
+    def test_accuracy(self):
+        sketch = stats.QuantileSketch()
+        for i in range(1, 10001):
+            sketch.add(i)
+        for fraction, expected in ((0.5, 5000), (0.9, 9000), (0.99, 9900)):
+            self.assertTrue(abs(sketch.quantile(fraction) - expected) <= expected * sketch.accuracy,
+                            (fraction, sketch.quantile(fraction)))
+
+    def test_merge(self):
+        lower, upper = stats.QuantileSketch(), stats.QuantileSketch()
+        for i in range(-50, 50):
+            (lower if i < 0 else upper).add(i)
+        lower.merge(upper)
+        self.assertEqual(100, len(lower))
+        self.assertEqual(-1, lower.quantile(0.5))
+        self.assertRaises(ValueError, lower.merge, stats.QuantileSketch(0.05))
+        self.assertEqual((-50, 49), (lower.min, lower.max))
+
+    def test_bounds(self):
+        sketch = stats.QuantileSketch()
+        for i in (1, 10, 100):
+            sketch.add(i)
+        self.assertEqual([1, 10, 100, 100], [sketch.quantile(i) for i in (0, 0.5, 0.9, 0.99)])
+
+        sketch = stats.QuantileSketch()
+        sketch.add(0.123)
+        self.assertEqual(0.123, sketch.quantile(0.99))
+
+
+class HistogramTest(unittest.TestCase):
+
+    def test_buckets(self):
+        histogram = stats.Histogram()
+        for i in (-1, 0, 0, 1, 3, 4, 7, 0.25):
+            histogram.add(i)
+        self.assertEqual([(None, 0, 1), (0, 0, 2), (0.25, 0.5, 1), (1, 2, 1), (2, 4, 1), (4, 8, 2)],
+                         histogram.buckets())
+
+
+if __name__ == "__main__":
+    unittest.main()